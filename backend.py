@@ -1,13 +1,18 @@
 # backend.py
-from flask import Flask, request, jsonify
+from flask import Flask, Response, jsonify, request
 import os
 from flask_cors import CORS
-from integrate import process_data  # ✅ Import your processing function
+from integrate import BATCH_MAX_QUESTIONS, run_batch, run_pipeline, pipeline_stages  # ✅ Import your processing function
+from response_encoding import build_payload, encode_response, json_format, negotiate_format, stream_response
+from sessions import session_store
+from jobs import JobQueueFull, get_job_queue
+from telemetry import REQUEST_ID_HEADER, annotate, get_logger, metrics_payload, request_trace, trace_options
 
 app = Flask(__name__)
 
 # Get CORS origins from environment variable, with a fallback for development
 CORS(app, resources={r"/*": {"origins": "*"}})
+logger = get_logger("backend")
 
 @app.route('/backend', methods=['POST'])
 def backend():
@@ -20,21 +25,210 @@ def backend():
     # print("File URL:", file_url)
 
     # ✅ Send the data to integrate.py
+    return _answer(chat_context, file_url)
+
+def _answer(chat_context, file_url, session=None):
+    """Run the pipeline for /backend or a session query and encode the response."""
+    with request_trace(request.url_rule.rule, **trace_options(request)) as trace:
+        try:
+            # Process data safely and get the standardized response;
+            # rows are serialized once, in the format the client negotiated
+            response_data, result_df = run_pipeline(chat_context, file_url, negotiate_format(request), session=session)
+            logger.debug("Response from integrate.py: status=%s summary=%s",
+                         response_data.get("status"), response_data.get("summary"))
+            response = encode_response(request, response_data, result_df)
+        except Exception as e:
+            logger.exception("Error in backend: %s", e)
+            # Return a standardized error response
+            response = encode_response(request, {
+                "status": "error",
+                "summary": "An unexpected error occurred in the backend.",
+                "data": None,
+                "table": None,
+                "error": str(e)
+            }, status=500)
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        return response
+
+@app.route('/backend/stream', methods=['POST'])
+def backend_stream():
+    """Same input as /backend; emits each pipeline stage as it completes (NDJSON or SSE)."""
+    data = request.get_json()
+    fmt = json_format(negotiate_format(request))
+    return stream_response(request, pipeline_stages(data.get('chat_context'), data.get('file_url'), fmt))
+
+@app.route('/backend/batch', methods=['POST'])
+def backend_batch():
+    """
+    Several questions about one file_url (e.g. dashboard tiles), loaded, profiled and planned once.
+    Returns {"status", "results"}: one /backend response per question, in order.
+    """
+    data = request.get_json()
+    questions = data.get('questions')
+    with request_trace(request.url_rule.rule, **trace_options(request)) as trace:
+        if not isinstance(questions, list) or not questions or len(questions) > BATCH_MAX_QUESTIONS \
+                or not all(isinstance(question, str) for question in questions):
+            response = encode_response(request, {
+                "status": "error",
+                "summary": "Invalid batch.",
+                "error": f"'questions' must be a list of 1 to {BATCH_MAX_QUESTIONS} strings."
+            }, status=400)
+        else:
+            annotate(batch_size=len(questions))
+            fmt = json_format(negotiate_format(request))
+            try:
+                results = run_batch(questions, data.get('file_url'), fmt)
+                response = encode_response(request, {
+                    "status": "success",
+                    "results": [
+                        {"question": question, **build_payload(answer, result_df, fmt)}
+                        for question, (answer, result_df) in zip(questions, results)
+                    ]
+                })
+            except Exception as e:
+                logger.exception("Error in batch: %s", e)
+                response = encode_response(request, {
+                    "status": "error",
+                    "summary": "An unexpected error occurred in the backend.",
+                    "results": None,
+                    "error": str(e)
+                }, status=500)
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        return response
+
+def _session_not_found(session_id):
+    return jsonify({
+        "status": "error",
+        "summary": "Session not found or expired.",
+        "data": None,
+        "table": None,
+        "error": f"No active session '{session_id}'. Create a new one with POST /sessions."
+    }), 404
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """Register a dataset once; follow-up questions go to /sessions/<session_id>/query."""
+    data = request.get_json()
+    with request_trace(request.url_rule.rule, **trace_options(request)):
+        try:
+            session = session_store.create(data.get('file_url'))
+        except ValueError as e:
+            annotate(http_status=400)
+            return jsonify({"status": "error", "summary": "Unsupported file format.", "error": str(e)}), 400
+        except Exception as e:
+            logger.warning("Failed to create session for %s: %s", data.get('file_url'), e)
+            annotate(http_status=422)
+            return jsonify({
+                "status": "error",
+                "summary": "Failed to load file from URL.",
+                "error": f"Failed to load file from URL: {e}"
+            }), 422
+        annotate(http_status=201, session_id=session.session_id, dataset_id=session.dataset_id)
+        return jsonify({"status": "success", **session.describe()}), 201
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        return _session_not_found(session_id)
+    return jsonify({"status": "success", **session.describe(), "history": session.recent_turns()})
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+def close_session(session_id):
+    if not session_store.close(session_id):
+        return _session_not_found(session_id)
+    return "", 204
+
+@app.route('/sessions/<session_id>/query', methods=['POST'])
+def session_query(session_id):
+    """Same response as /backend, answered from the session's warm dataset with its earlier turns as context."""
+    session = session_store.get(session_id)
+    if session is None:
+        return _session_not_found(session_id)
+    return _answer(request.get_json().get('chat_context'), session.file_url, session=session)
+
+@app.route('/sessions/<session_id>/query/stream', methods=['POST'])
+def session_query_stream(session_id):
+    session = session_store.get(session_id)
+    if session is None:
+        return _session_not_found(session_id)
+    fmt = json_format(negotiate_format(request))
+    return stream_response(
+        request, pipeline_stages(request.get_json().get('chat_context'), session.file_url, fmt, session=session)
+    )
+
+def _job_not_found(job_id):
+    return jsonify({
+        "status": "error",
+        "summary": "Job not found or expired.",
+        "error": f"No job '{job_id}'. Finished jobs are kept for a limited time."
+    }), 404
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Same input as /backend; returns a job id at once and answers the question in the background."""
+    data = request.get_json()
+    options = trace_options(request)
     try:
-        # Process data safely and get the standardized response
-        response_data = process_data(chat_context, file_url)
-        print("Response from integrate.py:", response_data)
-        return jsonify(response_data)
-    except Exception as e:
-        print("Error in backend:", e)
-        # Return a standardized error response
-        return jsonify({
-            "status": "error",
-            "summary": "An unexpected error occurred in the backend.",
-            "data": None,
-            "table": None,
-            "error": str(e)
-        }), 500
+        job = get_job_queue().submit(
+            data.get('chat_context'), data.get('file_url'), json_format(negotiate_format(request)),
+            log_level=options["log_level"]
+        )
+    except JobQueueFull as e:
+        response = jsonify({"status": "error", "summary": "Too many jobs in progress.", "error": str(e)})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+    response = jsonify({
+        "status": "success",
+        "job_id": job.job_id,
+        "state": job.state,
+        "status_url": f"/jobs/{job.job_id}",
+        "events_url": f"/jobs/{job.job_id}/events",
+    })
+    response.headers["Location"] = f"/jobs/{job.job_id}"
+    return response, 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Poll a job: its state, events after ?since=<n>, and the /backend response once done."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+    return jsonify({"status": "success", **job.describe(request.args.get('since', 0, type=int))})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Subscribe to a job: its events (from ?since=<n>) as NDJSON or SSE until it finishes."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return _job_not_found(job_id)
+
+    def events(since):
+        while True:
+            new_events, finished = job.events_since(since, timeout=15)
+            for event in new_events:
+                yield event["event"], event["data"]
+            since += len(new_events)
+            if finished:
+                return
+
+    return stream_response(request, events(request.args.get('since', 0, type=int)))
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a job that is still queued; running and finished jobs are left as they are."""
+    job_queue = get_job_queue()
+    if job_queue.get(job_id) is None:
+        return _job_not_found(job_id)
+    if not job_queue.cancel(job_id):
+        return jsonify({"status": "error", "summary": "Job already started.", "error": "Only queued jobs can be cancelled."}), 409
+    return "", 204
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: stage/request histograms, cache hit rates, model call counters."""
+    body, content_type = metrics_payload()
+    return Response(body, content_type=content_type)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,284 @@
+# benchmarks/bench_pipeline.py
+"""
+Offline benchmark of the query pipeline, with Gemini replaced by benchmarks.fake_gemini.
+
+Generates synthetic CSV/Excel datasets at several sizes, times each pipeline stage
+(load, profile, LLM stages, SQL, transform, serialize) and measures /backend throughput
+under concurrent load. Results are written as JSON so runs can be compared.
+Pipeline logging follows LOG_LEVEL, which defaults to WARNING here.
+
+Run from the repository root:
+    python benchmarks/bench_pipeline.py [--sizes 1000 10000 100000] [--llm-latency 0.3]
+                                        [--concurrency 8] [--output bench_output.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Keep benchmark artifacts out of the shared caches; must be set before the app modules are imported
+WORK_DIR = tempfile.mkdtemp(prefix="hynox_bench_")
+os.environ.setdefault("INGEST_CACHE_DIR", os.path.join(WORK_DIR, "ingest"))
+os.environ["LLM_CACHE_ENABLED"] = "False"
+os.environ.setdefault("RESULT_CACHE_ENABLED", "False")  # Repeated questions would otherwise skip the engine
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.fake_gemini import install_fake_gemini  # noqa: E402
+from backend import app  # noqa: E402
+from dataset_cache import dataset_fingerprint, load_dataset  # noqa: E402
+from ingest import _parse_file, infer_types, ingest_file  # noqa: E402
+from integrate import _chart_mapping, _transform_data_for_charts  # noqa: E402
+from process_sql import execute_sql_query  # noqa: E402
+from profiler import summarize_frame  # noqa: E402
+from query_processing import (  # noqa: E402
+    FusedPlannerAgent, GeminiLLM, RefineQueryAgent, SQLCheckAgent, SQLGeneratorAgent, UserQueryCheckAgent,
+)
+from response_encoding import (  # noqa: E402
+    FORMAT_ARROW, FORMAT_COLUMNAR, FORMAT_RECORDS, _arrow_bytes, dumps_json, build_chart_data, build_table,
+)
+from sql_engines import release_dataset  # noqa: E402
+from visualization import get_visualization_json  # noqa: E402
+
+REGIONS = ["North", "South", "East", "West", "Central"]
+PRODUCTS = ["Laptop", "Phone", "Tablet", "Monitor", "Keyboard", "Mouse", "Headset", "Camera"]
+CHANNELS = ["Online", "Retail", "Partner"]
+
+# One template-shaped question (answered without the model) and two that go through the agents
+QUESTIONS = [
+    "total revenue by region",
+    "Which products bring in the most revenue?",
+    "How do sales compare across channels?",
+]
+SQL_QUERY = 'SELECT "Region", SUM("Revenue") AS total FROM df GROUP BY "Region" ORDER BY total DESC;'
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence library warnings (e.g. pandas rounding datetime results) while timing."""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        yield
+
+
+def make_dataset(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2023-01-01")
+    return pd.DataFrame({
+        "Order ID": np.arange(1, rows + 1),
+        "Order Date": (start + rng.integers(0, 730, rows).astype("timedelta64[D]")).astype(str),
+        "Region": rng.choice(REGIONS, rows),
+        "Product": rng.choice(PRODUCTS, rows),
+        "Channel": rng.choice(CHANNELS, rows),
+        "Customer": [f"Customer {i}" for i in rng.integers(0, max(rows // 10, 20), rows)],
+        "Units": rng.integers(1, 50, rows),
+        "Unit Price": rng.uniform(5, 2000, rows).round(2),
+        "Revenue": rng.uniform(10, 50_000, rows).round(2),
+    })
+
+
+def write_dataset(df: pd.DataFrame, fmt: str) -> str:
+    path = os.path.join(WORK_DIR, f"sales_{len(df)}.{fmt}")
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+    else:
+        df.to_excel(path, index=False)
+    return path
+
+
+def summarize(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+    }
+
+
+def time_stage(fn, repeats: int, setup=None) -> dict:
+    samples = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def _drop_ingested(fingerprint: str):
+    for extension in (".arrow", ".json"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(os.environ["INGEST_CACHE_DIR"], f"{fingerprint}{extension}"))
+
+
+def bench_stages(path: str, repeats: int) -> dict:
+    stages = {}
+
+    # --- Load ---
+    stages["load.parse"] = time_stage(lambda: infer_types(_parse_file(path)), repeats)
+    fingerprint = dataset_fingerprint(path)
+    stages["load.ingest_cold"] = time_stage(
+        lambda: ingest_file(path, fingerprint), repeats, setup=lambda: _drop_ingested(fingerprint)
+    )
+    stages["load.ingest_mmap"] = time_stage(lambda: ingest_file(path, fingerprint), repeats)
+    load_dataset(path, ingest_file)
+    stages["load.cache_hit"] = time_stage(lambda: load_dataset(path, ingest_file), repeats)
+    dataset_id, df = load_dataset(path, ingest_file)
+    columns = df.columns.tolist()
+
+    # --- Profile ---
+    stages["profile"] = time_stage(lambda: summarize_frame(df), repeats)
+    profile = summarize_frame(df)
+
+    # --- LLM stages (fake backend: measures prompt building, scheduling and parsing plus the set latency) ---
+    llm = GeminiLLM(api_key="benchmark")
+    question = QUESTIONS[1]
+    checker = UserQueryCheckAgent(df=df, dataset_columns=columns, llm=llm, dataset_profile=profile)
+    stages["llm.relevance"] = time_stage(lambda: checker._ask_llm(question), repeats)
+    stages["llm.refine"] = time_stage(lambda: RefineQueryAgent(llm).refine_query(question, dataset_columns=columns), repeats)
+    stages["llm.sql_check"] = time_stage(lambda: SQLCheckAgent(llm, columns).check_query_status(question), repeats)
+    generator = SQLGeneratorAgent(llm, columns, df, "df", dataset_summary=profile)
+    stages["llm.sql_generation"] = time_stage(lambda: generator.generate_sql(question), repeats)
+    planner = FusedPlannerAgent(llm, columns, "df", profile)
+    stages["llm.fused_plan"] = time_stage(lambda: planner.plan(question), repeats)
+
+    # --- SQL ---
+    release_dataset(dataset_id)
+    stages["sql.cold"] = time_stage(
+        lambda: execute_sql_query(df, SQL_QUERY, dataset_id=dataset_id), repeats,
+        setup=lambda: release_dataset(dataset_id),
+    )
+    stages["sql.warm"] = time_stage(lambda: execute_sql_query(df, SQL_QUERY, dataset_id=dataset_id), repeats)
+    detail_sql = 'SELECT "Order Date", "Customer", "Revenue" FROM df ORDER BY "Revenue" DESC;'
+    stages["sql.warm_detail_rows"] = time_stage(lambda: execute_sql_query(df, detail_sql, dataset_id=dataset_id), repeats)
+    result_df = execute_sql_query(df, SQL_QUERY, dataset_id=dataset_id)
+    detail_df = execute_sql_query(df, detail_sql, dataset_id=dataset_id)
+
+    # --- Visualization (model path, rules bypassed by omitting result_df) ---
+    sample_chart_data = _transform_data_for_charts(result_df.head(3))
+    stages["llm.visualization"] = time_stage(
+        lambda: get_visualization_json("benchmark", question, sample_chart_data), repeats
+    )
+
+    # --- Transform and serialize, on the full-detail result so row volume shows up ---
+    mapping = _chart_mapping(detail_df)
+    stages["transform.chart_records"] = time_stage(lambda: _transform_data_for_charts(detail_df), repeats)
+    stages["transform.chart_columns"] = time_stage(lambda: _transform_data_for_charts(detail_df, orient="columns"), repeats)
+    for fmt in (FORMAT_RECORDS, FORMAT_COLUMNAR):
+        def serialize(fmt=fmt):
+            return dumps_json({"data": build_chart_data(detail_df, mapping, fmt), "table": build_table(detail_df, fmt)})
+        stages[f"serialize.{fmt}"] = time_stage(serialize, repeats)
+    stages[f"serialize.{FORMAT_ARROW}"] = time_stage(
+        lambda: _arrow_bytes({"status": "success", "data": {"type": "bar", "mapping": mapping}}, detail_df), repeats
+    )
+    return {"dataset_id": dataset_id, "result_rows": len(detail_df), "stages": stages}
+
+
+def bench_throughput(path: str, concurrency: int, requests: int, fmt: str = FORMAT_RECORDS) -> dict:
+    client = app.test_client()
+    client.post("/backend", json={"chat_context": QUESTIONS[0], "file_url": path})  # Warm the dataset caches
+
+    def one(i):
+        start = time.perf_counter()
+        response = client.post(
+            f"/backend?format={fmt}",
+            json={"chat_context": QUESTIONS[i % len(QUESTIONS)], "file_url": path},
+        )
+        return time.perf_counter() - start, response.status_code, len(response.get_data())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency, _, _ in results]
+    return {
+        "format": fmt,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for _, status, _ in results if status != 200),
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_second": round(requests / elapsed, 2),
+        "mean_response_bytes": round(statistics.fmean(size for _, _, size in results)),
+        "latency": summarize(latencies),
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--formats", nargs="+", default=["csv", "xlsx"], choices=["csv", "xlsx"])
+    parser.add_argument("--excel-max-rows", type=int, default=10_000,
+                        help="Skip Excel datasets above this size; writing them dominates the run")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Seconds slept per fake model call")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--keys", type=int, default=1, help="Fake API keys in the client pool")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8])
+    parser.add_argument("--requests", type=int, default=48, help="Requests per throughput run")
+    parser.add_argument("--output", default=os.path.join(ROOT, "bench_output.json"))
+    args = parser.parse_args()
+
+    pool = install_fake_gemini(latency_seconds=args.llm_latency, jitter_seconds=args.llm_jitter, keys=args.keys)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "config": vars(args),
+        },
+        "datasets": [],
+    }
+
+    for rows in args.sizes:
+        df = make_dataset(rows)
+        for fmt in args.formats:
+            if fmt == "xlsx" and rows > args.excel_max_rows:
+                continue
+            path = write_dataset(df, fmt)
+            print(f"▶ {fmt} {rows:,} rows ({os.path.getsize(path) / 1e6:.1f} MB)", file=sys.stderr)
+            with quiet():
+                entry = {"format": fmt, "rows": rows, "bytes": os.path.getsize(path), **bench_stages(path, args.repeats)}
+                entry["throughput"] = [
+                    bench_throughput(path, concurrency, args.requests) for concurrency in args.concurrency
+                ]
+            report["datasets"].append(entry)
+            for run in entry["throughput"]:
+                print(f"  concurrency {run['concurrency']:>3}: {run['requests_per_second']:>8.2f} req/s, "
+                      f"p95 {run['latency']['p95_ms']:.1f} ms, errors {run['errors']}", file=sys.stderr)
+
+    report["meta"]["fake_llm_calls"] = sum(slot["calls"] for slot in pool.utilization())
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# benchmarks/bench_transform.py
+"""
+Micro-benchmark of integrate._transform_data_for_charts against the previous
+row-by-row implementation.
+
+Run from the repository root:
+    python benchmarks/bench_transform.py [rows ...]
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from integrate import _transform_data_for_charts  # noqa: E402
+
+REPEATS = 5
+
+
+def legacy_transform_data_for_charts(data):
+    """The implementation this benchmark measures against: rebuild, coerce, iterrows."""
+    if not data:
+        return []
+
+    df = pd.DataFrame(data)
+    transformed_data = []
+    name_column = None
+    value_columns = []
+
+    for col in df.columns:
+        is_numeric = pd.to_numeric(df[col], errors='coerce').notna().all()
+        if not is_numeric and name_column is None:
+            name_column = col
+        elif is_numeric:
+            value_columns.append(col)
+
+    for _, row in df.iterrows():
+        new_item = {}
+        if name_column:
+            new_item['name'] = row[name_column]
+        for i, val_col in enumerate(value_columns):
+            new_item[f'value{i+1}'] = row[val_col]
+        transformed_data.append(new_item)
+
+    return transformed_data
+
+
+def make_result_frame(rows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "category": rng.choice([f"cat_{i}" for i in range(50)], rows),
+        "total_sales": rng.random(rows) * 1000,
+        "units": rng.integers(1, 100, rows),
+    })
+
+
+def best_of(fn) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=REPEATS))
+
+
+def main(sizes):
+    print(f"{'rows':>8} {'legacy (s)':>12} {'records (s)':>12} {'columns (s)':>12} {'speedup':>8}")
+    for rows in sizes:
+        result_df = make_result_frame(rows)
+        # The legacy path also paid for the to_dict the caller did before calling it
+        legacy = best_of(lambda: legacy_transform_data_for_charts(result_df.to_dict(orient="records")))
+        records = best_of(lambda: _transform_data_for_charts(result_df))
+        columns = best_of(lambda: _transform_data_for_charts(result_df, orient="columns"))
+        print(f"{rows:>8} {legacy:>12.4f} {records:>12.4f} {columns:>12.4f} {legacy / records:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [1_000, 10_000, 50_000])
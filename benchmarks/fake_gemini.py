@@ -0,0 +1,134 @@
+# benchmarks/fake_gemini.py
+"""
+Offline stand-in for genai.Client, for benchmarks that must not spend quota.
+
+FakeGeminiClient answers client.models.generate_content(model=..., contents=..., config=...)
+by recognising which agent wrote the prompt and returning a rule-generated reply
+(or a canned one), after sleeping for a configurable latency.
+
+    from benchmarks.fake_gemini import install_fake_gemini
+    install_fake_gemini(latency_seconds=0.3)
+"""
+import json
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+
+from gemini_pool import GeminiClientPool, set_client_pool
+
+_SUMMARY_LINE = re.compile(r"^\s*- (?P<col>.+?): \{'type': '(?P<type>\w+)'", re.MULTILINE)
+_QUOTED_QUERY = re.compile(r'(?:Base query|User query|question):?\s*\n?\s*"(?P<query>[^"]*)"')
+_BATCH_QUESTION = re.compile(r'^\s*(?P<index>\d+)\. "(?P<query>[^"]*)"$', re.MULTILINE)
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _summary_columns(prompt: str) -> dict:
+    columns = {}
+    for match in _SUMMARY_LINE.finditer(prompt):
+        columns.setdefault(match["type"], []).append(match["col"])
+    return columns
+
+
+def _rule_sql(prompt: str) -> str:
+    """Group the first categorical column by the first numeric one, like a typical agent answer."""
+    columns = _summary_columns(prompt)
+    dims = columns.get("categorical", []) + columns.get("text", [])
+    measures = columns.get("numeric", [])
+    if dims and measures:
+        return (f"SELECT {_quote(dims[0])}, SUM({_quote(measures[0])}) AS total FROM df "
+                f"GROUP BY {_quote(dims[0])} ORDER BY total DESC;")
+    if measures:
+        return f"SELECT SUM({_quote(measures[0])}) AS total FROM df;"
+    return "SELECT COUNT(*) AS row_count FROM df;"
+
+
+class _FakeModels:
+    def __init__(self, client):
+        self._client = client
+
+    def generate_content(self, model: str, contents: str, config=None):
+        client = self._client
+        client._sleep()
+        with client._lock:
+            client.calls += 1
+        return SimpleNamespace(text=client.respond(contents, structured=config is not None))
+
+
+class FakeGeminiClient:
+    """
+    Drop-in for genai.Client. latency_seconds (+/- jitter_seconds) is slept per call;
+    canned maps a prompt substring to a fixed reply and takes precedence over the rules.
+    """
+
+    def __init__(self, api_key: str = None, latency_seconds: float = 0.0, jitter_seconds: float = 0.0,
+                 canned: dict = None):
+        self.api_key = api_key
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.canned = canned or {}
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.models = _FakeModels(self)
+
+    def _sleep(self):
+        delay = self.latency_seconds
+        if self.jitter_seconds:
+            delay += random.uniform(-self.jitter_seconds, self.jitter_seconds)
+        if delay > 0:
+            time.sleep(delay)
+
+    @staticmethod
+    def _plan(query: str, prompt: str) -> dict:
+        return {"relevant": True, "refined_query": query, "feasible": True, "sql": _rule_sql(prompt), "chart_type": "bar"}
+
+    def respond(self, prompt: str, structured: bool = False) -> str:
+        for marker, reply in self.canned.items():
+            if marker in prompt:
+                return reply
+
+        if structured and "several independent questions" in prompt:
+            # BatchPlannerAgent
+            return json.dumps({"plans": [
+                {"index": int(match["index"]), **self._plan(match["query"], prompt)}
+                for match in _BATCH_QUESTION.finditer(prompt)
+            ]})
+        if structured:
+            # FusedPlannerAgent
+            query = _QUOTED_QUERY.search(prompt)
+            return json.dumps(self._plan(query["query"] if query else "summary of the data", prompt))
+        if "Determine if the user query is relevant" in prompt:
+            return "True"
+        if "query refinement AI" in prompt:
+            query = _QUOTED_QUERY.search(prompt)
+            return query["query"] if query else "summary of the data"
+        if "Determine whether the refined query can be executed" in prompt:
+            return json.dumps({"status": True})
+        if "expert SQL generator" in prompt or "expert SQL fixer" in prompt:
+            return _rule_sql(prompt)
+        if "data visualization assistant" in prompt:
+            return json.dumps({"visualization": "bar"})
+        return "Sorry, I can only answer questions about your data."
+
+
+def install_fake_gemini(latency_seconds: float = 0.0, jitter_seconds: float = 0.0, canned: dict = None,
+                        keys: int = 1, requests_per_minute: float = 1e9) -> GeminiClientPool:
+    """
+    Route every GeminiLLM and visualization call through FakeGeminiClient instances.
+    The pool's rate limits are effectively disabled unless requests_per_minute is given.
+    """
+    def client_factory(api_key):
+        return FakeGeminiClient(api_key, latency_seconds, jitter_seconds, canned)
+
+    pool = GeminiClientPool(
+        [f"fake-key-{i:04d}" for i in range(keys)],
+        requests_per_minute=requests_per_minute,
+        burst=max(1.0, requests_per_minute / 60.0),
+        client_factory=client_factory,
+    )
+    set_client_pool(pool)
+    return pool
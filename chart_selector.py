@@ -0,0 +1,75 @@
+# chart_selector.py
+import os
+import re
+import threading
+
+import pandas as pd
+
+CHART_CONFIDENCE_THRESHOLD = float(os.getenv("CHART_CONFIDENCE_THRESHOLD", 0.8))
+PIE_MAX_CATEGORIES = 8
+BAR_MAX_CATEGORIES = 30
+DATE_LIKE = re.compile(r"^\d{4}-\d{2}(-\d{2})?([ T].*)?$|^\d{4}-Q[1-4]$|^\d{4}-W\d{2}$")
+PART_OF_WHOLE_WORDS = ("share", "percent", "percentage", "proportion", "breakdown", "distribution", "split", "composition")
+
+_decisions = {"rule": 0, "llm": 0}
+_decisions_lock = threading.Lock()
+
+
+def _is_time_column(series: pd.Series) -> bool:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if pd.api.types.is_numeric_dtype(series):
+        return False
+    # SQL often returns periods as text, e.g. strftime('%Y-%m', date) -> "2024-01"
+    head = series.dropna().head(5).astype(str)
+    return not head.empty and head.str.match(DATE_LIKE).all()
+
+
+def select_chart(result_df: pd.DataFrame, query: str = None):
+    """
+    Choose a chart type from the shape of a result frame.
+    Returns (chart_type, confidence); callers should only trust confidences at or above
+    CHART_CONFIDENCE_THRESHOLD and ask the model otherwise.
+    """
+    rows, cols = result_df.shape
+    if rows == 0 or cols == 0:
+        return "table", 1.0
+
+    numeric = [c for c in result_df.columns if pd.api.types.is_numeric_dtype(result_df[c]) and not pd.api.types.is_bool_dtype(result_df[c])]
+    time_cols = [c for c in result_df.columns if c not in numeric and _is_time_column(result_df[c])]
+    labels = [c for c in result_df.columns if c not in numeric and c not in time_cols]
+    query_lower = (query or "").lower()
+
+    if not numeric:
+        return "table", 0.9
+    if rows == 1 and len(numeric) == 1 and cols <= 2:
+        return "kpi", 0.95
+    if rows == 1:
+        return "table", 0.6
+    if cols > 4:
+        return "table", 0.7
+    if time_cols and not labels:
+        return "line", 0.9
+    if len(labels) == 1 and not time_cols:
+        categories = result_df[labels[0]].nunique()
+        part_of_whole = any(word in query_lower for word in PART_OF_WHOLE_WORDS)
+        if len(numeric) == 1 and part_of_whole and categories <= PIE_MAX_CATEGORIES and (result_df[numeric[0]] >= 0).all():
+            return "pie", 0.85
+        if categories <= BAR_MAX_CATEGORIES:
+            return "bar", 0.85 if len(numeric) <= 2 else 0.75
+        return "bar", 0.6
+    if not labels and not time_cols and len(numeric) == 2:
+        return "scatter", 0.85
+    return "table", 0.5
+
+
+def record_decision(source: str):
+    with _decisions_lock:
+        _decisions[source] += 1
+
+
+def decision_stats() -> dict:
+    """How many chart choices were made locally ("rule") versus by the model ("llm")."""
+    with _decisions_lock:
+        total = _decisions["rule"] + _decisions["llm"]
+        return {**_decisions, "rule_rate": _decisions["rule"] / total if total else 0.0}
@@ -0,0 +1,119 @@
+# dataset_cache.py
+import hashlib
+import os
+import urllib.request
+
+import pandas as pd
+
+from lru import LRUCache
+from telemetry import get_logger
+
+DATASET_CACHE_MAX_BYTES = int(os.getenv("DATASET_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+LOCAL_HASH_CACHE_SIZE = int(os.getenv("LOCAL_HASH_CACHE_SIZE", 1024))
+VALIDATOR_TIMEOUT_SECONDS = float(os.getenv("DATASET_VALIDATOR_TIMEOUT", 5))
+
+logger = get_logger("dataset_cache")
+
+# Content hashes of local files, memoised on (path, size, mtime) so an unchanged
+# file is not re-read on every request just to prove it is unchanged.
+_local_hashes = LRUCache(max_entries=LOCAL_HASH_CACHE_SIZE)
+
+
+def _is_remote(file_url: str) -> bool:
+    return file_url.lower().startswith(("http://", "https://"))
+
+
+def _remote_validator(file_url: str):
+    """Return the ETag or Last-Modified header of a remote file, or None."""
+    try:
+        req = urllib.request.Request(file_url, method="HEAD")
+        with urllib.request.urlopen(req, timeout=VALIDATOR_TIMEOUT_SECONDS) as resp:
+            return resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+    except Exception as e:
+        logger.warning("⚠️ Could not fetch validator for %s: %s", file_url, e)
+        return None
+
+
+def _local_validator(path: str, hash_content: bool = True):
+    """
+    Return a sha256 content hash of a local file, or None if it is unreadable.
+    With hash_content=False the size and mtime stand in for the hash (for files too big to read).
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not hash_content:
+        return f"{stat.st_size}:{stat.st_mtime_ns}"
+    def content_hash():
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    try:
+        return _local_hashes.get_or_create(memo_key, content_hash)
+    except OSError:
+        return None
+
+
+def dataset_fingerprint(file_url: str, hash_content: bool = True):
+    """
+    Build a cache key for a file: the URL plus a validator proving its content.
+    Returns None when no validator is available, in which case the file must not be cached.
+    """
+    if _is_remote(file_url):
+        validator = _remote_validator(file_url)
+    else:
+        validator = _local_validator(file_url, hash_content)
+    if not validator:
+        return None
+    return hashlib.sha256(f"{file_url}\n{validator}".encode("utf-8")).hexdigest()
+
+
+def frame_nbytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetCache:
+    """
+    In-memory LRU cache of parsed DataFrames keyed by dataset fingerprint.
+    Entries are evicted least-recently-used first once the byte budget is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = DATASET_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = LRUCache(max_bytes=max_bytes)  # fingerprint -> df
+
+    def get(self, fingerprint: str):
+        return self._entries.get(fingerprint)
+
+    def get_or_load(self, fingerprint: str, load) -> pd.DataFrame:
+        """
+        Return the cached frame, or load() it once however many requests miss at the same time.
+        A frame larger than the whole budget is not cached: it would only flush everything else.
+        """
+        return self._entries.get_or_create(fingerprint, load, size=frame_nbytes)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+dataset_cache = DatasetCache()
+
+
+def load_dataset(file_url: str, loader):
+    """
+    Return (fingerprint, df) for file_url, calling loader(file_url, fingerprint) only on a cache miss.
+    The fingerprint is None when the file could not be validated; such loads bypass the cache.
+    """
+    fingerprint = dataset_fingerprint(file_url)
+    if fingerprint is None:
+        return None, loader(file_url, None)
+
+    return fingerprint, dataset_cache.get_or_load(fingerprint, lambda: loader(file_url, fingerprint))
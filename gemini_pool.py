@@ -0,0 +1,185 @@
+# gemini_pool.py
+import os
+import threading
+import time
+
+from google import genai
+from API_config import GEMINI_API_KEYS
+from telemetry import LLM_REQUESTS, LLM_SECONDS, LLM_TOKENS, get_logger
+
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", 60))  # per key
+GEMINI_BURST_PER_KEY = float(os.getenv("GEMINI_BURST_PER_KEY", 5))
+GEMINI_ACQUIRE_TIMEOUT = float(os.getenv("GEMINI_ACQUIRE_TIMEOUT", 30))
+INITIAL_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 60.0
+
+logger = get_logger("gemini_pool")
+
+
+def _record_usage(model: str, response, seconds: float):
+    LLM_REQUESTS.labels(model=model, outcome="ok").inc()
+    LLM_SECONDS.labels(model=model).observe(seconds)
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, field, None)
+        if count:
+            LLM_TOKENS.labels(model=model, kind=kind).inc(count)
+
+
+def _is_rate_limit_error(error: Exception) -> bool:
+    code = getattr(error, "code", None)
+    status = str(getattr(error, "status", "") or "")
+    return code == 429 or status == "RESOURCE_EXHAUSTED" or "RESOURCE_EXHAUSTED" in str(error)
+
+
+class _TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        return max(0.0, (1 - self.tokens) / self.rate)
+
+
+class _KeySlot:
+    def __init__(self, api_key: str, client, requests_per_minute: float, burst: float):
+        self.api_key = api_key
+        self.client = client
+        self.bucket = _TokenBucket(requests_per_minute / 60.0, burst)
+        self.cooldown_until = 0.0
+        self.backoff = INITIAL_BACKOFF_SECONDS
+        self.calls = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.in_flight = 0
+
+
+class GeminiClientPool:
+    """
+    Process-wide pool holding one genai.Client per API key.
+    Calls go to the key with the most rate budget left (a token bucket per key). A key that
+    hits a 429/quota error is cooled down with exponential backoff and the call fails over
+    to another key.
+    """
+
+    def __init__(self, api_keys: list, requests_per_minute: float = GEMINI_REQUESTS_PER_MINUTE,
+                 burst: float = GEMINI_BURST_PER_KEY, client_factory=genai.Client):
+        self._slots = [
+            _KeySlot(key, client_factory(api_key=key), requests_per_minute, burst)
+            for key in dict.fromkeys(api_keys)
+        ]
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self._slots)
+
+    def _acquire(self, exclude: set) -> _KeySlot:
+        deadline = time.monotonic() + GEMINI_ACQUIRE_TIMEOUT
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                candidates = [slot for slot in self._slots if slot.api_key not in exclude] or self._slots
+                for slot in candidates:
+                    slot.bucket.refill(now)
+                ready = [s for s in candidates if s.cooldown_until <= now and s.bucket.tokens >= 1]
+                if ready:
+                    slot = max(ready, key=lambda s: (s.bucket.tokens, -s.in_flight))
+                    slot.bucket.tokens -= 1
+                    slot.in_flight += 1
+                    return slot
+                wait = min(max(s.cooldown_until - now, s.bucket.wait_time()) for s in candidates)
+
+            if time.monotonic() + wait > deadline:
+                raise RuntimeError("All Gemini API keys are rate limited; try again later.")
+            time.sleep(wait)
+
+    def generate_content(self, **kwargs):
+        """Same arguments as client.models.generate_content, scheduled across the pool's keys."""
+        if not self._slots:
+            raise RuntimeError("No Gemini API keys configured.")
+
+        model = kwargs.get("model", "unknown")
+        tried = set()
+        last_error = None
+        for _ in range(len(self._slots)):
+            slot = self._acquire(exclude=tried)
+            tried.add(slot.api_key)
+            start = time.perf_counter()
+            try:
+                response = slot.client.models.generate_content(**kwargs)
+            except Exception as e:
+                rate_limited = _is_rate_limit_error(e)
+                LLM_REQUESTS.labels(model=model, outcome="rate_limited" if rate_limited else "error").inc()
+                with self._lock:
+                    slot.in_flight -= 1
+                    if not rate_limited:
+                        slot.errors += 1
+                        raise
+                    slot.rate_limited += 1
+                    slot.cooldown_until = time.monotonic() + slot.backoff
+                    slot.backoff = min(slot.backoff * 2, MAX_BACKOFF_SECONDS)
+                logger.warning("⚠️ Gemini key ...%s rate limited, failing over: %s", slot.api_key[-4:], e)
+                last_error = e
+                continue
+
+            _record_usage(model, response, time.perf_counter() - start)
+            with self._lock:
+                slot.in_flight -= 1
+                slot.calls += 1
+                slot.backoff = INITIAL_BACKOFF_SECONDS
+            return response
+
+        raise last_error
+
+    def utilization(self) -> list:
+        """Per-key call counts, rate-limit hits, remaining burst and cooldown (keys are masked)."""
+        with self._lock:
+            now = time.monotonic()
+            total_calls = sum(slot.calls for slot in self._slots)
+            report = []
+            for slot in self._slots:
+                slot.bucket.refill(now)
+                report.append({
+                    "key": f"...{slot.api_key[-4:]}",
+                    "calls": slot.calls,
+                    "share": slot.calls / total_calls if total_calls else 0.0,
+                    "rate_limited": slot.rate_limited,
+                    "errors": slot.errors,
+                    "in_flight": slot.in_flight,
+                    "tokens_available": round(slot.bucket.tokens, 2),
+                    "cooldown_seconds": round(max(0.0, slot.cooldown_until - now), 2),
+                })
+            return report
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_client_pool(fallback_api_key: str = None) -> GeminiClientPool:
+    """
+    Return the shared pool built from GEMINI_API_KEY_1..10.
+    fallback_api_key is only used when no keys are configured in the environment.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or (_pool.size == 0 and fallback_api_key):
+            keys = GEMINI_API_KEYS or ([fallback_api_key] if fallback_api_key else [])
+            _pool = GeminiClientPool(keys)
+        return _pool
+
+
+def set_client_pool(pool: GeminiClientPool):
+    """Replace the shared pool, e.g. with one built on a stand-in client for offline benchmarks."""
+    global _pool
+    with _pool_lock:
+        _pool = pool
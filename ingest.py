@@ -0,0 +1,234 @@
+# ingest.py
+import json
+import os
+import tempfile
+import warnings
+
+import pandas as pd
+import pyarrow as pa
+from pandas.tseries.api import guess_datetime_format
+
+from telemetry import get_logger
+
+INGEST_CACHE_DIR = os.getenv("INGEST_CACHE_DIR", os.path.join(tempfile.gettempdir(), "hynox_ingest"))
+INGEST_CACHE_MAX_BYTES = int(os.getenv("INGEST_CACHE_MAX_BYTES", 4 * 1024 * 1024 * 1024))
+INGEST_FORMAT_VERSION = 2  # Bump when parsing or type inference changes; older ingested copies are re-parsed
+DATE_SAMPLE_SIZE = 1000
+DATE_PARSE_THRESHOLD = 0.9
+DATE_FORMAT_CANDIDATES = 20          # Distinct sampled values a date format is guessed from
+DATE_YEAR_RANGE = (1900, 2100)       # Parsed years outside this mean the "dates" were something else
+
+logger = get_logger("ingest")
+
+
+def _parse_file(file_url: str) -> pd.DataFrame:
+    if file_url.lower().endswith(('.xls', '.xlsx')):
+        return pd.read_excel(file_url, engine='openpyxl')
+    if file_url.lower().endswith('.parquet'):
+        return pd.read_parquet(file_url)
+    return pd.read_csv(file_url, encoding='latin1')
+
+
+def _parse_dates(values: pd.Series, date_format: str) -> pd.Series:
+    try:
+        parsed = pd.to_datetime(values, format=date_format, errors='coerce')
+    except (ValueError, TypeError):
+        # e.g. mixed UTC offsets, which have no single datetime64 type
+        return pd.Series(pd.NaT, index=values.index)
+    return parsed.where(parsed.dt.year.between(*DATE_YEAR_RANGE))
+
+
+def _date_format(values: pd.Series):
+    """
+    The single format the sampled values are dates in, or None. Only formats with a four-digit
+    year qualify, so month names ("Jan") and codes ("1-2", "10/12") stay text; day-first and
+    month-first readings are both tried and the one parsing more values wins.
+    """
+    # Plain numbers ("12", "2024") would happily parse as dates, so leave those alone
+    if pd.to_numeric(values, errors='coerce').notna().all():
+        return None
+    formats = []
+    for value in values.drop_duplicates().head(DATE_FORMAT_CANDIDATES):
+        for dayfirst in (False, True):
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                date_format = guess_datetime_format(value, dayfirst=dayfirst)
+            if date_format and "%Y" in date_format and date_format not in formats:
+                formats.append(date_format)
+    rates = {date_format: _parse_dates(values, date_format).notna().mean() for date_format in formats}
+    best = max(rates, key=rates.get, default=None)  # Ties keep the month-first reading
+    if best is None or rates[best] < DATE_PARSE_THRESHOLD:
+        return None
+    return best
+
+
+def infer_types(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Promote text columns that hold dates to datetime64 so downstream agents see real dates.
+    Detection infers one format from a sample; the full column is only converted, with that
+    format, when the sample qualifies. Values that do not match become NaT.
+    """
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
+        sample = df[col].dropna()
+        if sample.empty:
+            continue
+        date_format = _date_format(sample.head(DATE_SAMPLE_SIZE).astype(str))
+        if date_format is not None:
+            df[col] = _parse_dates(df[col].astype("string"), date_format)
+    return df
+
+
+def _ipc_path(fingerprint: str) -> str:
+    return os.path.join(INGEST_CACHE_DIR, f"{fingerprint}.arrow")
+
+
+def _manifest_path(fingerprint: str) -> str:
+    return os.path.join(INGEST_CACHE_DIR, f"{fingerprint}.json")
+
+
+def _rollups_path(fingerprint: str) -> str:
+    return os.path.join(INGEST_CACHE_DIR, f"{fingerprint}.rollups.arrow")
+
+
+def _atomic_write(path: str, write):
+    # Write to a temp file first so concurrent workers never map a half-written file
+    fd, tmp_path = tempfile.mkstemp(dir=INGEST_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _write_ingested(fingerprint: str, file_url: str, df: pd.DataFrame):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    def write_ipc(path):
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    def write_manifest(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({
+                "version": INGEST_FORMAT_VERSION,
+                "source": file_url,
+                "rows": len(df),
+                "dtypes": {col: str(dtype) for col, dtype in df.dtypes.items()},
+            }, f)
+
+    os.makedirs(INGEST_CACHE_DIR, exist_ok=True)
+    _atomic_write(_ipc_path(fingerprint), write_ipc)
+    # Written last: a copy without a current manifest is incomplete or stale and gets re-parsed
+    _atomic_write(_manifest_path(fingerprint), write_manifest)
+    prune_cache(keep=fingerprint)
+
+
+def prune_cache(max_bytes: int = INGEST_CACHE_MAX_BYTES, keep: str = None):
+    """
+    Delete the least recently used datasets' files (ingested copy, manifest, rollups) until
+    INGEST_CACHE_DIR fits in max_bytes; the dataset keep (just written) is never deleted.
+    Workers that still map a deleted file keep reading it.
+    """
+    datasets = {}  # fingerprint -> [last used, bytes, paths]
+    try:
+        names = os.listdir(INGEST_CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(INGEST_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = datasets.setdefault(name.split(".", 1)[0], [0.0, 0, []])
+        entry[0] = max(entry[0], stat.st_mtime)
+        entry[1] += stat.st_size
+        entry[2].append(path)
+    total = sum(size for _, size, _ in datasets.values())
+    for fingerprint, (_, size, paths) in sorted(datasets.items(), key=lambda item: item[1][0]):
+        if total <= max_bytes:
+            break
+        if fingerprint == keep:
+            continue
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        total -= size
+        logger.info("Evicted ingested copy %s (%d bytes)", fingerprint[:12], size)
+
+
+def _read_ingested(fingerprint: str) -> pd.DataFrame:
+    # The mapping stays open for as long as the returned frame references its buffers;
+    # workers mapping the same file share the page cache instead of private copies.
+    path = _ipc_path(fingerprint)
+    source = pa.memory_map(path, 'r')
+    os.utime(path)  # Marks the copy as recently used for prune_cache
+    table = pa.ipc.open_file(source).read_all()
+    return table.to_pandas(split_blocks=True)
+
+
+def read_manifest(fingerprint: str):
+    """Return the recorded format version, source, row count and dtypes of an ingested file, or None."""
+    try:
+        with open(_manifest_path(fingerprint), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_rollups(fingerprint: str, table: pa.Table):
+    """Store a dataset's rollup table next to its ingested copy, schema metadata included."""
+    def write_ipc(path):
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+    os.makedirs(INGEST_CACHE_DIR, exist_ok=True)
+    _atomic_write(_rollups_path(fingerprint), write_ipc)
+    prune_cache(keep=fingerprint)
+
+
+def read_rollups(fingerprint: str):
+    """Return the stored rollup table of a dataset, or None."""
+    try:
+        with pa.memory_map(_rollups_path(fingerprint), 'r') as source:
+            return pa.ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowException):
+        return None
+
+
+def ingest_file(file_url: str, fingerprint: str = None) -> pd.DataFrame:
+    """
+    Load file_url as a typed DataFrame.
+    With a fingerprint, the file is parsed once into an Arrow IPC file in INGEST_CACHE_DIR;
+    later loads memory-map that file instead of re-parsing the CSV/Excel source, as long as
+    its manifest records the current INGEST_FORMAT_VERSION. The directory is kept under
+    INGEST_CACHE_MAX_BYTES by evicting the least recently used datasets.
+    """
+    manifest = read_manifest(fingerprint) if fingerprint else None
+    if manifest is not None and manifest.get("version") == INGEST_FORMAT_VERSION:
+        try:
+            return _read_ingested(fingerprint)
+        except (OSError, pa.ArrowException) as e:
+            logger.warning("⚠️ Failed to read ingested copy of %s, re-parsing: %s", file_url, e)
+
+    df = infer_types(_parse_file(file_url))
+    df.columns = [str(col) for col in df.columns]
+
+    if fingerprint:
+        try:
+            _write_ingested(fingerprint, file_url, df)
+            return _read_ingested(fingerprint)
+        except (OSError, pa.ArrowException) as e:
+            # Mixed-type object columns cannot be stored in Arrow; serve the parsed frame as-is
+            logger.warning("⚠️ Could not write ingested copy of %s: %s", file_url, e)
+    return df
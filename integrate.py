@@ -1,9 +1,26 @@
 # integrate.py
+import os
 import pandas as pd
-from query_processing import process_query, GeminiLLM
+from query_processing import process_queries, process_query_stages, GeminiLLM, SQLRepairAgent
 from process_sql import execute_sql_query
+from profiler import profile_dataset
 from API_config import GEMINI_API_KEY
 from visualization import get_visualization_json
+from dataset_cache import load_dataset
+from ingest import ingest_file
+from large_files import is_large_file, open_large_dataset
+from response_encoding import FORMAT_ARROW, FORMAT_RECORDS, build_chart_data, build_payload, build_table
+from prompt_budget import get_schema_prompt
+from result_cache import get_result_cache
+from rollups import ensure_rollups
+from schema_index import get_schema_index
+from stage_pool import submit, result_or_default
+from telemetry import annotate, get_logger, span, traced
+
+logger = get_logger("integrate")
+
+SUPPORTED_EXTENSIONS = ('.xls', '.xlsx', '.csv', '.parquet')
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 50))
 
 def _create_response(status, summary=None, data=None, table=None, error=None):
     """Helper function to create a standardized response object."""
@@ -15,42 +32,43 @@ def _create_response(status, summary=None, data=None, table=None, error=None):
         "error": error
     }
 
-def _transform_data_for_charts(data):
+def _chart_mapping(df):
     """
-    Transforms data from SQL result format to a generic chart-compatible format.
-    The first non-numeric column is mapped to 'name', and subsequent numeric columns
-    are mapped to 'value1', 'value2', etc.
+    Map chart fields to result columns using their dtypes: the first non-numeric column
+    becomes 'name' and the numeric columns become 'value1', 'value2', etc.
     """
-    if not data:
-        return []
-
-    df = pd.DataFrame(data)
-    transformed_data = []
-
-    # Identify columns for 'name' and 'values'
     name_column = None
     value_columns = []
-
     for col in df.columns:
-        # Check if the column is numeric
-        is_numeric = pd.to_numeric(df[col], errors='coerce').notna().all()
-        
-        if not is_numeric and name_column is None:
-            name_column = col
-        elif is_numeric:
+        if pd.api.types.is_numeric_dtype(df[col].dtype):
             value_columns.append(col)
+        elif name_column is None:
+            name_column = col
 
-    for _, row in df.iterrows():
-        new_item = {}
-        if name_column:
-            new_item['name'] = row[name_column]
-        
-        for i, val_col in enumerate(value_columns):
-            new_item[f'value{i+1}'] = row[val_col]
-        
-        transformed_data.append(new_item)
-        
-    return transformed_data
+    mapping = {} if name_column is None else {'name': name_column}
+    for i, col in enumerate(value_columns):
+        mapping[f'value{i+1}'] = col
+    return mapping
+
+def _transform_data_for_charts(data, orient="records"):
+    """
+    Transforms data from SQL result format to a generic chart-compatible format.
+    The first non-numeric column is mapped to 'name', and subsequent numeric columns
+    are mapped to 'value1', 'value2', etc.
+
+    data is the result DataFrame (a list of records is still accepted). orient="records"
+    returns a list of {"name", "value1", ...} dicts; orient="columns" returns
+    {"name": [...], "value1": [...], ...}.
+    """
+    df = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    if df.empty:
+        return {} if orient == "columns" else []
+
+    mapping = _chart_mapping(df)
+    chart_df = df[list(mapping.values())].set_axis(list(mapping.keys()), axis=1)
+    if orient == "columns":
+        return {col: chart_df[col].tolist() for col in chart_df.columns}
+    return chart_df.to_dict(orient="records")
 
 def generate_conversational_response(api_key, query):
     gemini_llm = GeminiLLM(api_key=api_key)
@@ -66,77 +84,291 @@ def handle_greeting(query):
     return None
 
 def process_data(chat_context, file_url):
-    print("Processing in integrate.py...")
-    
+    """Run the pipeline and return the response in the original records shape."""
+    response, result_df = run_pipeline(chat_context, file_url)
+    return build_payload(response, result_df)
+
+def run_pipeline(chat_context, file_url, fmt=FORMAT_RECORDS, session=None):
+    """
+    Answer chat_context from the file at file_url, or from a warm sessions.Session.
+    Returns (response, result_df). Query results come back with the table and chart data already
+    serialized in fmt (a response_encoding format); for Arrow the response only holds the chart
+    type and column mapping, and the rows are encoded from result_df.
+    """
+    for stage, payload in pipeline_stages(chat_context, file_url, fmt, session=session):
+        if stage == "response":
+            return payload
+
+def load_source(file_url):
+    """
+    Load file_url for querying. Returns (dataset_id, source, df): source is what the SQL engine
+    queries (the frame, or a FileScan for large files) and df is the frame the agents profile.
+    """
+    with span("load") as attributes:
+        attributes["large_file"] = is_large_file(file_url)
+        if attributes["large_file"]:
+            # Too big for pandas: DuckDB queries the file in place and the agents profile a sample
+            dataset_id, source, df = open_large_dataset(file_url)
+        else:
+            # Parsed frames are cached by URL + validator, so follow-up questions skip the reload;
+            # a cold worker memory-maps the ingested Arrow copy instead of re-parsing the file
+            dataset_id, df = load_dataset(file_url, ingest_file)
+            source = df
+        attributes["rows"] = len(df)
+    ensure_rollups(dataset_id, source, df, profile_dataset(df, dataset_id))
+    return dataset_id, source, df
+
+def pipeline_stages(chat_context, file_url, fmt=FORMAT_RECORDS, session=None):
+    """
+    Run the pipeline as a generator of (stage, payload) events, shared by the blocking and
+    streaming endpoints. Stages are emitted as they complete:
+    "refined_query", "sql", "rows" (the result frame), "chart", and always a final
+    "response" whose payload is (response, result_df).
+    With a session, the dataset, profile and schema index are already warm and earlier turns
+    are passed to the agents as context; answered turns are added to the session history.
+    """
+    logger.debug("Processing in integrate.py...")
+
     greeting_response = handle_greeting(chat_context)
     if greeting_response:
-        return greeting_response
+        yield "response", (greeting_response, None)
+        return
 
-    print("Chat Context:", chat_context)
-    print("File URL:", file_url)
+    logger.debug("Chat Context: %s", chat_context)
+    logger.debug("File URL: %s", file_url)
 
     api_key = GEMINI_API_KEY
 
-    try:
-        if file_url.lower().endswith(('.xls', '.xlsx')):
-            df = pd.read_excel(file_url, engine='openpyxl')
-        elif file_url.lower().endswith('.csv'):
-            df = pd.read_csv(file_url, encoding='latin1')
-        else:
-            return _create_response(
+    if session is not None:
+        dataset_id, source, df = session.dataset_id, session.source, session.df
+        annotate(dataset_id=dataset_id, session_id=session.session_id)
+    else:
+        if not file_url.lower().endswith(SUPPORTED_EXTENSIONS):
+            yield "response", (_create_response(
                 status="error",
                 summary="Unsupported file format.",
-                error="Unsupported file format. Only CSV and Excel files are supported."
-            )
-    except Exception as e:
-        return _create_response(
-            status="error",
-            summary="Failed to load file from URL.",
-            error=f"Failed to load file from URL: {e}"
-        )
+                error="Unsupported file format. Only CSV, Excel and Parquet files are supported."
+            ), None)
+            return
 
-    columns = df.columns.tolist()
-    table_name = "df"
+        try:
+            dataset_id, source, df = load_source(file_url)
+            annotate(dataset_id=dataset_id)
+        except Exception as e:
+            logger.warning("Failed to load %s: %s", file_url, e)
+            yield "response", (_create_response(
+                status="error",
+                summary="Failed to load file from URL.",
+                error=f"Failed to load file from URL: {e}"
+            ), None)
+            return
 
     # --- Send to LLM Agents ---
-    response = process_query(
+    # The refined question is streamed as soon as it is known, while the SQL is still being written
+    refined_sent = False
+    for stage, payload in process_query_stages(
         api_key=api_key,
-        dataset_columns=columns,
+        dataset_columns=df.columns.tolist(),
         df=df,
-        user_query=chat_context
-    )
+        user_query=chat_context,
+        dataset_id=dataset_id,
+        dataset_profile=session.dataset_profile if session is not None else None,
+        schema_index=session.schema_index if session is not None else None,
+        history=session.recent_turns() if session is not None else None
+    ):
+        if stage == "refined_query":
+            yield "refined_query", {"refined_query": payload}
+            refined_sent = True
+        else:
+            response = payload
+    yield from _answer_stages(chat_context, response, dataset_id, source, df, fmt, session=session,
+                              refined_sent=refined_sent)
+
+def _answer_stages(chat_context, response, dataset_id, source, df, fmt, session=None, dataset_profile=None,
+                   refined_sent=False):
+    """
+    The pipeline after the agents: execute the SQL in response (a process_query result) against
+    source and build the chart and table, emitting the same events as pipeline_stages
+    ("refined_query" only if the caller has not already streamed it: refined_sent).
+    """
+    api_key = GEMINI_API_KEY
+    columns = df.columns.tolist()
+    table_name = "df"
+    if session is not None:
+        dataset_profile = session.dataset_profile
 
     # --- If SQL is valid, execute it ---
     if response.get("status") and response.get("sql_query"):
-        sql_query = response["sql_query"]["SQL"]
-
-        result_df = execute_sql_query(df, sql_query, table_name=table_name)
-
-        if result_df is not None and not result_df.empty:
-            # Transform data for visualization
-            transformed_chart_data = _transform_data_for_charts(result_df.to_dict(orient="records"))
-            
-            # --- Get visualization info ---
-            visualization_json = get_visualization_json(api_key, response.get("refined_query"), transformed_chart_data)
-            
-            # --- Create table object ---
-            table_json = {
-                "columns": result_df.columns.tolist(),
-                "rows": result_df.to_dict(orient="records")
-            }
-
-            return _create_response(
+        sql_query = generated_sql = response["sql_query"]["SQL"]
+        params = response["sql_query"].get("params")
+        if not refined_sent:
+            yield "refined_query", {"refined_query": response.get("refined_query")}
+        yield "sql", {"sql": sql_query}
+
+        def repair_sql(failed_sql, error):
+            # Only reached when the SQL fails to parse or bind; the profile is cached by then
+            summary = dataset_profile if dataset_profile is not None else profile_dataset(df, dataset_id)
+            schema_index = session.schema_index if session is not None else get_schema_index(columns, summary, dataset_id)
+            agent = SQLRepairAgent(GeminiLLM(api_key=api_key), columns, table_name, summary,
+                                   schema_prompt=get_schema_prompt(columns, summary, schema_index, dataset_id))
+            return agent.repair(failed_sql, error)
+
+        # Finished results are cached under the generated SQL, so a repeated question
+        # skips the engine, the chart choice and the serialization
+        cache = get_result_cache()
+        cached = cache.get(dataset_id, generated_sql, params) if cache is not None else None
+        annotate(result_cache="hit" if cached is not None else "miss")
+        if cached is not None:
+            result_df = cached.frame()
+        else:
+            result_df = execute_sql_query(
+                source, sql_query, table_name=table_name, dataset_id=dataset_id, params=params,
+                repair=traced("agent.sql_repair", repair_sql)
+            )
+        if result_df is not None and result_df.attrs.get("sql", sql_query) != sql_query:
+            sql_query = result_df.attrs["sql"]
+            yield "sql", {"sql": sql_query, "repaired": True}
+        if session is not None and result_df is not None:
+            session.record_turn(chat_context, response.get("refined_query"), sql_query)
+
+        if cached is not None:
+            yield from _cached_stages(cache, cached, result_df, response, fmt, (dataset_id, generated_sql, params))
+        elif result_df is not None and result_df.empty:
+            # No matching rows is still a valid answer
+            chart = {"type": "table", "mapping": {}}
+            if cache is not None:
+                cache.put(dataset_id, generated_sql, params, result_df, chart)
+            yield "rows", result_df
+            yield "chart", chart
+            yield "response", (_create_response(
+                status="success",
+                summary=response.get("refined_query", "Query executed successfully."),
+                data=chart
+            ), result_df)
+        elif result_df is not None:
+            mapping = _chart_mapping(result_df)
+
+            # --- Get visualization info (the model only sees the first rows) ---
+            # The chart call, table serialization and chart-data transform run concurrently
+            sample_chart_data = _transform_data_for_charts(result_df.head(3))
+            chart_future = submit(
+                traced("agent.visualization", get_visualization_json),
+                api_key, response.get("refined_query"), sample_chart_data,
+                chart_type=response.get("chart_type"), result_df=result_df
+            )
+            if fmt != FORMAT_ARROW:
+                table_future = submit(traced("transform.table", build_table), result_df, fmt)
+                chart_data_future = submit(traced("transform.chart_data", build_chart_data), result_df, mapping, fmt)
+
+            # Clients can render the table before the chart type is known
+            yield "rows", result_df
+
+            visualization_json = result_or_default(chart_future, {"type": "table", "fallback": True},
+                                                   stage="visualization")
+            chart = {"type": visualization_json["type"], "mapping": mapping}
+            yield "chart", chart
+            # A fallback chart answers this request only; the next one asks for the chart again
+            if visualization_json.get("fallback"):
+                cache = None
+
+            response_data = _create_response(
                 status="success",
                 summary=response.get("refined_query", "Query executed successfully."),
-                data=visualization_json,
-                table=table_json
+                data=chart
             )
+            cached = cache.put(dataset_id, generated_sql, params, result_df, chart) if cache is not None else None
+            if fmt != FORMAT_ARROW:
+                chart_data, table = chart_data_future.result(), table_future.result()
+                response_data["data"] = {"type": chart["type"], **chart_data}
+                response_data["table"] = table
+                if cached is not None:
+                    cache.add_payload(dataset_id, generated_sql, params, cached, fmt, chart_data, table)
+            yield "response", (response_data, result_df)
         else:
-            return _create_response(
+            yield "response", (_create_response(
                 status="error",
-                summary="SQL execution failed or returned no data.",
-                error="SQL execution failed or the query returned an empty result set."
-            )
+                summary="SQL execution failed.",
+                error="SQL execution failed on every available engine."
+            ), None)
     else:
         # --- If no SQL, generate conversational response ---
-        return generate_conversational_response(api_key, chat_context)
+        yield "response", (generate_conversational_response(api_key, chat_context), None)
+
+def _cached_stages(cache, cached, result_df, response, fmt, key):
+    """Events for a result served from the result cache; the payload for fmt is built once per entry."""
+    chart = cached.chart
+    yield "rows", result_df
+    yield "chart", chart
+
+    response_data = _create_response(
+        status="success",
+        summary=response.get("refined_query", "Query executed successfully."),
+        data=chart
+    )
+    if fmt != FORMAT_ARROW and not result_df.empty:
+        payload = cached.payload(fmt)
+        if payload is None:
+            payload = {"data": build_chart_data(result_df, chart["mapping"], fmt), "table": build_table(result_df, fmt)}
+            cache.add_payload(*key, cached, fmt, payload["data"], payload["table"])
+        response_data["data"] = {"type": chart["type"], **payload["data"]}
+        response_data["table"] = payload["table"]
+    yield "response", (response_data, result_df)
+
+def run_batch(questions, file_url, fmt=FORMAT_RECORDS):
+    """
+    Answer several independent questions about the file at file_url (e.g. dashboard tiles).
+    The file is loaded and profiled once, the agents plan the questions together in as few
+    model calls as possible, and every query runs on the dataset's one engine connection.
+    Returns one (response, result_df) per question, in order; a question that fails gets an
+    error response without affecting the others.
+    """
+    if not file_url or not file_url.lower().endswith(SUPPORTED_EXTENSIONS):
+        error = _create_response(
+            status="error",
+            summary="Unsupported file format.",
+            error="Unsupported file format. Only CSV, Excel and Parquet files are supported."
+        )
+        return [(error, None)] * len(questions)
+
+    try:
+        dataset_id, source, df = load_source(file_url)
+        annotate(dataset_id=dataset_id)
+    except Exception as e:
+        logger.warning("Failed to load %s: %s", file_url, e)
+        error = _create_response(
+            status="error",
+            summary="Failed to load file from URL.",
+            error=f"Failed to load file from URL: {e}"
+        )
+        return [(error, None)] * len(questions)
+
+    with span("profile"):
+        dataset_profile = profile_dataset(df, dataset_id)
+    results = [(handle_greeting(question), None) for question in questions]
+    planned = [i for i, (greeting, _) in enumerate(results) if greeting is None]
+    responses = process_queries(
+        api_key=GEMINI_API_KEY,
+        dataset_columns=df.columns.tolist(),
+        df=df,
+        user_queries=[questions[i] for i in planned],
+        dataset_id=dataset_id,
+        dataset_profile=dataset_profile
+    )
+
+    for i, response in zip(planned, responses):
+        with span("batch.answer", question=i):
+            try:
+                if response.get("error"):
+                    raise RuntimeError(response["error"])
+                for stage, payload in _answer_stages(questions[i], response, dataset_id, source, df, fmt,
+                                                     dataset_profile=dataset_profile):
+                    if stage == "response":
+                        results[i] = payload
+            except Exception as e:
+                logger.warning("Batch question %d failed: %s", i, e)
+                results[i] = (_create_response(
+                    status="error",
+                    summary="An unexpected error occurred while answering this question.",
+                    error=str(e)
+                ), None)
+    return results
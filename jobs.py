@@ -0,0 +1,246 @@
+# jobs.py
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from integrate import pipeline_stages
+from response_encoding import stage_payload
+from telemetry import JOB_WAIT_SECONDS, JOBS, annotate, get_logger, request_trace
+
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+JOB_EXECUTOR = os.getenv("JOB_EXECUTOR", "thread")  # "thread", or "process" for CPU-heavy SQL
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))      # Jobs running at once
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", 64))  # Queued + running jobs before submissions are refused
+JOB_RESULT_TTL_SECONDS = float(os.getenv("JOB_RESULT_TTL_SECONDS", 10 * 60))  # How long finished jobs are kept
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+logger = get_logger("jobs")
+
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_MAX jobs are already queued or running."""
+
+
+class Job:
+    """
+    One question answered in the background. Pipeline events are kept JSON-ready, in order,
+    as they complete; the final "response" event also sets response.
+    """
+
+    def __init__(self, job_id: str, chat_context: str, file_url: str, fmt: str, log_level: str = None):
+        self.job_id = job_id
+        self.chat_context = chat_context
+        self.file_url = file_url
+        self.fmt = fmt
+        self.log_level = log_level
+        self.state = QUEUED
+        self.events = []
+        self.response = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = self.finished_at = None
+        self.future = None
+        self._changed = threading.Condition()
+
+    def add_event(self, stage: str, payload):
+        with self._changed:
+            self.events.append({"event": stage, "data": payload})
+            if stage == "response":
+                self.response = payload
+            self._changed.notify_all()
+
+    def set_state(self, state: str, error: str = None):
+        with self._changed:
+            self.state = state
+            if state == RUNNING:
+                self.started_at = time.time()
+            elif state in FINISHED_STATES:
+                self.finished_at = time.time()
+                self.error = error
+            self._changed.notify_all()
+
+    def events_since(self, since: int = 0, timeout: float = None):
+        """
+        Return (events after index since, finished). With a timeout, block until there is a
+        new event or the job finishes, for clients that subscribe instead of polling.
+        """
+        with self._changed:
+            if timeout:
+                self._changed.wait_for(lambda: len(self.events) > since or self.state in FINISHED_STATES, timeout)
+            return self.events[since:], self.state in FINISHED_STATES
+
+    def describe(self, since: int = 0) -> dict:
+        events, _ = self.events_since(since)
+        with self._changed:
+            return {
+                "job_id": self.job_id,
+                "state": self.state,
+                "submitted_at": self.submitted_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "events": events,
+                "next_event": since + len(events),
+                "response": self.response,
+                "error": self.error,
+            }
+
+
+def _job_events(chat_context: str, file_url: str, fmt: str):
+    for stage, payload in pipeline_stages(chat_context, file_url, fmt):
+        yield stage, stage_payload(stage, payload, fmt)
+
+
+def _run_in_process(chat_context: str, file_url: str, fmt: str, events):
+    """Process-pool entry point: the pipeline runs in the child and its events cross over a manager queue."""
+    for event in _job_events(chat_context, file_url, fmt):
+        events.put(event)
+
+
+class LocalJobQueue:
+    """
+    In-process job queue. Jobs run on JOB_WORKERS threads, or hand their pipeline to a pool
+    of JOB_WORKERS processes when executor="process" so SQL and pandas work escape the GIL.
+    Finished jobs are dropped JOB_RESULT_TTL_SECONDS after they finish, on the next access.
+
+    Jobs live in the worker process that accepted them: with several gunicorn workers, status
+    requests must reach the same worker (or run one worker with more threads).
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX,
+                 result_ttl: float = JOB_RESULT_TTL_SECONDS, executor: str = JOB_EXECUTOR):
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown job executor '{executor}'. Use 'thread' or 'process'.")
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self.executor = executor
+        self._threads = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._processes = None
+        self._manager = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.expired = 0
+
+    def _evict_finished(self, now: float):
+        for job_id, job in list(self._jobs.items()):
+            if job.state in FINISHED_STATES and now - job.finished_at > self.result_ttl:
+                del self._jobs[job_id]
+                self.expired += 1
+
+    def _active(self) -> int:
+        return sum(job.state not in FINISHED_STATES for job in self._jobs.values())
+
+    def submit(self, chat_context: str, file_url: str, fmt: str, log_level: str = None) -> Job:
+        """Queue a question and return its Job at once. Raises JobQueueFull when the queue is at capacity."""
+        job = Job(secrets.token_urlsafe(12), chat_context, file_url, fmt, log_level)
+        with self._lock:
+            self._evict_finished(time.time())
+            if self._active() >= self.max_queued:
+                JOBS.labels(outcome="rejected").inc()
+                raise JobQueueFull(f"{self.max_queued} jobs are already queued or running.")
+            self._jobs[job.job_id] = job
+            job.future = self._threads.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str):
+        with self._lock:
+            self._evict_finished(time.time())
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that has not started yet; returns False once it is running or finished."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.state != QUEUED or not job.future.cancel():
+                return False
+        job.set_state(CANCELLED)
+        JOBS.labels(outcome=CANCELLED).inc()
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict_finished(time.time())
+            states = [job.state for job in self._jobs.values()]
+        return {
+            "queued": states.count(QUEUED),
+            "running": states.count(RUNNING),
+            "finished": sum(state in FINISHED_STATES for state in states),
+            "expired": self.expired,
+            "executor": self.executor,
+        }
+
+    def _process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                # spawn, not fork: the parent holds engine connections and worker threads
+                context = multiprocessing.get_context("spawn")
+                self._manager = context.Manager()
+                self._processes = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+            return self._processes
+
+    def _events_from_process(self, job: Job):
+        processes = self._process_pool()
+        events = self._manager.Queue()
+        future = processes.submit(_run_in_process, job.chat_context, job.file_url, job.fmt, events)
+        while True:
+            try:
+                yield events.get(timeout=0.1)
+            except queue.Empty:
+                if future.done():
+                    break
+        # Raises what the pipeline raised in the child
+        future.result()
+        while not events.empty():
+            yield events.get()
+
+    def _run(self, job: Job):
+        JOB_WAIT_SECONDS.observe(time.time() - job.submitted_at)
+        job.set_state(RUNNING)
+        with request_trace("job", request_id=job.job_id, log_level=job.log_level):
+            annotate(executor=self.executor)
+            try:
+                events = self._events_from_process(job) if self.executor == "process" else \
+                    _job_events(job.chat_context, job.file_url, job.fmt)
+                for stage, payload in events:
+                    job.add_event(stage, payload)
+            except Exception as e:
+                logger.exception("Job %s failed: %s", job.job_id, e)
+                job.add_event("error", {
+                    "status": "error",
+                    "summary": "An unexpected error occurred in the backend.",
+                    "data": None,
+                    "table": None,
+                    "error": str(e)
+                })
+                job.set_state(FAILED, str(e))
+                JOBS.labels(outcome=FAILED).inc()
+                annotate(http_status=500)
+                return
+        job.set_state(DONE)
+        JOBS.labels(outcome=DONE).inc()
+
+
+JOB_BACKENDS = {
+    "local": LocalJobQueue,
+}
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the shared job queue for JOB_BACKEND, created on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if JOB_BACKEND not in JOB_BACKENDS:
+                raise ValueError(f"Unknown job backend '{JOB_BACKEND}'. Available backends: {', '.join(JOB_BACKENDS)}")
+            _queue = JOB_BACKENDS[JOB_BACKEND]()
+        return _queue
@@ -0,0 +1,156 @@
+# large_files.py
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+
+from dataset_cache import dataset_fingerprint, VALIDATOR_TIMEOUT_SECONDS
+from lru import LRUCache
+from sql_engines import FileScan, get_engine
+from telemetry import get_logger
+
+LARGE_FILE_THRESHOLD_BYTES = int(os.getenv("LARGE_FILE_THRESHOLD_BYTES", 512 * 1024 * 1024))
+LARGE_FILE_SAMPLE_ROWS = int(os.getenv("LARGE_FILE_SAMPLE_ROWS", 100_000))
+LARGE_FILE_DIR = os.getenv("LARGE_FILE_DIR", os.path.join(tempfile.gettempdir(), "hynox_large_files"))
+LARGE_FILE_DIR_MAX_BYTES = int(os.getenv("LARGE_FILE_DIR_MAX_BYTES", 20 * 1024 * 1024 * 1024))
+# Remote files without ETag/Last-Modified cannot be validated; their download is reused this long
+UNVALIDATED_DOWNLOAD_TTL_SECONDS = float(os.getenv("UNVALIDATED_DOWNLOAD_TTL_SECONDS", 10 * 60))
+SCANNABLE_EXTENSIONS = ('.csv', '.parquet')
+MAX_OPEN_DATASETS = 16
+
+logger = get_logger("large_files")
+
+_samples = LRUCache(max_entries=MAX_OPEN_DATASETS)  # dataset_id -> (FileScan, sample DataFrame)
+_download_locks = {}  # destination path -> [lock held while it downloads, threads holding or awaiting it]
+_download_locks_lock = threading.Lock()
+
+
+def _is_remote(file_url: str) -> bool:
+    return file_url.lower().startswith(("http://", "https://"))
+
+
+def _file_size(file_url: str):
+    if not _is_remote(file_url):
+        try:
+            return os.path.getsize(file_url)
+        except OSError:
+            return None
+    try:
+        req = urllib.request.Request(file_url, method="HEAD")
+        with urllib.request.urlopen(req, timeout=VALIDATOR_TIMEOUT_SECONDS) as resp:
+            length = resp.headers.get("Content-Length")
+            return int(length) if length else None
+    except Exception as e:
+        logger.warning("⚠️ Could not fetch size of %s: %s", file_url, e)
+        return None
+
+
+def is_large_file(file_url: str) -> bool:
+    """True for CSV/Parquet files above LARGE_FILE_THRESHOLD_BYTES, which are queried out of core."""
+    if not file_url.lower().endswith(SCANNABLE_EXTENSIONS):
+        return False
+    size = _file_size(file_url)
+    return size is not None and size > LARGE_FILE_THRESHOLD_BYTES
+
+
+def _is_fresh(path: str, dataset_id: str) -> bool:
+    try:
+        modified = os.path.getmtime(path)
+    except OSError:
+        return False
+    # A validated download is named after its content; an unvalidated one may have changed upstream
+    return dataset_id is not None or time.time() - modified < UNVALIDATED_DOWNLOAD_TTL_SECONDS
+
+
+def _prune_downloads(keep: str):
+    """Delete the oldest downloads until LARGE_FILE_DIR fits LARGE_FILE_DIR_MAX_BYTES, sparing open datasets."""
+    in_use = {scan.path for scan, _ in _samples.values()} | {keep}
+    files = []
+    for name in os.listdir(LARGE_FILE_DIR):
+        path = os.path.join(LARGE_FILE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in files)
+    for _, size, path in sorted(files):
+        if total <= LARGE_FILE_DIR_MAX_BYTES:
+            break
+        if path in in_use or path.endswith(".part"):
+            continue
+        try:
+            os.remove(path)
+            total -= size
+            logger.info("Evicted download %s (%d bytes)", path, size)
+        except OSError:
+            pass
+
+
+def _local_path(file_url: str, dataset_id: str) -> str:
+    """
+    Remote files are streamed to disk once so DuckDB can scan them without holding them in memory.
+    Downloads are named by fingerprint, or by URL (reused for UNVALIDATED_DOWNLOAD_TTL_SECONDS)
+    when the server sends no validator; each destination has its own download lock.
+    """
+    if not _is_remote(file_url):
+        return file_url
+    extension = os.path.splitext(file_url.split("?")[0])[1].lower()
+    name = dataset_id or "url-" + hashlib.sha256(file_url.encode("utf-8")).hexdigest()
+    path = os.path.join(LARGE_FILE_DIR, f"{name}{extension}")
+    with _download_locks_lock:
+        # The lock lives as long as someone holds or waits for it, so a path never has two
+        download_lock = _download_locks.setdefault(path, [threading.Lock(), 0])
+        download_lock[1] += 1
+    try:
+        with download_lock[0]:
+            if not _is_fresh(path, dataset_id):
+                _download(file_url, path)
+                _prune_downloads(keep=path)
+    finally:
+        with _download_locks_lock:
+            download_lock[1] -= 1
+            if not download_lock[1]:
+                del _download_locks[path]
+    return path
+
+
+def _download(file_url: str, path: str):
+    os.makedirs(LARGE_FILE_DIR, exist_ok=True)
+    # A unique partial file, so an interrupted or concurrent download never leaves a mixed copy
+    fd, tmp_path = tempfile.mkstemp(dir=LARGE_FILE_DIR, suffix=".part")
+    try:
+        with urllib.request.urlopen(file_url) as resp, os.fdopen(fd, "wb") as out:
+            shutil.copyfileobj(resp, out, length=8 * 1024 * 1024)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _open(file_url: str, dataset_id: str):
+    path = _local_path(file_url, dataset_id)
+    scan = FileScan(path, "parquet" if path.lower().endswith(".parquet") else "csv")
+    sample_df = get_engine("duckdb").execute(
+        scan, f"SELECT * FROM df LIMIT {LARGE_FILE_SAMPLE_ROWS}", table_name="df", dataset_id=dataset_id
+    )
+    return scan, sample_df
+
+
+def open_large_dataset(file_url: str):
+    """
+    Prepare a large file for out-of-core querying.
+    Returns (dataset_id, scan, sample_df): scan is passed to execute_sql_query in place of a
+    DataFrame, and sample_df (the first LARGE_FILE_SAMPLE_ROWS rows) is used for profiling.
+    """
+    # Hashing a multi-gigabyte file on every request would defeat the point; use size + mtime
+    dataset_id = dataset_fingerprint(file_url, hash_content=False)
+    if dataset_id is None:
+        return (None, *_open(file_url, None))
+    return (dataset_id, *_samples.get_or_create(dataset_id, lambda: _open(file_url, dataset_id)))
@@ -0,0 +1,151 @@
+# llm_cache.py
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "False") == "True"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(tempfile.gettempdir(), "hynox_llm_cache.sqlite3"))
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10_000))
+EVICTION_INTERVAL = 100  # Run eviction every N writes rather than on each one
+
+
+def normalize_prompt(prompt: str) -> str:
+    # The agents build prompts from indented triple-quoted strings; whitespace carries no meaning
+    return " ".join(prompt.split())
+
+
+def cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    SQLite-backed cache of model responses keyed on (model, normalized prompt).
+    Entries expire after ttl_seconds; beyond max_entries the least recently used are dropped.
+    The database file is shared by every worker process on the host.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        with self._connect() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS llm_responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    latency REAL NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS llm_responses_accessed ON llm_responses (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        # A connection per call keeps the cache safe to use from any request thread
+        con = sqlite3.connect(self.path, timeout=5)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def get(self, model: str, prompt: str):
+        key = cache_key(model, prompt)
+        now = time.time()
+        with self._connect() as con:
+            row = con.execute(
+                "SELECT response, latency FROM llm_responses WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is not None:
+                con.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.latency_saved += row[1]
+        return row[0]
+
+    def put(self, model: str, prompt: str, response: str, latency: float):
+        now = time.time()
+        with self._connect() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO llm_responses VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key(model, prompt), model, response, latency, now, now),
+            )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICTION_INTERVAL == 0
+        if evict:
+            self.evict()
+
+    def evict(self):
+        with self._connect() as con:
+            con.execute("DELETE FROM llm_responses WHERE created_at <= ?", (time.time() - self.ttl_seconds,))
+            con.execute("""
+                DELETE FROM llm_responses WHERE key IN (
+                    SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_seconds": round(self.latency_saved, 3),
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """Return the process-wide cache, or None when LLM_CACHE_ENABLED is off."""
+    global _cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+    return _cache
+
+
+def cached_generate(model: str, prompt: str, generate) -> str:
+    """
+    Return the cached response for (model, prompt), or call generate() and cache its text.
+    Cache hits never reach the network.
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return generate()
+
+    cached = cache.get(model, prompt)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    text = generate()
+    if text is not None:
+        cache.put(model, prompt, text, time.perf_counter() - start)
+    return text
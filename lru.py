@@ -0,0 +1,174 @@
+# lru.py
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used map behind the per-dataset caches. It is bounded by entry
+    count (max_entries), by total size (max_bytes, with each entry's size given to put), or
+    both; the newest entry is always kept. Evicted values are passed to on_evict outside the lock.
+    get_or_create builds a missing value outside the cache lock, under a lock of its own key,
+    so building one entry neither blocks lookups of the others nor runs twice.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None, on_evict=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._creating = {}  # key -> [lock held while its value is created, threads holding or awaiting it]
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISSING
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def get(self, key, default=None):
+        """Return the value for key and mark it recently used, or default."""
+        with self._lock:
+            value = self._lookup(key)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def _over_budget(self) -> bool:
+        if len(self._entries) <= 1:
+            return False
+        return (self.max_entries is not None and len(self._entries) > self.max_entries) or \
+            (self.max_bytes is not None and self.current_bytes > self.max_bytes)
+
+    def _insert(self, key, value, nbytes: int) -> list:
+        """Store the entry and return the evicted values; the caller holds the lock."""
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (value, nbytes)
+        self.current_bytes += nbytes
+        evicted = []
+        while self._over_budget():
+            _, (evicted_value, evicted_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_bytes
+            self.evictions += 1
+            evicted.append(evicted_value)
+        return evicted
+
+    def _evicted(self, values: list):
+        if self._on_evict is not None:
+            for value in values:
+                self._on_evict(value)
+
+    def put(self, key, value, nbytes: int = 0):
+        with self._lock:
+            evicted = self._insert(key, value, nbytes)
+        self._evicted(evicted)
+
+    def resize(self, key, value, nbytes: int) -> bool:
+        """Set the size of key's entry if it still holds value (e.g. after the value grew)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] is not value:
+                return False
+            evicted = self._insert(key, value, nbytes)
+        self._evicted(evicted)
+        return True
+
+    def get_or_create(self, key, create, size=None):
+        """
+        Return the value for key, building it with create() (and sizing it with size(value)) if
+        missing. A value larger than max_bytes is returned without being stored.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            # The key's lock lives as long as someone holds or waits for it
+            creating = self._creating.setdefault(key, [threading.Lock(), 0])
+            creating[1] += 1
+        evicted = []
+        try:
+            with creating[0]:
+                with self._lock:
+                    value = self._lookup(key)
+                if value is not _MISSING:
+                    # Created by another thread while this one waited
+                    return value
+                value = create()
+                nbytes = size(value) if size is not None else 0
+                if self.max_bytes is None or nbytes <= self.max_bytes:
+                    with self._lock:
+                        evicted = self._insert(key, value, nbytes)
+        finally:
+            with self._lock:
+                creating[1] -= 1
+                if not creating[1]:
+                    del self._creating[key]
+        self._evicted(evicted)
+        return value
+
+    def pop(self, key, default=None):
+        """Remove key and return its value (on_evict is not called), or default."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return default
+            self.current_bytes -= entry[1]
+            return entry[0]
+
+    def pop_where(self, predicate) -> list:
+        """Remove every entry whose key matches predicate and return their values."""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            entries = [self._entries.pop(key) for key in keys]
+            self.current_bytes -= sum(nbytes for _, nbytes in entries)
+        return [value for value, _ in entries]
+
+    def oldest(self):
+        """(key, value) of the least recently used entry, without marking it used; None when empty."""
+        with self._lock:
+            if not self._entries:
+                return None
+            key, (value, _) = next(iter(self._entries.items()))
+            return key, value
+
+    def values(self) -> list:
+        with self._lock:
+            return [value for value, _ in self._entries.values()]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
@@ -1,43 +1,140 @@
-import pandas as pd
-from pandasql import sqldf
 import duckdb
+import pandas as pd
+from rollups import get_rollups
+from sql_engines import SQL_ENGINE, FileScan, SQLTimeoutError, get_engine
+from sql_guard import (SQL_ROW_LIMIT, SQL_TIMEOUT_SECONDS, SQLGuardError, check_cost, check_statement, check_tables,
+                       with_row_limit)
+from stage_pool import result_or_default, submit
+from telemetry import RESULT_ROWS, SQL_QUERIES, annotate, get_logger, span
+
+logger = get_logger("process_sql")
+
+
+def _engine_for(df):
+    # Only DuckDB can scan a file in place
+    return get_engine("duckdb" if isinstance(df, FileScan) else SQL_ENGINE)
+
+
+def register_dataset(df, table_name: str = "df", dataset_id: str = None):
+    """Register df with the engine execute_sql_query will use for it, without running a query."""
+    _engine_for(df).register(dataset_id, df, table_name=table_name)
+
+
+def _rollup_query(engine, statement: str, table_name: str, dataset_id: str):
+    """(rollup_sql, rollup_name, tables) answering statement from one of the dataset's rollups, or None."""
+    rollup_set = get_rollups(dataset_id) if engine.name == "duckdb" else None
+    rewritten = rollup_set.rewrite(statement, table_name) if rollup_set is not None else None
+    if rewritten is None:
+        return None
+    check_tables(rewritten[0], rollup_set.tables)
+    return (*rewritten, rollup_set.tables)
+
+
+def _check_cost(engine, df, statement: str, table_name: str, dataset_id: str, params):
+    plan = engine.explain(df, statement, table_name=table_name, dataset_id=dataset_id, params=params)
+    if plan is None:
+        return None
+    table_rows = len(df) if isinstance(df, pd.DataFrame) else 0
+    return check_cost(plan, table_rows=table_rows)
+
 
-def execute_sql_query(df: pd.DataFrame, sql_query: str, table_name: str = "df") -> pd.DataFrame:
+def _run_guarded(engine, df, sql_query: str, table_name: str, dataset_id: str, params, timeout: float) -> pd.DataFrame:
+    with span("sql.validate", engine=engine.name) as attributes:
+        statement = check_statement(sql_query, allowed_tables=(table_name,))
+        statement, limit_injected = with_row_limit(statement)
+        # Aggregates by a category or month can read a rollup of a few thousand rows instead of the
+        # table; a rollup's size is bounded, so it needs no cost check
+        rollup = _rollup_query(engine, statement, table_name, dataset_id)
+        if rollup is None:
+            attributes["estimated_rows"] = _check_cost(engine, df, statement, table_name, dataset_id, params)
+        else:
+            attributes["rollup"] = rollup[1]
+
+    query_result = None
+    if rollup is not None:
+        rollup_sql, rollup_name, tables = rollup
+        with span("sql", engine=engine.name, rollup=rollup_name) as attributes:
+            try:
+                query_result = engine.execute(df, rollup_sql, table_name=table_name, dataset_id=dataset_id,
+                                              params=params, timeout=timeout, tables=tables)
+                attributes["rows"] = len(query_result)
+                annotate(rollup=rollup_name)
+            except duckdb.Error as e:
+                logger.warning("⚠️ Rollup query failed, scanning the dataset instead: %s", e)
+                attributes["error"] = type(e).__name__
+        if query_result is None:
+            _check_cost(engine, df, statement, table_name, dataset_id, params)
+
+    if query_result is None:
+        with span("sql", engine=engine.name) as attributes:
+            query_result = engine.execute(
+                df, statement, table_name=table_name, dataset_id=dataset_id, params=params, timeout=timeout
+            )
+            attributes["rows"] = len(query_result)
+
+    query_result = query_result.round(2)
+    if limit_injected and len(query_result) > SQL_ROW_LIMIT:
+        query_result = query_result.head(SQL_ROW_LIMIT)
+        query_result.attrs["row_limit_reached"] = True
+    return query_result
+
+
+def execute_sql_query(df, sql_query: str, table_name: str = "df", dataset_id: str = None, params: list = None,
+                      repair=None, timeout: float = SQL_TIMEOUT_SECONDS):
     """
-    Executes an SQL query on a Pandas DataFrame using pandasql.
-    If pandasql fails, automatically retries with DuckDB.
+    Executes an SQL query on a Pandas DataFrame using the configured engine (SQL_ENGINE).
+    Before running, the SQL is parsed and must be a single read-only SELECT over the dataset,
+    DuckDB's EXPLAIN estimates must stay under SQL_MAX_ESTIMATED_ROWS, and queries without a
+    LIMIT are capped at SQL_ROW_LIMIT rows. Execution is interrupted after timeout seconds.
+    Aggregates a materialized rollup can answer (see rollups.py) run on the rollup instead.
 
     Parameters:
-    - df: Pandas DataFrame to query.
+    - df: Pandas DataFrame to query, or a FileScan for files queried in place by DuckDB.
     - sql_query: SQL query string.
     - table_name: Table name to reference in the SQL (default: 'df').
+    - dataset_id: Dataset fingerprint; lets the engine reuse its connection across requests.
+    - params: Values for '?' placeholders in sql_query.
+    - repair: Optional repair(sql, error) -> sql, called once when the SQL fails to parse or run
+      (not for rejections or timeouts); the repaired SQL goes through the same checks.
 
     Returns:
-    - Pandas DataFrame with query result.
+    - Pandas DataFrame with query result (possibly empty), or None if execution failed.
+      attrs["sql"] holds the SQL that ran and attrs["row_limit_reached"] marks a capped result.
     """
-    try:
-        # --- Try with pandasql first ---
-        query_result = sqldf(sql_query, {table_name: df})
-        if not query_result.empty:
-            print("✅ Query executed successfully with pandasql.")
-            query_result = query_result.round(2)
-            return query_result
+    engine = _engine_for(df)
+
+    for attempt in range(2):
+        try:
+            query_result = _run_guarded(engine, df, sql_query, table_name, dataset_id, params, timeout)
+        except SQLGuardError as e:
+            outcome, error, repairable = ("error" if e.kind == "parse" else "rejected"), e, e.kind == "parse"
+        except SQLTimeoutError as e:
+            outcome, error, repairable = "timeout", e, False
+        except Exception as e:
+            # Binder and runtime errors: usually a wrong column or function name
+            outcome, error, repairable = "error", e, True
         else:
-            print("⚠️ Empty result from pandasql — trying DuckDB.")
-    except Exception as e:
-        print(f"⚠️ pandasql failed: {e}\nSwitching to DuckDB...")
-
-    # --- Fallback: DuckDB ---
-    try:
-        duckdb.register(table_name, df)
-        query_result = duckdb.sql(sql_query).df()
-        if not query_result.empty:
-            print("✅ Query executed successfully with DuckDB.")
-            query_result = query_result.round(2)
+            # An empty result is a valid answer
+            SQL_QUERIES.labels(engine=engine.name, outcome="ok").inc()
+            RESULT_ROWS.observe(len(query_result))
+            annotate(sql_engine=engine.name, rows_returned=len(query_result),
+                     row_limit_reached=query_result.attrs.get("row_limit_reached", False))
+            logger.debug("✅ Query executed successfully with %s.", engine.name)
+            query_result.attrs["sql"] = sql_query
             return query_result
-        else:
-            print("⚠️ Empty result from DuckDB")
-            print("Both PandaSql and DuckDB Failed to Execute the query")
-    except Exception as e:
-        print(f"❌ DuckDB also failed: {e}")
-        return pd.DataFrame()
+
+        SQL_QUERIES.labels(engine=engine.name, outcome=outcome).inc()
+        logger.warning("⚠️ %s %s: %s", engine.name, "rejected the query" if outcome == "rejected" else "failed", error)
+        if attempt > 0 or not repairable or repair is None:
+            break
+        # The repair is a model call: a failure or timeout leaves the original error as the answer
+        repaired = result_or_default(submit(repair, sql_query, str(error)), None, stage="sql repair")
+        if not repaired or repaired.strip() == sql_query.strip():
+            break
+        logger.info("Retrying with repaired SQL: %s", repaired)
+        annotate(sql_repaired=True)
+        sql_query = repaired
+
+    annotate(sql_engine=engine.name, rows_returned=None, sql_error=str(error))
+    logger.error("❌ Query could not be executed")
+    return None
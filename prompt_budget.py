@@ -0,0 +1,128 @@
+# prompt_budget.py
+import os
+
+from lru import LRUCache
+from schema_index import SchemaIndex
+from telemetry import PROMPT_TOKENS, annotate, get_logger
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 3000))      # Tokens of schema (columns and summary) per prompt
+PROMPT_DETAIL_COLUMNS = int(os.getenv("PROMPT_DETAIL_COLUMNS", 25))    # Most relevant columns summarized in full
+PROMPT_VALUE_MAX_CHARS = int(os.getenv("PROMPT_VALUE_MAX_CHARS", 48))  # Longer values and samples are cut
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", 32))
+CHARS_PER_TOKEN = 4  # Rough size of a token in schema text; no tokenizer is needed to stay near the budget
+
+logger = get_logger("prompt_budget")
+
+_prompts = LRUCache(max_entries=PROMPT_CACHE_SIZE)  # dataset_id -> SchemaPrompt
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _truncate(value):
+    if isinstance(value, str) and len(value) > PROMPT_VALUE_MAX_CHARS:
+        return value[:PROMPT_VALUE_MAX_CHARS - 1] + "…"
+    return value
+
+
+def _detail(info: dict) -> dict:
+    return {key: [_truncate(v) for v in value] if isinstance(value, list) else _truncate(value)
+            for key, value in info.items()}
+
+
+class SchemaPrompt:
+    """
+    The schema part of the agents' prompts for one dataset: the column list and the dataset
+    summary, cut to a token budget. Every column's summary line is rendered once; per question
+    only the selection is redone. Columns are ranked by the schema index's match against the
+    question: the top PROMPT_DETAIL_COLUMNS get their full (truncated) summary, the rest only
+    their type, and once the budget runs out the remaining columns are named but not described.
+    Selected lines keep the dataset's column order, so prompts for similar questions stay identical.
+    """
+
+    def __init__(self, dataset_columns: list, dataset_summary: dict = None, schema_index: SchemaIndex = None,
+                 budget: int = PROMPT_TOKEN_BUDGET):
+        self.dataset_columns = list(dataset_columns)
+        self.schema_index = schema_index
+        self.budget = budget
+        summary = dataset_summary or {}
+        self._names = {col: estimate_tokens(f"{col}, ") for col in self.dataset_columns}
+        self._full = {}   # col -> (line, tokens)
+        self._brief = {}  # col -> (line, tokens)
+        for col in self.dataset_columns:
+            if col in summary:
+                self._full[col] = self._line(col, _detail(summary[col]))
+                self._brief[col] = self._line(col, {"type": summary[col].get("type")})
+
+        self.columns_text = ", ".join(self.dataset_columns)
+        self.summary_text = "\n".join(self._full[col][0] for col in self.dataset_columns if col in self._full)
+        self._names_tokens = sum(self._names.values())
+        self._everything_fits = self._names_tokens <= budget // 2 and len(self._full) <= PROMPT_DETAIL_COLUMNS and \
+            self._names_tokens + sum(tokens for _, tokens in self._full.values()) <= budget
+
+    @staticmethod
+    def _line(col: str, info: dict):
+        line = f"- {col}: {info}"
+        return line, estimate_tokens(line + "\n")
+
+    def _ranked(self, question: str) -> list:
+        if self.schema_index is None or not question:
+            return self.dataset_columns
+        scores = self.schema_index.column_scores(question)
+        order = {col: i for i, col in enumerate(self.dataset_columns)}
+        return sorted(self.dataset_columns, key=lambda col: (-scores.get(col, 0.0), order[col]))
+
+    def _columns(self, ranked: list, budget: int):
+        """(columns text, tokens used): every column if the names fit, else the most relevant ones."""
+        if self._names_tokens <= budget:
+            return self.columns_text, self._names_tokens
+        kept, used = set(), 0
+        for col in ranked:
+            if used + self._names[col] > budget:
+                break
+            kept.add(col)
+            used += self._names[col]
+        text = ", ".join(col for col in self.dataset_columns if col in kept)
+        return f"{text} (and {len(self.dataset_columns) - len(kept)} more columns)", used
+
+    def columns(self, question: str = None) -> str:
+        """The column list, within the whole budget."""
+        if self._names_tokens <= self.budget:
+            return self.columns_text
+        return self._columns(self._ranked(question), self.budget)[0]
+
+    def build(self, question: str = None):
+        """Return (columns text, summary text) for prompts about question, within the budget."""
+        if self._everything_fits:
+            return self.columns_text, self.summary_text
+        ranked = self._ranked(question)
+        columns_text, used = self._columns(ranked, self.budget // 2)
+        lines = {}
+        for rank, col in enumerate(col for col in ranked if col in self._full):
+            candidates = [self._full[col], self._brief[col]] if rank < PROMPT_DETAIL_COLUMNS else [self._brief[col]]
+            for line, tokens in candidates:
+                if used + tokens <= self.budget:
+                    lines[col] = line
+                    used += tokens
+                    break
+        summary_text = "\n".join(lines[col] for col in self.dataset_columns if col in lines)
+        if len(lines) < len(self._full):
+            summary_text += f"\n({len(self._full) - len(lines)} more columns are not summarized)"
+        return columns_text, summary_text
+
+
+def get_schema_prompt(dataset_columns: list, dataset_summary: dict = None, schema_index: SchemaIndex = None,
+                      dataset_id: str = None) -> SchemaPrompt:
+    """Return the cached SchemaPrompt for a dataset fingerprint, building it on first use."""
+    if dataset_id is None:
+        return SchemaPrompt(dataset_columns, dataset_summary, schema_index)
+    return _prompts.get_or_create(dataset_id, lambda: SchemaPrompt(dataset_columns, dataset_summary, schema_index))
+
+
+def record_prompt(stage: str, prompt: str):
+    """Log and export the estimated size of a prompt before it is sent."""
+    tokens = estimate_tokens(prompt)
+    PROMPT_TOKENS.labels(stage=stage).observe(tokens)
+    annotate(**{f"prompt_tokens_{stage}": tokens})
+    logger.debug("Prompt for %s: %d chars, ~%d tokens", stage, len(prompt), tokens)
@@ -1,57 +1,158 @@
 import json
-from google import genai
+import os
+import re
+import time
+from google.genai import types
 import pandas as pd
+from profiler import profile_dataset
+from llm_cache import cached_generate
+from gemini_pool import get_client_pool
+from stage_pool import STAGE_TIMEOUT_SECONDS, submit, result_or_default
+from schema_index import SCHEMA_MATCH_THRESHOLD, SchemaIndex, get_schema_index, record_relevance_decision
+from prompt_budget import SchemaPrompt, get_schema_prompt, record_prompt
+from sql_engines import get_engine
+from sql_templates import compile_question
+from visualization import CHART_TYPES
+from telemetry import annotate, get_logger, span, traced
+
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "staged")  # "staged" or "fused"
+BATCH_PLAN_MAX_QUESTIONS = int(os.getenv("BATCH_PLAN_MAX_QUESTIONS", 12))  # Questions planned per model call
+# A batch question retried through the staged agents makes up to four model calls in a row
+BATCH_RETRY_TIMEOUT_SECONDS = float(os.getenv("BATCH_RETRY_TIMEOUT_SECONDS", 4 * STAGE_TIMEOUT_SECONDS))
+
+logger = get_logger("query_processing")
+
+
+def sql_dialect():
+    """(name, date functions to use) of the dialect SQL_ENGINE runs, for the SQL-writing prompts."""
+    engine = get_engine()
+    return engine.dialect, engine.dialect_functions
+
 
 class GeminiLLM:
-    def __init__(self, api_key: str, model: str = "gemini-2.5-flash"):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(self, api_key: str = None, model: str = "gemini-2.5-flash"):
+        # Calls are scheduled across every configured key by the shared client pool
+        self.pool = get_client_pool(api_key)
         self.model = model
 
     def generate(self, prompt: str) -> str: 
-        response = self.client.models.generate_content(model=self.model, contents=prompt)
-        return response.text.strip()
+        text = cached_generate(
+            self.model, prompt,
+            lambda: self.pool.generate_content(model=self.model, contents=prompt).text
+        )
+        return text.strip()
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        """Generate a response constrained to JSON matching response_schema."""
+        config = types.GenerateContentConfig(response_mime_type="application/json", response_schema=response_schema)
+        text = cached_generate(
+            f"{self.model}:json:{json.dumps(response_schema, sort_keys=True)}", prompt,
+            lambda: self.pool.generate_content(model=self.model, contents=prompt, config=config).text
+        )
+        return text.strip()
+
+
+def _history_text(history: list) -> str:
+    """Earlier turns of a session conversation, oldest first, for follow-up questions."""
+    lines = []
+    for turn in history or []:
+        line = f'- Question: "{turn["question"]}"'
+        if turn.get("refined_query"):
+            line += f' | Refined: "{turn["refined_query"]}"'
+        if turn.get("sql"):
+            line += f" | SQL: {turn['sql']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def _clean_sql(sql_query_text: str) -> str:
+    # Cleanup any extra markdown or characters
+    return (
+        sql_query_text.replace("```sql", "")
+        .replace("```", "")
+        .replace("\n", " ")
+        .replace("\r", "")
+        .strip()
+    )
 
 
 class UserQueryCheckAgent:
-    def __init__(self, df: pd.DataFrame, dataset_columns: list, llm: GeminiLLM = None):
+    def __init__(self, df: pd.DataFrame, dataset_columns: list, llm: GeminiLLM = None, dataset_profile: dict = None,
+                 schema_index: SchemaIndex = None, schema_prompt: SchemaPrompt = None):
         self.df = df
         self.dataset_columns = dataset_columns
         self.llm = llm  # Optional LLM for enhanced query understanding
-
-    def is_valid_query(self, user_query: str) -> bool:
+        self.dataset_profile = dataset_profile or {}  # Shared column summary from profiler.profile_dataset
+        self.schema_index = schema_index  # Per-dataset lexical index; answers most checks locally
+        # Token-budgeted column list for the prompt
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, self.dataset_profile, schema_index)
+
+    def _mentions_known_value(self, query_lower: str) -> bool:
+        for info in self.dataset_profile.values():
+            for value in info.get("unique_values", []):
+                value_text = str(value).strip().lower()
+                if value_text and re.search(rf"\b{re.escape(value_text)}\b", query_lower):
+                    return True
+        return False
+
+    def is_valid_query(self, user_query: str, history: list = None) -> bool:
         """
         Check if the user query is relevant to the dataset:
         - Uses dataset columns
         - If literal values are mentioned, they exist in dataset
+        history (earlier session turns) lets the model accept follow-ups such as "and by month?"
         Returns True if valid, False otherwise
         """
+        if self.schema_index is not None:
+            confidence, _ = self.schema_index.match(user_query)
+            if confidence >= SCHEMA_MATCH_THRESHOLD:
+                record_relevance_decision("local_accept")
+                return True
+            if not self.llm or not self.schema_index.content_tokens(user_query):
+                # Nothing but stopwords (or no model to ask): not a question about the data
+                record_relevance_decision("local_reject")
+                return False
+            record_relevance_decision("llm")
+            return self._ask_llm(user_query, history)
+
         query_lower = user_query.lower()
         # Check columns
-        if not any(col.lower() in query_lower for col in self.dataset_columns):
-            # Optional: use LLM to interpret natural language reference to columns
+        if not any(col.lower() in query_lower for col in self.dataset_columns) and not self._mentions_known_value(query_lower):
             if self.llm:
-                prompt = f"""
+                return self._ask_llm(user_query, history)
+            return False
+
+        return True
+
+    def _ask_llm(self, user_query: str, history: list = None) -> bool:
+        # Use LLM to interpret natural language reference to columns
+        prompt = f"""
                 Task: Determine if the user query is relevant to the dataset columns.
 
-                Dataset columns: {', '.join(self.dataset_columns)}
+                Dataset columns: {self.schema_prompt.columns(user_query)}
 
                 User query: "{user_query}"
 
                 Return ONLY "True" if query is relevant, "False" otherwise.
                 """
-                llm_response = self.llm.generate(prompt).strip().lower()
-                return llm_response == "true"
-            return False
-
-        return True
+        if history:
+            prompt += f"""
+                Earlier questions in this conversation (the user query may follow up on them):
+                {_history_text(history)}
+                """
+        record_prompt("relevance", prompt)
+        llm_response = self.llm.generate(prompt).strip().lower()
+        return llm_response == "true"
 
 
 # Query Refinement Agent
 class RefineQueryAgent:
-    def __init__(self, llm: "GeminiLLM"):
+    def __init__(self, llm: "GeminiLLM", schema_prompt: SchemaPrompt = None):
         self.llm = llm
+        self.schema_prompt = schema_prompt  # Token-budgeted column list; dataset_columns are listed in full without it
 
-    def refine_query(self, user_query: str, focus_point: str = None, dataset_columns: list = None) -> str:
+    def refine_query(self, user_query: str, focus_point: str = None, dataset_columns: list = None,
+                     history: list = None) -> str:
         prompt = f"""
 You are an intelligent query refinement AI.
 
@@ -59,8 +160,13 @@ Base query: "{user_query}"
 """
         if focus_point:
             prompt += f"Focus point: {focus_point}\n"
-        if dataset_columns:
+        if self.schema_prompt is not None:
+            prompt += f"Dataset columns: {self.schema_prompt.columns(user_query)}\n"
+        elif dataset_columns:
             prompt += f"Dataset columns: {', '.join(dataset_columns)}\n"
+        if history:
+            prompt += "Conversation so far (oldest first):\n" + _history_text(history) + "\n"
+            prompt += "If the base query follows up on the conversation, refine it into a standalone query.\n"
 
         prompt += """
                 Focus Point: 
@@ -75,15 +181,17 @@ Base query: "{user_query}"
                 - Return only the refined query text.
                 - No explanations, commentary, or verbose descriptions.
                 """
+        record_prompt("refine", prompt)
         return self.llm.generate(prompt)
 
 
 
 # SQL Check Agent
 class SQLCheckAgent:
-    def __init__(self, llm: GeminiLLM, dataset_columns: list):
+    def __init__(self, llm: GeminiLLM, dataset_columns: list, schema_prompt: SchemaPrompt = None):
         self.llm = llm
         self.dataset_columns = dataset_columns
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns)
 
     def check_query_status(self, refined_query: str, focus_point: str = None, notes: str = None) -> dict:
         """
@@ -107,10 +215,11 @@ class SQLCheckAgent:
 
                 Notes:
                 - Refined Query: "{refined_query}"
-                - Dataset Columns: {', '.join(self.dataset_columns)}
+                - Dataset Columns: {self.schema_prompt.columns(refined_query)}
                 {notes or ""}
                 """
 
+        record_prompt("sql_check", prompt)
         llm_response = self.llm.generate(prompt).strip()
 
         try:
@@ -119,7 +228,7 @@ class SQLCheckAgent:
             if "status" in status_json:
                 return status_json
         except Exception as e:
-            print("Failed to parse LLM response:", llm_response, e)
+            logger.warning("Failed to parse LLM response: %r (%s)", llm_response, e)
 
         # Fallback if LLM fails
         return {"status": False}
@@ -127,31 +236,21 @@ class SQLCheckAgent:
 
 
 class SQLGeneratorAgent:
-    def __init__(self, llm: "GeminiLLM", dataset_columns: list, df: pd.DataFrame, table_name: str):
+    def __init__(self, llm: "GeminiLLM", dataset_columns: list, df: pd.DataFrame, table_name: str, dataset_summary: dict = None,
+                 schema_prompt: SchemaPrompt = None):
         self.llm = llm
         self.dataset_columns = dataset_columns
         self.df = df
         self.table_name = table_name
-        self.dataset_summary = self._summarize_dataset(df)  # <-- add this
+        self.dataset_summary = dataset_summary if dataset_summary is not None else self._summarize_dataset(df)
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, self.dataset_summary)
 
     def _summarize_dataset(self, df: pd.DataFrame) -> dict:
-        summary = {}
-        for col in df.columns:
-            col_data = df[col].dropna()
-            if pd.api.types.is_datetime64_any_dtype(col_data):
-                summary[col] = {"type": "datetime", "min": str(col_data.min().date()), "max": str(col_data.max().date())}
-            elif pd.api.types.is_numeric_dtype(col_data):
-                summary[col] = {"type": "numeric", "min": float(col_data.min()), "max": float(col_data.max())}
-            elif col_data.nunique() < 15:
-                summary[col] = {"type": "categorical", "unique_values": col_data.unique().tolist()}
-            else:
-                sample_values = col_data.sample(min(3, len(col_data))).tolist()
-                summary[col] = {"type": "text", "sample_values": sample_values}
-        return summary
-
-    def generate_sql(self, refined_query: str) -> dict:
-        columns_text = ", ".join(self.dataset_columns)
-        summary_text = "\n".join([f"- {col}: {info}" for col, info in self.dataset_summary.items()])
+        return profile_dataset(df)
+
+    def generate_sql(self, refined_query: str, history: list = None) -> dict:
+        columns_text, summary_text = self.schema_prompt.build(refined_query)
+        dialect, dialect_functions = sql_dialect()
 
         prompt = f"""
                 You are an expert SQL generator.
@@ -169,7 +268,7 @@ class SQLGeneratorAgent:
                 - Ensure the result includes essential values to answer the query
                 - Use only values or ranges actually present in the dataset
                 - Do NOT assume any external dates, times, or values
-                - SQL must be compatible with SQLite / pandasql
+                - SQL must use the {dialect} dialect: e.g. {dialect_functions}
 
                 Restrictions:
                 - Return ONLY the SQL query text
@@ -182,21 +281,61 @@ class SQLGeneratorAgent:
                 Dataset Summary:
                 {summary_text}
                 """
+        if history:
+            prompt += f"""
+                Earlier questions and SQL in this conversation (reuse their filters and groupings
+                when the question builds on them):
+                {_history_text(history)}
+                """
 
-
+        record_prompt("sql_generation", prompt)
         sql_query_text = self.llm.generate(prompt).strip()
+        return {"SQL": _clean_sql(sql_query_text)}
 
-        # Cleanup any extra markdown or characters
-        sql_only = (
-            sql_query_text.replace("```sql", "")
-            .replace("```", "")
-            .replace("\n", " ")
-            .replace("\r", "")
-            .strip()
-        )
 
-        return {"SQL": sql_only}
 
+class SQLRepairAgent:
+    """Makes one targeted fix to SQL the engine could not parse or bind, given the engine's error."""
+
+    def __init__(self, llm: GeminiLLM, dataset_columns: list, table_name: str, dataset_summary: dict = None,
+                 schema_prompt: SchemaPrompt = None):
+        self.llm = llm
+        self.dataset_columns = dataset_columns
+        self.table_name = table_name
+        self.dataset_summary = dataset_summary or {}
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, self.dataset_summary)
+
+    def repair(self, sql_query: str, error: str) -> str:
+        # The failed SQL names the columns that matter
+        columns_text, summary_text = self.schema_prompt.build(sql_query)
+        dialect, dialect_functions = sql_dialect()
+        prompt = f"""
+                You are an expert SQL fixer.
+
+                Task:
+                The SQL query below failed on {dialect}. Fix it so it runs and still answers the same question.
+
+                SQL:
+                {sql_query}
+
+                Error:
+                {error}
+
+                Dataset Table:
+                {self.table_name}
+
+                Restrictions:
+                - Return ONLY the corrected SQL query text, as a single line ending with a semicolon
+                - A single read-only SELECT on the dataset table; use only these columns: {columns_text}
+                - Use {dialect} functions: {dialect_functions}
+                - No explanations, comments, markdown, JSON, or extra words
+
+                Notes:
+                Dataset Summary:
+                {summary_text}
+                """
+        record_prompt("sql_repair", prompt)
+        return _clean_sql(self.llm.generate(prompt).strip())
 
 
 # SQL Generator Agent
@@ -288,42 +427,413 @@ class SQLGeneratorAgent:
 
 
 
-# Main processing function
-def process_query(api_key: str, dataset_columns: list, df: pd.DataFrame, user_query: str):
-    gemini_llm = GeminiLLM(api_key=api_key)
-    user_query_checker = UserQueryCheckAgent(df=df, dataset_columns=dataset_columns, llm=gemini_llm)
-    if not user_query_checker.is_valid_query(user_query):
+# Fused Planner Agent
+class FusedPlannerAgent:
+    """
+    Does the work of the check, refine, SQL check and SQL generator agents (plus chart choice)
+    in a single structured-output call. plan() returns None when the response is unusable,
+    so the caller can fall back to the staged agents.
+    """
+    RESPONSE_SCHEMA = {
+        "type": "OBJECT",
+        "properties": {
+            "relevant": {"type": "BOOLEAN"},
+            "refined_query": {"type": "STRING"},
+            "feasible": {"type": "BOOLEAN"},
+            "sql": {"type": "STRING"},
+            "chart_type": {"type": "STRING", "enum": CHART_TYPES},
+        },
+        "required": ["relevant", "refined_query", "feasible", "sql", "chart_type"],
+    }
+
+    def __init__(self, llm: GeminiLLM, dataset_columns: list, table_name: str, dataset_summary: dict,
+                 schema_prompt: SchemaPrompt = None):
+        self.llm = llm
+        self.dataset_columns = dataset_columns
+        self.table_name = table_name
+        self.dataset_summary = dataset_summary
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, dataset_summary)
+
+    def plan(self, user_query: str, history: list = None):
+        columns_text, summary_text = self.schema_prompt.build(user_query)
+        dialect, dialect_functions = sql_dialect()
+        prompt = f"""
+                You are a data analysis planner.
+
+                User query: "{user_query}"
+
+                Dataset Table:
+                {self.table_name}
+
+                Dataset Columns: {columns_text}
+
+                Task:
+                - relevant: whether the query is about the dataset
+                - refined_query: the query refined to its simplest form, one short phrase of at most ~10 words
+                - feasible: whether the refined query can be answered using only the dataset columns
+                - sql: a single {dialect} SQL query on the dataset table answering the refined query,
+                  ending with a semicolon, selecting only the columns needed (no SELECT *);
+                  an empty string when the query is not relevant or not feasible
+                - chart_type: the best visualization for the result, one of {CHART_TYPES}
+
+                Restrictions:
+                - Use only columns and values present in the dataset summary
+                - Do NOT assume any external dates, times, or values
+                - Use {dialect} functions: {dialect_functions}
+
+                Notes:
+                Dataset Summary:
+                {summary_text}
+                """
+        if history:
+            prompt += f"""
+                Earlier questions and SQL in this conversation (the user query may follow up on them;
+                the refined query must then be standalone):
+                {_history_text(history)}
+                """
+        record_prompt("fused_plan", prompt)
+        llm_response = self.llm.generate_json(prompt, self.RESPONSE_SCHEMA)
+
+        try:
+            plan = json.loads(llm_response)
+        except Exception as e:
+            logger.warning("Failed to parse fused plan: %r (%s)", llm_response, e)
+            return None
+        return _checked_plan(plan)
+
+
+def _checked_plan(plan):
+    """Return a planner's answer for one question with chart_type normalized, or None if it is unusable."""
+    if not isinstance(plan, dict) or not isinstance(plan.get("relevant"), bool) or not isinstance(plan.get("feasible"), bool):
+        logger.warning("Invalid fused plan: %r", plan)
+        return None
+    if plan["relevant"] and not isinstance(plan.get("refined_query"), str):
+        logger.warning("Invalid fused plan: %r", plan)
+        return None
+    if plan["relevant"] and plan["feasible"] and not (isinstance(plan.get("sql"), str) and plan["sql"].strip()):
+        logger.warning("Invalid fused plan: %r", plan)
+        return None
+    if plan.get("chart_type") not in CHART_TYPES:
+        plan["chart_type"] = None
+    return plan
+
+
+class BatchPlannerAgent:
+    """
+    FusedPlannerAgent for several questions about the same dataset: the schema and summary are
+    sent once and every question is planned in the same structured-output call.
+    plan() returns one plan per question, None where the answer for that question is unusable.
+    """
+    RESPONSE_SCHEMA = {
+        "type": "OBJECT",
+        "properties": {
+            "plans": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "index": {"type": "INTEGER"},
+                        **FusedPlannerAgent.RESPONSE_SCHEMA["properties"],
+                    },
+                    "required": ["index"] + FusedPlannerAgent.RESPONSE_SCHEMA["required"],
+                },
+            },
+        },
+        "required": ["plans"],
+    }
+
+    def __init__(self, llm: GeminiLLM, dataset_columns: list, table_name: str, dataset_summary: dict,
+                 schema_prompt: SchemaPrompt = None):
+        self.llm = llm
+        self.dataset_columns = dataset_columns
+        self.table_name = table_name
+        self.dataset_summary = dataset_summary
+        self.schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, dataset_summary)
+
+    def plan(self, user_queries: list) -> list:
+        # Columns are ranked against all the questions at once
+        columns_text, summary_text = self.schema_prompt.build(" ".join(user_queries))
+        questions_text = "\n".join(f'{i}. "{query}"' for i, query in enumerate(user_queries))
+        dialect, dialect_functions = sql_dialect()
+        prompt = f"""
+                You are a data analysis planner answering several independent questions about one dataset.
+
+                Questions:
+                {questions_text}
+
+                Dataset Table:
+                {self.table_name}
+
+                Dataset Columns: {columns_text}
+
+                Task: return one plan per question in "plans", with "index" set to the question's number:
+                - relevant: whether the question is about the dataset
+                - refined_query: the question refined to its simplest form, one short phrase of at most ~10 words
+                - feasible: whether the refined query can be answered using only the dataset columns
+                - sql: a single {dialect} SQL query on the dataset table answering the refined query,
+                  ending with a semicolon, selecting only the columns needed (no SELECT *);
+                  an empty string when the question is not relevant or not feasible
+                - chart_type: the best visualization for the result, one of {CHART_TYPES}
+
+                Restrictions:
+                - Use only columns and values present in the dataset summary
+                - Do NOT assume any external dates, times, or values
+                - Use {dialect} functions: {dialect_functions}
+                - Plan each question on its own; they do not follow up on each other
+
+                Notes:
+                Dataset Summary:
+                {summary_text}
+                """
+        record_prompt("batch_plan", prompt)
+        llm_response = self.llm.generate_json(prompt, self.RESPONSE_SCHEMA)
+
+        plans = [None] * len(user_queries)
+        try:
+            entries = json.loads(llm_response)["plans"]
+        except Exception as e:
+            logger.warning("Failed to parse batch plan: %r (%s)", llm_response, e)
+            return plans
+        for entry in entries if isinstance(entries, list) else []:
+            index = entry.get("index") if isinstance(entry, dict) else None
+            if isinstance(index, int) and 0 <= index < len(plans) and plans[index] is None:
+                plans[index] = _checked_plan(entry)
+        return plans
+
+
+def _plan_result(user_query: str, plan: dict) -> dict:
+    """process_query's result for a checked planner answer."""
+    if not plan["relevant"]:
         return {
             "original_query": user_query,
             "refined_query": None,
             "status": False,
             "sql_query": None
         }
-    refine_agent = RefineQueryAgent(llm=gemini_llm)
-    sql_check_agent = SQLCheckAgent(llm=gemini_llm, dataset_columns=dataset_columns)
+    if not plan["feasible"]:
+        return {
+            "original_query": user_query,
+            "refined_query": plan["refined_query"],
+            "status": False,
+            "sql_query": None
+        }
+    return {
+        "original_query": user_query,
+        "refined_query": plan["refined_query"],
+        "status": True,
+        "sql_query": {"SQL": _clean_sql(plan["sql"])},
+        "chart_type": plan["chart_type"]
+    }
+
+
+def _process_query_fused(gemini_llm: GeminiLLM, dataset_columns: list, user_query: str, dataset_profile: dict,
+                         history: list = None, schema_prompt: SchemaPrompt = None):
+    planner = FusedPlannerAgent(llm=gemini_llm, dataset_columns=dataset_columns, table_name="df", dataset_summary=dataset_profile,
+                                schema_prompt=schema_prompt)
+    plan = result_or_default(
+        submit(traced("agent.fused_plan", planner.plan), user_query, history), None, stage="fused plan"
+    )
+    if plan is None:
+        return None
+    return _plan_result(user_query, plan)
+
+
+def _process_query_staged(gemini_llm: GeminiLLM, dataset_columns: list, df: pd.DataFrame, user_query: str, dataset_profile: dict,
+                          schema_index: SchemaIndex = None, history: list = None, schema_prompt: SchemaPrompt = None):
+    """The staged agents as events: "refined_query" once the question is relevant and refined, then "result"."""
+    schema_prompt = schema_prompt or SchemaPrompt(dataset_columns, dataset_profile, schema_index)
+    user_query_checker = UserQueryCheckAgent(
+        df=df, dataset_columns=dataset_columns, llm=gemini_llm, dataset_profile=dataset_profile, schema_index=schema_index,
+        schema_prompt=schema_prompt
+    )
+    refine_agent = RefineQueryAgent(llm=gemini_llm, schema_prompt=schema_prompt)
+
+    # Refine speculatively while the relevance check runs; the refinement is discarded if the query is irrelevant
+    validity_future = submit(traced("agent.relevance", user_query_checker.is_valid_query), user_query, history)
+    refine_future = submit(
+        traced("agent.refine", refine_agent.refine_query), user_query, dataset_columns=dataset_columns, history=history
+    )
+
+    if not result_or_default(validity_future, False, stage="relevance check"):
+        refine_future.cancel()
+        yield "result", {
+            "original_query": user_query,
+            "refined_query": None,
+            "status": False,
+            "sql_query": None
+        }
+        return
+    sql_check_agent = SQLCheckAgent(llm=gemini_llm, dataset_columns=dataset_columns, schema_prompt=schema_prompt)
     sql_generator_agent = SQLGeneratorAgent(
         llm=gemini_llm,
         dataset_columns=dataset_columns,
         df=df,            # Pass the dataframe here
-        table_name="df"
+        table_name="df",
+        dataset_summary=dataset_profile,
+        schema_prompt=schema_prompt
     )
 
-    refined_query = refine_agent.refine_query(user_query, dataset_columns=dataset_columns)
-    status = sql_check_agent.check_query_status(refined_query)
+    refined_query = result_or_default(refine_future, user_query, stage="query refinement")
+    yield "refined_query", refined_query
+    status = result_or_default(
+        submit(traced("agent.sql_check", sql_check_agent.check_query_status), refined_query),
+        {"status": False}, stage="SQL check"
+    )
 
+    sql_query = None
     if status.get("status"):
-        sql_query = sql_generator_agent.generate_sql(refined_query)
-        return {
+        sql_query = result_or_default(
+            submit(traced("agent.sql_generation", sql_generator_agent.generate_sql), refined_query, history),
+            None, stage="SQL generation"
+        )
+
+    if sql_query:
+        yield "result", {
             "original_query": user_query,
             "refined_query": refined_query,
             "status": True,
             "sql_query": sql_query
         }
     else:
-        return {
+        yield "result", {
             "original_query": user_query,
             "refined_query": refined_query,
             "status": False,
             "sql_query": None
         }
 
+
+
+def _template_result(user_query: str, dataset_profile: dict, schema_index: SchemaIndex):
+    with span("sql_template") as attributes:
+        compiled = compile_question(user_query, dataset_profile, schema_index, table_name="df")
+        attributes["matched"] = compiled is not None
+    if compiled is None:
+        return None
+    return {
+        "original_query": user_query,
+        "refined_query": compiled["refined_query"],
+        "status": True,
+        "sql_query": {"SQL": compiled["SQL"], "params": compiled["params"]}
+    }
+
+
+# Main processing function
+def process_query(api_key: str, dataset_columns: list, df: pd.DataFrame, user_query: str, dataset_id: str = None,
+                  mode: str = None, dataset_profile: dict = None, schema_index: SchemaIndex = None, history: list = None):
+    """
+    Run the query agents. Questions matching a local SQL template skip the model entirely;
+    otherwise mode (default PIPELINE_MODE) selects "staged" agents, one model call each,
+    or a single "fused" planner call that falls back to the staged agents if its JSON is unusable.
+    A session passes its warm dataset_profile and schema_index, plus history (its earlier turns
+    as {"question", "refined_query", "sql"}) so follow-up questions are answered in context.
+    """
+    for stage, payload in process_query_stages(api_key, dataset_columns, df, user_query, dataset_id, mode,
+                                               dataset_profile, schema_index, history):
+        if stage == "result":
+            return payload
+
+
+def process_query_stages(api_key: str, dataset_columns: list, df: pd.DataFrame, user_query: str, dataset_id: str = None,
+                         mode: str = None, dataset_profile: dict = None, schema_index: SchemaIndex = None,
+                         history: list = None):
+    """
+    process_query as a generator of (stage, payload) events for the streaming pipeline: the staged
+    agents emit "refined_query" as soon as the question is refined, before the SQL is generated;
+    the last event is always "result" with process_query's return value.
+    """
+    mode = mode or PIPELINE_MODE
+    start = time.perf_counter()
+    gemini_llm = GeminiLLM(api_key=api_key)
+    # Profile once per dataset and share it between the agents
+    if dataset_profile is None:
+        with span("profile"):
+            dataset_profile = profile_dataset(df, dataset_id)
+    if schema_index is None:
+        with span("schema_index"):
+            schema_index = get_schema_index(dataset_columns, dataset_profile, dataset_id)
+    # The schema part of every agent prompt, cut to PROMPT_TOKEN_BUDGET and cached per dataset
+    schema_prompt = get_schema_prompt(dataset_columns, dataset_profile, schema_index, dataset_id)
+
+    # Fast path: common question shapes compile straight to SQL without any model call
+    compiled = _template_result(user_query, dataset_profile, schema_index)
+    if compiled is not None:
+        annotate(query_path="template")
+        logger.debug("⏱️ process_query (template) took %.2fs", time.perf_counter() - start)
+        yield "result", compiled
+        return
+
+    if mode == "fused":
+        result = _process_query_fused(gemini_llm, dataset_columns, user_query, dataset_profile, history, schema_prompt)
+        if result is not None:
+            annotate(query_path="fused")
+            logger.debug("⏱️ process_query (fused) took %.2fs", time.perf_counter() - start)
+            yield "result", result
+            return
+        logger.warning("⚠️ Fused plan unusable — falling back to staged agents.")
+
+    for stage, payload in _process_query_staged(gemini_llm, dataset_columns, df, user_query, dataset_profile,
+                                                schema_index, history, schema_prompt):
+        if stage == "result":
+            annotate(query_path="staged")
+            logger.debug("⏱️ process_query (staged) took %.2fs", time.perf_counter() - start)
+        yield stage, payload
+
+
+
+def process_queries(api_key: str, dataset_columns: list, df: pd.DataFrame, user_queries: list, dataset_id: str = None,
+                    dataset_profile: dict = None, schema_index: SchemaIndex = None) -> list:
+    """
+    process_query for several independent questions about one dataset, in as few model calls
+    as possible: the dataset is profiled once, template questions skip the model, and the rest
+    are planned BATCH_PLAN_MAX_QUESTIONS at a time by BatchPlannerAgent. A question the batch
+    plan got wrong is retried on its own through the staged agents; retries run concurrently.
+    Returns one result per question, in order; a question that failed outright gets
+    status False and its "error".
+    """
+    start = time.perf_counter()
+    gemini_llm = GeminiLLM(api_key=api_key)
+    if dataset_profile is None:
+        with span("profile"):
+            dataset_profile = profile_dataset(df, dataset_id)
+    if schema_index is None:
+        with span("schema_index"):
+            schema_index = get_schema_index(dataset_columns, dataset_profile, dataset_id)
+    schema_prompt = get_schema_prompt(dataset_columns, dataset_profile, schema_index, dataset_id)
+
+    results = [_template_result(query, dataset_profile, schema_index) for query in user_queries]
+    pending = [i for i, result in enumerate(results) if result is None]
+    planner = BatchPlannerAgent(llm=gemini_llm, dataset_columns=dataset_columns, table_name="df", dataset_summary=dataset_profile,
+                                schema_prompt=schema_prompt)
+    chunks = [pending[i:i + BATCH_PLAN_MAX_QUESTIONS] for i in range(0, len(pending), BATCH_PLAN_MAX_QUESTIONS)]
+    # Chunks are planned concurrently
+    futures = [submit(traced("agent.batch_plan", planner.plan), [user_queries[i] for i in chunk]) for chunk in chunks]
+    for chunk, future in zip(chunks, futures):
+        plans = result_or_default(future, None, stage="batch plan") or [None] * len(chunk)
+        for i, plan in zip(chunk, plans):
+            if plan is not None:
+                results[i] = _plan_result(user_queries[i], plan)
+
+    retried = [i for i, result in enumerate(results) if result is None]
+    retries = {
+        i: submit(traced("agent.batch_retry", process_query), api_key, dataset_columns, df, user_queries[i], dataset_id,
+                  mode="staged", dataset_profile=dataset_profile, schema_index=schema_index)
+        for i in retried
+    }
+    for i, future in retries.items():
+        results[i] = result_or_default(future, None, stage="batch retry", timeout=BATCH_RETRY_TIMEOUT_SECONDS)
+        if results[i] is None:
+            error = future.exception(timeout=0) if future.done() and not future.cancelled() else None
+            logger.warning("Question %d of the batch failed: %s", i, error or "timed out")
+            results[i] = {
+                "original_query": user_queries[i],
+                "refined_query": None,
+                "status": False,
+                "sql_query": None,
+                "error": str(error) if error else "The question could not be answered in time."
+            }
+
+    annotate(batch_questions=len(user_queries), batch_templates=len(user_queries) - len(pending),
+             batch_plan_calls=len(chunks), batch_retried=len(retried))
+    logger.debug("⏱️ process_queries (%d questions) took %.2fs", len(user_queries), time.perf_counter() - start)
+    return results
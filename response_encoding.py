@@ -0,0 +1,231 @@
+# response_encoding.py
+import gzip
+import json
+import os
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+from flask import Response, stream_with_context
+
+from telemetry import REQUEST_ID_HEADER, RESPONSE_BYTES, annotate, get_logger, request_trace, span, trace_options
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the brotli package is installed
+    brotli = None
+
+FORMAT_RECORDS = "records"    # Current shape: chart records in data.data plus table.rows
+FORMAT_COLUMNAR = "columnar"  # Rows stored once as columns; the chart references them
+FORMAT_ARROW = "arrow"        # Arrow IPC stream of the result, response fields in its metadata
+
+COLUMNAR_MIMETYPE = "application/vnd.hynox.columnar+json"
+ARROW_MIMETYPE = "application/vnd.apache.arrow.stream"
+
+RESPONSE_MAX_ROWS = int(os.getenv("RESPONSE_MAX_ROWS", 100_000))
+COMPRESSION_MIN_BYTES = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", 1024))
+STREAM_FIRST_PAGE_ROWS = int(os.getenv("STREAM_FIRST_PAGE_ROWS", 50))
+
+logger = get_logger("response_encoding")
+
+
+def negotiate_format(request) -> str:
+    """Pick the response format from ?format=... or, failing that, the Accept header."""
+    requested = request.args.get("format")
+    if requested in (FORMAT_RECORDS, FORMAT_COLUMNAR, FORMAT_ARROW):
+        return requested
+    accept = request.headers.get("Accept", "")
+    if ARROW_MIMETYPE in accept:
+        return FORMAT_ARROW
+    if COLUMNAR_MIMETYPE in accept:
+        return FORMAT_COLUMNAR
+    return FORMAT_RECORDS
+
+
+def json_format(fmt: str) -> str:
+    """The JSON shape used for fmt; Arrow clients get records where JSON is unavoidable."""
+    return FORMAT_COLUMNAR if fmt == FORMAT_COLUMNAR else FORMAT_RECORDS
+
+
+def _json_ready(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn NaN/NaT into None and datetimes into ISO strings, column by column."""
+    converted = {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_datetime64_any_dtype(series):
+            series = series.dt.strftime("%Y-%m-%dT%H:%M:%S")
+        if series.hasnans:
+            series = series.astype(object).where(series.notna(), None)
+        converted[col] = series
+    return pd.DataFrame(converted, columns=df.columns)
+
+
+def _chart_frame(result_df: pd.DataFrame, mapping: dict) -> pd.DataFrame:
+    return result_df[list(mapping.values())].set_axis(list(mapping.keys()), axis=1)
+
+
+def build_table(result_df: pd.DataFrame, fmt: str = FORMAT_RECORDS) -> dict:
+    """Serialize the result frame as the response table, capped at RESPONSE_MAX_ROWS rows."""
+    total_rows = len(result_df)
+    rows_df = _json_ready(result_df.head(RESPONSE_MAX_ROWS))
+    columns = [str(col) for col in result_df.columns]
+
+    if fmt == FORMAT_COLUMNAR:
+        table = {"columns": columns, "data": {str(col): rows_df[col].tolist() for col in rows_df.columns}}
+    else:
+        table = {"columns": columns, "rows": rows_df.to_dict(orient="records")}
+
+    if total_rows > RESPONSE_MAX_ROWS:
+        table["truncated"] = True
+        table["total_rows"] = total_rows
+    elif result_df.attrs.get("row_limit_reached"):
+        # Capped by the SQL row limit: more rows exist, but their count is unknown
+        table["truncated"] = True
+    return table
+
+
+def build_chart_data(result_df: pd.DataFrame, mapping: dict, fmt: str = FORMAT_RECORDS) -> dict:
+    """Chart fields for the response's data object; the chart type is added by the caller."""
+    if fmt == FORMAT_COLUMNAR:
+        return {"source": "table", "mapping": mapping}
+    chart_df = _json_ready(_chart_frame(result_df.head(RESPONSE_MAX_ROWS), mapping))
+    return {"data": chart_df.to_dict(orient="records")}
+
+
+def build_payload(response: dict, result_df: pd.DataFrame = None, fmt: str = FORMAT_RECORDS) -> dict:
+    """
+    Fill the data/table fields of a pipeline response from its result frame.
+    Pipeline responses carry data={"type": ..., "mapping": {"name": col, "value1": col, ...}}
+    and leave the table empty; responses without a result frame, or whose table was already
+    built by the pipeline, are returned unchanged.
+    """
+    if result_df is None or response.get("table") is not None:
+        return response
+
+    chart = response.get("data") or {}
+    data = {"type": chart.get("type"), **build_chart_data(result_df, chart.get("mapping", {}), fmt)}
+    return {**response, "data": data, "table": build_table(result_df, fmt)}
+
+
+def dumps_json(payload: dict) -> bytes:
+    """Compact JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(payload, default=str, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=str, separators=(",", ":")).encode("utf-8")
+
+
+def loads_json(body: bytes):
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+
+def _arrow_bytes(response: dict, result_df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(result_df.head(RESPONSE_MAX_ROWS), preserve_index=False)
+    metadata = {k: v for k, v in response.items() if k != "table"}
+    metadata["total_rows"] = len(result_df)
+    table = table.replace_schema_metadata({b"response": dumps_json(metadata)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _compress(body: bytes, accept_encoding: str):
+    if len(body) < COMPRESSION_MIN_BYTES:
+        return body, None
+    if brotli is not None and "br" in accept_encoding:
+        return brotli.compress(body, quality=4), "br"
+    if "gzip" in accept_encoding:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
+
+
+def encode_response(request, response: dict, result_df: pd.DataFrame = None, status: int = 200) -> Response:
+    """Serialize a pipeline response in the negotiated format, compressed when the client allows it."""
+    fmt = negotiate_format(request)
+    with span("serialize", format=fmt) as attributes:
+        if fmt == FORMAT_ARROW and result_df is not None:
+            body, mimetype = _arrow_bytes(response, result_df), ARROW_MIMETYPE
+        else:
+            body = dumps_json(build_payload(response, result_df, fmt))
+            mimetype = COLUMNAR_MIMETYPE if fmt == FORMAT_COLUMNAR else "application/json"
+
+        body, content_encoding = _compress(body, request.headers.get("Accept-Encoding", ""))
+        attributes.update(bytes=len(body), encoding=content_encoding)
+    RESPONSE_BYTES.labels(format=fmt).observe(len(body))
+    annotate(response_format=fmt, response_bytes=len(body), http_status=status)
+
+    flask_response = Response(body, status=status, mimetype=mimetype)
+    flask_response.headers["Vary"] = "Accept, Accept-Encoding"
+    if content_encoding:
+        flask_response.headers["Content-Encoding"] = content_encoding
+    return flask_response
+
+
+def stage_payload(stage: str, payload, fmt: str):
+    """
+    JSON-ready payload of a pipeline event: "rows" becomes the first page of the result and
+    "response" the full response in fmt. Payloads that are already JSON-ready pass through.
+    """
+    if stage == "rows" and isinstance(payload, pd.DataFrame):
+        first_page = _json_ready(payload.head(STREAM_FIRST_PAGE_ROWS))
+        return {
+            "columns": [str(col) for col in payload.columns],
+            "rows": first_page.to_dict(orient="records"),
+            "total_rows": len(payload),
+        }
+    if stage == "response" and isinstance(payload, tuple):
+        response, result_df = payload
+        return build_payload(response, result_df, json_format(fmt))
+    return payload
+
+
+def stream_response(request, stages) -> Response:
+    """
+    Stream (stage, payload) pipeline events as NDJSON, or as Server-Sent Events when the
+    client accepts text/event-stream. A failure mid-stream is sent as a final "error" event.
+    The request is traced while the stream is produced, since that is when the stages run.
+    """
+    fmt = negotiate_format(request)
+    use_sse = "text/event-stream" in request.headers.get("Accept", "")
+    options = trace_options(request)
+    options["request_id"] = options["request_id"] or uuid.uuid4().hex[:16]
+    endpoint = request.url_rule.rule if request.url_rule else request.path
+
+    def encode(stage, payload):
+        if use_sse:
+            return b"event: " + stage.encode("utf-8") + b"\ndata: " + dumps_json(payload) + b"\n\n"
+        return dumps_json({"event": stage, "data": payload}) + b"\n"
+
+    def generate():
+        with request_trace(endpoint, **options):
+            sent = 0
+            try:
+                for stage, payload in stages:
+                    chunk = encode(stage, stage_payload(stage, payload, fmt))
+                    sent += len(chunk)
+                    yield chunk
+            except Exception as e:
+                logger.exception("Error in stream: %s", e)
+                yield encode("error", {
+                    "status": "error",
+                    "summary": "An unexpected error occurred in the backend.",
+                    "data": None,
+                    "table": None,
+                    "error": str(e)
+                })
+            RESPONSE_BYTES.labels(format=f"stream-{fmt}").observe(sent)
+            annotate(response_format=fmt, response_bytes=sent, http_status=200)
+
+    mimetype = "text/event-stream" if use_sse else "application/x-ndjson"
+    flask_response = Response(stream_with_context(generate()), mimetype=mimetype)
+    flask_response.headers["Cache-Control"] = "no-cache"
+    flask_response.headers["X-Accel-Buffering"] = "no"  # Stop proxies from buffering the stream
+    flask_response.headers[REQUEST_ID_HEADER] = options["request_id"]
+    return flask_response
@@ -0,0 +1,126 @@
+# result_cache.py
+import json
+import os
+import re
+import threading
+
+import pandas as pd
+import pyarrow as pa
+
+from lru import LRUCache
+from response_encoding import dumps_json, loads_json
+from telemetry import get_logger
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "True") == "True"
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 128 * 1024 * 1024))
+
+logger = get_logger("result_cache")
+
+# String literals and quoted identifiers keep their case and spacing
+_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql_query: str) -> str:
+    """Lower-case and collapse whitespace outside quotes, and drop the trailing ';'."""
+    parts = _QUOTED.split(sql_query.strip().rstrip(";"))
+    return "".join(
+        part if i % 2 else _WHITESPACE.sub(" ", part.lower())
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def cache_key(dataset_id: str, sql_query: str, params: list = None) -> str:
+    return f"{dataset_id}\n{normalize_sql(sql_query)}\n{json.dumps(params, default=str)}"
+
+
+class CachedResult:
+    """
+    A finished query result: the rows as an Arrow table, the chart (type and mapping), and the
+    table/chart payloads already serialized for each response format that has been served.
+    """
+
+    def __init__(self, result_df: pd.DataFrame, chart: dict):
+        self.table = pa.Table.from_pandas(result_df, preserve_index=False)
+        self.attrs = dict(result_df.attrs)
+        self.chart = chart
+        self._payloads = {}  # fmt -> JSON bytes of {"data": ..., "table": ...}
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        with self._lock:
+            return self.table.nbytes + sum(len(body) for body in self._payloads.values())
+
+    def frame(self) -> pd.DataFrame:
+        result_df = self.table.to_pandas()
+        result_df.attrs.update(self.attrs)
+        return result_df
+
+    def payload(self, fmt: str):
+        """The {"data": chart data, "table": table} payload built for fmt, or None."""
+        with self._lock:
+            body = self._payloads.get(fmt)
+        return None if body is None else loads_json(body)
+
+    def add_payload(self, fmt: str, chart_data: dict, table: dict) -> int:
+        """Store the payload for fmt; returns the bytes added."""
+        body = dumps_json({"data": chart_data, "table": table})
+        with self._lock:
+            if fmt in self._payloads:
+                return 0
+            self._payloads[fmt] = body
+        return len(body)
+
+
+class ResultCache:
+    """
+    In-memory LRU of finished query results keyed by (dataset fingerprint, normalized SQL, params).
+    The fingerprint changes with the file's content, so results of an edited file are never
+    served; its old entries age out. Entries are evicted least-recently-used first once the
+    byte budget is exceeded.
+    """
+
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = LRUCache(max_bytes=max_bytes)  # key -> CachedResult
+
+    def get(self, dataset_id: str, sql_query: str, params: list = None):
+        if dataset_id is None:
+            return None
+        return self._entries.get(cache_key(dataset_id, sql_query, params))
+
+    def put(self, dataset_id: str, sql_query: str, params: list, result_df: pd.DataFrame, chart: dict):
+        """Cache a result and return its CachedResult (None if it is not cacheable), for add_payload."""
+        if dataset_id is None:
+            return None
+        try:
+            cached = CachedResult(result_df, chart)
+        except (pa.ArrowException, TypeError, ValueError) as e:
+            # Mixed-type object columns have no Arrow type
+            logger.debug("Result not cached: %s", e)
+            return None
+        if cached.nbytes > self.max_bytes:
+            return None
+        self._entries.put(cache_key(dataset_id, sql_query, params), cached, cached.nbytes)
+        return cached
+
+    def add_payload(self, dataset_id: str, sql_query: str, params: list, cached: CachedResult, fmt: str,
+                    chart_data: dict, table: dict):
+        """Attach the serialized payload for fmt to a cached result and account for its bytes."""
+        cached.add_payload(fmt, chart_data, table)
+        self._entries.resize(cache_key(dataset_id, sql_query, params), cached, cached.nbytes)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+result_cache = ResultCache()
+
+
+def get_result_cache():
+    """Return the shared result cache, or None when RESULT_CACHE_ENABLED is off."""
+    return result_cache if RESULT_CACHE_ENABLED else None
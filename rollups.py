@@ -0,0 +1,352 @@
+# rollups.py
+import json
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ingest import read_rollups, write_rollups
+from lru import LRUCache
+from sql_engines import FileScan, connect_duckdb
+from telemetry import get_logger
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "False") == "True"  # Off until the rewriter has more mileage
+ROLLUP_MIN_ROWS = int(os.getenv("ROLLUP_MIN_ROWS", 100_000))  # Smaller frames scan faster than they roll up
+ROLLUP_MAX_ROWS = int(os.getenv("ROLLUP_MAX_ROWS", 10_000))   # Rollups this large are not worth keeping
+ROLLUP_CACHE_SIZE = 32
+ROLLUP_BUILD_WORKERS = int(os.getenv("ROLLUP_BUILD_WORKERS", 2))
+
+# Date parts at least as coarse as a month give the same answer on month-truncated dates
+MONTH_PARTS = {"month", "months", "mon", "quarter", "quarters", "year", "years", "yr", "decade", "century", "millennium"}
+MONTH_FORMAT = re.compile(r"^(?:[^%]|%[YymBb%])*$")
+ROLLUP_AGGREGATES = {"sum", "avg", "count", "count_star", "min", "max"}
+MEASURE_AGGREGATES = ("sum", "count", "min", "max")  # Kept per numeric column as <agg>__<column>
+
+logger = get_logger("rollups")
+
+_rollups = LRUCache(max_entries=ROLLUP_CACHE_SIZE)  # dataset_id -> RollupSet, or None when the dataset has no rollups
+# Builds scan whole datasets; they get their own workers so they never hold up request stages
+_builder = ThreadPoolExecutor(max_workers=ROLLUP_BUILD_WORKERS, thread_name_prefix="rollup-build")
+_building = set()
+_building_lock = threading.Lock()
+_parser = threading.local()
+
+
+def _quote(identifier: str) -> str:
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _rollup_columns(df: pd.DataFrame, dataset_profile: dict):
+    """(categorical, datetime, numeric) columns as profiled; booleans are not summed."""
+    categorical, datetimes, numeric = [], [], []
+    for col, info in dataset_profile.items():
+        if col not in df.columns:
+            continue
+        if info.get("type") == "categorical":
+            categorical.append(col)
+        elif info.get("type") == "datetime":
+            datetimes.append(col)
+        elif info.get("type") == "numeric" and not pd.api.types.is_bool_dtype(df[col]):
+            numeric.append(col)
+    return categorical, datetimes, numeric
+
+
+def build_rollups(source, df: pd.DataFrame, dataset_profile: dict):
+    """
+    Aggregate source (a DataFrame or FileScan) by each categorical column and by the month of
+    each datetime column, in one GROUPING SETS pass. Returns the combined pa.Table (one
+    __g_<i> flag per key marks the rows of its rollup), or None when nothing can be rolled up.
+    """
+    categorical, datetimes, numeric = _rollup_columns(df, dataset_profile)
+    keys = categorical + datetimes
+    if not keys:
+        return None
+
+    projections = [_quote(col) for col in categorical]
+    projections += [f"date_trunc('month', {_quote(col)}) AS {_quote(col)}" for col in datetimes]
+    projections += [_quote(col) for col in numeric]
+    measures = ["COUNT(*) AS __rows"]
+    for col in numeric:
+        for agg in MEASURE_AGGREGATES:
+            measures.append(f"{agg.upper()}({_quote(col)}) AS {_quote(f'{agg}__{col}')}")
+    flags = [f"GROUPING({_quote(key)}) AS __g_{i}" for i, key in enumerate(keys)]
+    sql_query = (
+        f"SELECT {', '.join(_quote(key) for key in keys)}, {', '.join(flags)}, {', '.join(measures)} "
+        f"FROM (SELECT {', '.join(projections)} FROM base) "
+        f"GROUP BY GROUPING SETS ({', '.join(f'({_quote(key)})' for key in keys)})"
+    )
+
+    con = connect_duckdb(source)
+    try:
+        if isinstance(source, FileScan):
+            con.execute(f"CREATE VIEW base AS SELECT * FROM {source.source_sql()}")
+        else:
+            con.register("base", pa.Table.from_pandas(source, preserve_index=False))
+        table = con.execute(sql_query).arrow()
+    finally:
+        con.close()
+    if hasattr(table, "read_all"):
+        table = table.read_all()
+    metadata = {"keys": keys, "months": datetimes, "measures": numeric}
+    return table.replace_schema_metadata({b"rollups": json.dumps(metadata).encode("utf-8")})
+
+
+class _NotRollable(Exception):
+    pass
+
+
+class RollupSet:
+    """
+    The rollup tables of one dataset and the rewriter that answers aggregate queries from them.
+    A query is rewritten only when every column it reads outside SUM/AVG/COUNT/MIN/MAX is the
+    rollup's key (for a month rollup, only through month-or-coarser date functions); aggregates
+    are then re-aggregated from the partial sums, counts, minima and maxima.
+    """
+
+    def __init__(self, table: pa.Table):
+        metadata = json.loads(table.schema.metadata[b"rollups"])
+        self.months = set(metadata["months"])
+        self.measures = set(metadata["measures"])
+        self.columns = set(metadata["keys"]) | self.measures
+        measure_columns = ["__rows"] + [f"{agg}__{col}" for col in metadata["measures"] for agg in MEASURE_AGGREGATES]
+        self.tables = {}  # rollup name -> pa.Table
+        self.keys = {}    # key column -> rollup name
+        for i, key in enumerate(metadata["keys"]):
+            rows = table.filter(pc.equal(table[f"__g_{i}"], 0)).select([key] + measure_columns)
+            if rows.num_rows <= ROLLUP_MAX_ROWS:
+                name = f"__rollup_{i}"
+                self.tables[name] = rows.replace_schema_metadata(None)
+                self.keys[key] = name
+
+    @property
+    def nbytes(self) -> int:
+        return sum(table.nbytes for table in self.tables.values())
+
+    def rewrite(self, sql_query: str, table_name: str = "df"):
+        """Return (sql, rollup_name) answering sql_query from a rollup, or None if no rollup applies."""
+        if not self.tables:
+            return None
+        try:
+            tree = json.loads(_parse(sql_query))
+            if tree.get("error") or len(tree["statements"]) != 1:
+                return None
+            node = tree["statements"][0]["node"]
+            key = _QueryCheck(self, table_name).check(node)
+        except (_NotRollable, KeyError, TypeError) as e:
+            logger.debug("Not answerable from rollups: %s", e)
+            return None
+        name = self.keys[key] if key is not None else min(self.tables, key=lambda n: self.tables[n].num_rows)
+        node["from_table"]["table_name"] = name
+        return _deserialize(tree), name
+
+
+class _QueryCheck:
+    """One pass over a parsed SELECT: records the key columns it reads and rewrites its aggregates in place."""
+
+    def __init__(self, rollup_set: RollupSet, table_name: str):
+        self.rollups = rollup_set
+        self.table_name = table_name
+        self.bare_keys = set()   # Key columns read as they are
+        self.month_keys = set()  # Datetime keys read only through month-or-coarser functions
+        self.aggregates = 0
+        self.aliases = set()
+
+    def check(self, node: dict):
+        if node.get("type") != "SELECT_NODE" or node["cte_map"]["map"] or node.get("sample") or node.get("qualify"):
+            raise _NotRollable("not a plain SELECT")
+        source = node.get("from_table") or {}
+        if source.get("type") != "BASE_TABLE" or source.get("table_name") != self.table_name or source.get("sample"):
+            raise _NotRollable("not a single scan of the dataset")
+
+        self.aliases = {item.get("alias") for item in node["select_list"] if item.get("alias")}
+        for item in node["select_list"]:
+            # Unaliased select items keep the output names the base query would give them
+            if not item.get("alias") and item.get("class") != "STAR":
+                item["alias"] = _expression_name(item)
+        expressions = node["select_list"] + node["group_expressions"]
+        for field in ("where_clause", "having"):
+            if node.get(field):
+                expressions.append(node[field])
+        for modifier in node.get("modifiers", []):
+            if modifier["type"] == "ORDER_MODIFIER":
+                expressions += [order["expression"] for order in modifier["orders"]]
+            elif modifier["type"] == "LIMIT_MODIFIER":
+                expressions += [modifier[field] for field in ("limit", "offset") if modifier.get(field)]
+            elif modifier["type"] != "DISTINCT_MODIFIER":
+                raise _NotRollable(modifier["type"])
+        self._visit(expressions, month_context=False)
+
+        if not self.aggregates and not node["group_expressions"]:
+            raise _NotRollable("row-level query")
+        keys = self.bare_keys | self.month_keys
+        if len(keys) > 1:
+            raise _NotRollable(f"reads several key columns: {sorted(keys)}")
+        key = next(iter(keys), None)
+        if key is not None and key not in self.rollups.keys:
+            raise _NotRollable(f"no rollup for {key}")
+        if key in self.rollups.months and key in self.bare_keys:
+            raise _NotRollable(f"{key} is read below month granularity")
+        return key
+
+    def _visit(self, expression, month_context: bool):
+        if isinstance(expression, list):
+            for item in expression:
+                self._visit(item, month_context)
+            return
+        if not isinstance(expression, dict):
+            return
+        kind = expression.get("class")
+        if kind in ("SUBQUERY", "WINDOW", "STAR", "LAMBDA"):
+            raise _NotRollable(kind)
+        if kind == "COLUMN_REF":
+            column = self._column(expression)
+            if column is None:
+                if expression["column_names"][-1] not in self.aliases:
+                    raise _NotRollable(f"unknown column {expression['column_names']}")
+            elif column in self.rollups.measures:
+                raise _NotRollable(f"{column} is read row by row")
+            elif month_context and column in self.rollups.months:
+                self.month_keys.add(column)
+            else:
+                self.bare_keys.add(column)
+            return
+        if kind == "FUNCTION":
+            name = expression["function_name"].lower()
+            if name in ROLLUP_AGGREGATES:
+                self._rewrite_aggregate(expression)
+                self.aggregates += 1
+                return
+            if _is_month_function(name, expression["children"]):
+                self._visit(expression["children"], month_context=True)
+                return
+        for value in expression.values():
+            if isinstance(value, (dict, list)):
+                self._visit(value, month_context=False)
+
+    def _column(self, expression: dict):
+        names = expression["column_names"]
+        if len(names) == 2 and names[0] == self.table_name:
+            # The rollup replaces the table, so qualified references lose their qualifier
+            expression["column_names"] = names = names[1:]
+        if len(names) != 1 or names[0] not in self.rollups.columns:
+            return None
+        return names[0]
+
+    def _rewrite_aggregate(self, expression: dict):
+        name = expression["function_name"].lower()
+        if expression.get("distinct") or expression.get("filter") or expression["order_bys"]["orders"]:
+            raise _NotRollable(f"{name} with DISTINCT, FILTER or ORDER BY")
+        children = expression["children"]
+        if name == "count_star" or (name == "count" and not children):
+            replacement = 'CAST(sum("__rows") AS BIGINT)'
+        else:
+            if len(children) != 1 or children[0].get("class") != "COLUMN_REF":
+                raise _NotRollable(f"{name} of an expression")
+            column = self._column(children[0])
+            if column not in self.rollups.measures:
+                raise _NotRollable(f"{name}({children[0]['column_names']}) has no rollup measure")
+            replacement = {
+                "sum": f"sum({_quote('sum__' + column)})",
+                "count": f"CAST(sum({_quote('count__' + column)}) AS BIGINT)",
+                "min": f"min({_quote('min__' + column)})",
+                "max": f"max({_quote('max__' + column)})",
+                "avg": f"sum({_quote('sum__' + column)}) / sum({_quote('count__' + column)})",
+            }[name]
+        alias = expression.get("alias", "")
+        expression.clear()
+        expression.update(_parse_expression(replacement))
+        expression["alias"] = alias
+
+
+def _is_month_function(name: str, children: list) -> bool:
+    constants = [c["value"]["value"] for c in children if c.get("class") == "CONSTANT" and not c["value"]["is_null"]]
+    if name in ("year", "month", "quarter", "monthname"):
+        return True
+    if name in ("date_trunc", "datetrunc", "date_part", "datepart"):
+        return len(constants) == 1 and str(constants[0]).lower() in MONTH_PARTS
+    if name == "strftime":
+        return len(constants) == 1 and bool(MONTH_FORMAT.match(str(constants[0])))
+    return False
+
+
+def _connection():
+    # The parser functions need a connection; each thread keeps its own
+    con = getattr(_parser, "con", None)
+    if con is None:
+        con = _parser.con = duckdb.connect()
+    return con
+
+
+def _parse(sql_query: str) -> str:
+    return _connection().execute("SELECT json_serialize_sql(?)", [sql_query]).fetchone()[0]
+
+
+def _deserialize(tree: dict) -> str:
+    return _connection().execute("SELECT json_deserialize_sql(?::JSON)", [json.dumps(tree)]).fetchone()[0]
+
+
+def _parse_expression(expression_sql: str) -> dict:
+    tree = json.loads(_parse(f"SELECT {expression_sql}"))
+    return tree["statements"][0]["node"]["select_list"][0]
+
+
+def _expression_name(expression: dict) -> str:
+    """The column name DuckDB gives an unaliased select item."""
+    tree = json.loads(_parse("SELECT 1"))
+    tree["statements"][0]["node"]["select_list"] = [expression]
+    return _deserialize(tree)[len("SELECT "):]
+
+
+# --- Materialization ---
+def _load(dataset_id: str, source, df: pd.DataFrame, dataset_profile: dict):
+    table = read_rollups(dataset_id)
+    if table is None:
+        table = build_rollups(source, df, dataset_profile)
+        if table is not None:
+            write_rollups(dataset_id, table)
+    rollup_set = RollupSet(table) if table is not None else None
+    _rollups.put(dataset_id, rollup_set)
+    with _building_lock:
+        _building.discard(dataset_id)
+    if rollup_set is not None:
+        logger.info("Rollups ready for %s: %s", dataset_id[:12], ", ".join(rollup_set.keys) or "none")
+
+
+def _load_or_forget(dataset_id: str, source, df: pd.DataFrame, dataset_profile: dict):
+    try:
+        _load(dataset_id, source, df, dataset_profile)
+    except Exception as e:
+        logger.warning("⚠️ Could not build rollups for %s: %s", dataset_id[:12], e)
+        _rollups.put(dataset_id, None)
+        with _building_lock:
+            _building.discard(dataset_id)
+
+
+def ensure_rollups(dataset_id: str, source, df: pd.DataFrame, dataset_profile: dict):
+    """
+    Materialize the dataset's rollups once, in the background (ROLLUPS_ENABLED; frames of at
+    least ROLLUP_MIN_ROWS rows, and every file queried in place). They are stored next to the
+    ingested Arrow copy, so other workers and restarts only read them.
+    """
+    if not ROLLUPS_ENABLED or dataset_id is None:
+        return
+    if not isinstance(source, FileScan) and len(df) < ROLLUP_MIN_ROWS:
+        return
+    with _building_lock:
+        if dataset_id in _rollups or dataset_id in _building:
+            return
+        _building.add(dataset_id)
+    # Queries scan the dataset until the rollups are ready
+    _builder.submit(_load_or_forget, dataset_id, source, df, dataset_profile)
+
+
+def get_rollups(dataset_id: str):
+    """The dataset's RollupSet, or None while it is not (yet) materialized."""
+    if dataset_id is None:
+        return None
+    return _rollups.get(dataset_id)
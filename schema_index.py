@@ -0,0 +1,202 @@
+# schema_index.py
+import difflib
+import os
+import re
+import threading
+
+from lru import LRUCache
+
+SCHEMA_MATCH_THRESHOLD = float(os.getenv("SCHEMA_MATCH_THRESHOLD", 0.85))
+SCHEMA_INDEX_CACHE_SIZE = int(os.getenv("SCHEMA_INDEX_CACHE_SIZE", 32))
+FUZZY_CUTOFF = 0.8
+MIN_TOKEN_LENGTH = 2
+
+STOPWORDS = {
+    "a", "an", "the", "of", "in", "on", "for", "to", "by", "and", "or", "is", "are", "was", "were", "be",
+    "what", "which", "who", "how", "many", "much", "me", "show", "give", "list", "tell", "find", "get",
+    "all", "each", "per", "with", "from", "at", "as", "it", "this", "that", "these", "those", "my", "our",
+    "do", "does", "did", "can", "could", "please", "i", "we", "you", "there", "than", "vs", "versus",
+    "last", "top", "most", "least", "between", "over", "under", "about",
+}
+
+# Words too common in small talk to point at a column on their own ("no thanks", "what time is it?");
+# they still count inside multi-word column names such as "Invoice No"
+GENERIC_WORDS = {"no", "number", "time", "when", "total", "day", "value", "name", "thank", "thanks", "yes", "ok"}
+
+# Asking for an aggregate, a filter or a breakdown, or just a question: a column hit without one
+# ("write me a poem about the north wind") is left to the model
+DATA_INTENT = re.compile(
+    r"\b(?:how many|how much|number of|count|total|sum|average|avg|mean|median|max|maximum|min|minimum|"
+    r"highest|lowest|top|bottom|most|least|compare|comparison|trend|distribution|breakdown|share|percent|"
+    r"percentage|ratio|growth|rank|by|per|where|between|group|filter|list|show|plot|chart|graph|"
+    r"what|which|who|how)\b|\?\s*$"
+)
+
+# Common business abbreviations and synonyms; both directions are indexed
+SYNONYMS = {
+    "sales": ["revenue", "turnover"],
+    "revenue": ["sales", "income", "turnover"],
+    "q": ["quarter"],
+    "qtr": ["quarter"],
+    "qty": ["quantity", "units"],
+    "units": ["quantity", "qty"],
+    "amt": ["amount"],
+    "amount": ["value", "total"],
+    "cust": ["customer", "client"],
+    "customer": ["client", "buyer"],
+    "dept": ["department"],
+    "yr": ["year"],
+    "mo": ["month"],
+    "dt": ["date"],
+    "date": ["day"],
+    "num": ["number", "count"],
+    "pct": ["percent", "percentage"],
+    "avg": ["average", "mean"],
+    "emp": ["employee", "staff"],
+    "employee": ["staff", "worker"],
+    "profit": ["margin", "earnings"],
+    "cost": ["expense", "spend"],
+    "price": ["cost", "rate"],
+    "region": ["area", "territory", "zone"],
+    "product": ["item", "sku"],
+    "category": ["type", "segment", "group"],
+}
+
+_indexes = LRUCache(max_entries=SCHEMA_INDEX_CACHE_SIZE)  # dataset_id -> SchemaIndex
+
+_relevance_decisions = {"local_accept": 0, "local_reject": 0, "llm": 0}
+_relevance_lock = threading.Lock()
+
+
+def _split_identifier(name: str) -> list:
+    # "Revenue_Q" -> ["revenue", "q"], "unitPrice2024" -> ["unit", "price", "2024"]
+    spaced = re.sub(r"([a-z])([A-Z])", r"\1 \2", str(name))
+    spaced = re.sub(r"([A-Za-z])(\d)|(\d)([A-Za-z])", r"\1\3 \2\4", spaced)
+    return [token for token in re.split(r"[^0-9a-zA-Z]+", spaced.lower()) if token]
+
+
+def _stem(token: str) -> str:
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("es") and token[-3] in "sxz":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join(_stem(token) for token in _split_identifier(text))
+
+
+class SchemaIndex:
+    """
+    Lexical index over a dataset's column names, their tokenized and synonym aliases, and
+    the distinct values of its low-cardinality (categorical) columns. Built once per dataset;
+    match() scores a question against it without any model call.
+    """
+
+    def __init__(self, dataset_columns: list, dataset_profile: dict = None):
+        self.dataset_columns = list(dataset_columns)
+        self.token_columns = {}  # token -> set of columns it points to
+        self.phrases = {}        # normalized multi-word alias or value -> column
+        self.name_tokens = {}    # column -> tokens of its name and their synonyms (not its values)
+
+        for col in self.dataset_columns:
+            tokens = [_stem(token) for token in _split_identifier(col)]
+            self.phrases[" ".join(tokens)] = col
+            names = self.name_tokens.setdefault(col, set())
+            for token in tokens:
+                self._add_token(token, col)
+                names.add(token)
+                for synonym in SYNONYMS.get(token, []):
+                    self._add_token(_stem(synonym), col)
+                    names.add(_stem(synonym))
+
+        for col, info in (dataset_profile or {}).items():
+            for value in info.get("unique_values", []):
+                normalized = _normalize_text(value)
+                if normalized:
+                    self.phrases[normalized] = col
+                    if " " not in normalized:
+                        self._add_token(normalized, col)
+
+        self.vocabulary = [token for token in self.token_columns if len(token) >= 3]
+
+    def _add_token(self, token: str, col: str):
+        if len(token) >= MIN_TOKEN_LENGTH and token not in STOPWORDS and token not in GENERIC_WORDS:
+            self.token_columns.setdefault(token, set()).add(col)
+
+    def match(self, query: str):
+        """
+        Score how strongly the query asks about this dataset.
+        Returns (confidence between 0 and 1, list of matched columns ordered by score). Without
+        a data intent (DATA_INTENT) the confidence is halved, below any sensible threshold.
+        """
+        scores = self.column_scores(query)
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        confidence = scores[ranked[0]] if ranked else 0.0
+        if not DATA_INTENT.search(query.lower()):
+            confidence /= 2
+        return confidence, ranked
+
+    def column_scores(self, query: str) -> dict:
+        """Best match score (0 to 1) of every column the query refers to."""
+        normalized_query = f" {_normalize_text(query)} "
+        scores = {}
+
+        for phrase, col in self.phrases.items():
+            if " " in phrase and f" {phrase} " in normalized_query:
+                scores[col] = 1.0
+
+        for token in normalized_query.split():
+            if token in STOPWORDS or token in GENERIC_WORDS or len(token) < MIN_TOKEN_LENGTH:
+                continue
+            if token in self.token_columns:
+                matches, score = self.token_columns[token], 1.0
+            elif len(token) >= 4:
+                close = difflib.get_close_matches(token, self.vocabulary, n=1, cutoff=FUZZY_CUTOFF)
+                if not close:
+                    continue
+                matches = self.token_columns[close[0]]
+                score = difflib.SequenceMatcher(None, token, close[0]).ratio()
+            else:
+                continue
+            for col in matches:
+                scores[col] = max(scores.get(col, 0.0), score)
+        return scores
+
+    def names_column(self, phrase: str, col: str) -> bool:
+        """
+        True when every content token of phrase is (a close spelling of) a token of col's name
+        or a synonym; a value of col, a year or any other qualifier in the phrase makes it False.
+        """
+        names = list(self.name_tokens.get(col, ()))
+        tokens = self.content_tokens(phrase)
+        return bool(tokens) and all(
+            token in names or (len(token) >= 4 and difflib.get_close_matches(token, names, n=1, cutoff=FUZZY_CUTOFF))
+            for token in tokens
+        )
+
+    def content_tokens(self, query: str) -> list:
+        return [t for t in _normalize_text(query).split() if t not in STOPWORDS and len(t) >= MIN_TOKEN_LENGTH]
+
+
+def get_schema_index(dataset_columns: list, dataset_profile: dict = None, dataset_id: str = None) -> SchemaIndex:
+    """Return the cached index for a dataset fingerprint, building it on first use."""
+    if dataset_id is None:
+        return SchemaIndex(dataset_columns, dataset_profile)
+    return _indexes.get_or_create(dataset_id, lambda: SchemaIndex(dataset_columns, dataset_profile))
+
+
+def record_relevance_decision(source: str):
+    with _relevance_lock:
+        _relevance_decisions[source] += 1
+
+
+def relevance_stats() -> dict:
+    """How often relevance was decided locally versus by the model."""
+    with _relevance_lock:
+        total = sum(_relevance_decisions.values())
+        local = _relevance_decisions["local_accept"] + _relevance_decisions["local_reject"]
+        return {**_relevance_decisions, "local_rate": local / total if total else 0.0}
@@ -0,0 +1,135 @@
+# sessions.py
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+from dataset_cache import frame_nbytes
+from integrate import SUPPORTED_EXTENSIONS, load_source
+from lru import LRUCache
+from process_sql import register_dataset
+from profiler import profile_dataset
+from schema_index import get_schema_index
+from telemetry import get_logger
+
+SESSION_IDLE_TIMEOUT_SECONDS = float(os.getenv("SESSION_IDLE_TIMEOUT_SECONDS", 30 * 60))
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", 64))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 1024 * 1024 * 1024))  # Frames held by sessions, in memory
+SESSION_HISTORY_TURNS = int(os.getenv("SESSION_HISTORY_TURNS", 5))  # Earlier turns passed to the agents
+
+logger = get_logger("sessions")
+
+
+class Session:
+    """
+    A dataset registered once for a conversation: the loaded table (or FileScan), its profile
+    and schema index, and the last SESSION_HISTORY_TURNS answered questions with their SQL.
+    """
+
+    def __init__(self, session_id: str, file_url: str, dataset_id: str, source, df, dataset_profile: dict, schema_index):
+        self.session_id = session_id
+        self.file_url = file_url
+        self.dataset_id = dataset_id
+        self.source = source
+        self.df = df
+        self.dataset_profile = dataset_profile
+        self.schema_index = schema_index
+        # A file queried in place holds only its sample in memory
+        self.nbytes = frame_nbytes(df)
+        self.created_at = self.last_used = time.monotonic()
+        self._history = deque(maxlen=SESSION_HISTORY_TURNS)
+        self._lock = threading.Lock()
+
+    def record_turn(self, question: str, refined_query: str, sql: str):
+        with self._lock:
+            self._history.append({"question": question, "refined_query": refined_query, "sql": sql})
+
+    def recent_turns(self) -> list:
+        with self._lock:
+            return list(self._history)
+
+    def describe(self) -> dict:
+        with self._lock:
+            turns = len(self._history)
+        return {
+            "session_id": self.session_id,
+            "dataset_id": self.dataset_id,
+            "columns": self.df.columns.tolist(),
+            "rows": len(self.df),
+            "turns": turns,
+            "idle_timeout_seconds": SESSION_IDLE_TIMEOUT_SECONDS,
+        }
+
+
+class SessionStore:
+    """
+    Thread-safe store of warm sessions. A session idle for longer than idle_timeout is
+    dropped on the next access to the store; past max_entries sessions, or max_bytes of
+    their frames, the least recently used go (the newest session is always kept).
+    """
+
+    def __init__(self, idle_timeout: float = SESSION_IDLE_TIMEOUT_SECONDS, max_entries: int = SESSION_MAX_ENTRIES,
+                 max_bytes: int = SESSION_MAX_BYTES):
+        self.idle_timeout = idle_timeout
+        self.max_bytes = max_bytes
+        self._sessions = LRUCache(max_entries=max_entries, max_bytes=max_bytes, on_evict=self._evicted)
+        self._lock = threading.Lock()  # Held across idle eviction and the lookup that follows it
+        self.expired = 0
+
+    @staticmethod
+    def _evicted(session: Session):
+        logger.debug("Session %s evicted (%d bytes)", session.session_id, session.nbytes)
+
+    def _evict_idle(self, now: float):
+        # Sessions are ordered by last use, so the idle ones are at the front
+        while True:
+            oldest = self._sessions.oldest()
+            if oldest is None or now - oldest[1].last_used <= self.idle_timeout:
+                break
+            self._sessions.pop(oldest[0])
+            self.expired += 1
+            logger.debug("Session %s expired", oldest[0])
+
+    def create(self, file_url: str) -> Session:
+        """
+        Load, profile and index file_url, and register it with the SQL engine.
+        Raises ValueError for unsupported file types; load errors propagate.
+        """
+        if not file_url or not file_url.lower().endswith(SUPPORTED_EXTENSIONS):
+            raise ValueError("Unsupported file format. Only CSV, Excel and Parquet files are supported.")
+
+        dataset_id, source, df = load_source(file_url)
+        dataset_profile = profile_dataset(df, dataset_id)
+        schema_index = get_schema_index(df.columns.tolist(), dataset_profile, dataset_id)
+        register_dataset(source, dataset_id=dataset_id)
+
+        session = Session(secrets.token_urlsafe(16), file_url, dataset_id, source, df, dataset_profile, schema_index)
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            self._sessions.put(session.session_id, session, session.nbytes)
+        return session
+
+    def get(self, session_id: str):
+        """Return the session and mark it used, or None if it is unknown or has expired."""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+            return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id) is not None
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            cache = self._sessions.stats()
+            return {"active": cache["entries"], "bytes": cache["bytes"], "max_bytes": self.max_bytes,
+                    "expired": self.expired, "evictions": cache["evictions"]}
+
+
+session_store = SessionStore()
@@ -0,0 +1,243 @@
+# sql_engines.py
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+
+from lru import LRUCache
+
+SQL_ENGINE = os.getenv("SQL_ENGINE", "duckdb")  # "duckdb" or "sqlite"
+SQL_ENGINE_MAX_DATASETS = int(os.getenv("SQL_ENGINE_MAX_DATASETS", 8))
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT")  # e.g. "2GB"; DuckDB's default when unset
+DUCKDB_SPILL_DIR = os.getenv("DUCKDB_SPILL_DIR")        # Where DuckDB spills larger-than-memory work
+
+
+class SQLTimeoutError(Exception):
+    """A query ran past its timeout and was interrupted."""
+
+
+@contextmanager
+def _deadline(interrupt, timeout: float):
+    """Call interrupt() if the block is still running after timeout seconds, and raise SQLTimeoutError."""
+    if not timeout:
+        yield
+        return
+    fired = threading.Event()
+
+    def fire():
+        fired.set()
+        interrupt()
+
+    timer = threading.Timer(timeout, fire)
+    timer.daemon = True
+    timer.start()
+    try:
+        yield
+    except Exception:
+        if fired.is_set():
+            raise SQLTimeoutError(f"Query exceeded {timeout:g}s and was cancelled.") from None
+        raise
+    finally:
+        timer.cancel()
+
+
+class FileScan:
+    """A CSV or Parquet file queried in place by DuckDB instead of a loaded DataFrame."""
+
+    def __init__(self, path: str, fmt: str = "csv"):
+        self.path = path
+        self.fmt = fmt
+
+    def source_sql(self) -> str:
+        path = self.path.replace("'", "''")
+        if self.fmt == "parquet":
+            return f"read_parquet('{path}')"
+        return f"read_csv('{path}', encoding='latin-1')"
+
+
+def connect_duckdb(source=None) -> duckdb.DuckDBPyConnection:
+    """
+    A DuckDB connection that sees only what is registered on it: Python variables are not
+    picked up by replacement scans, and no file or URL can be read except a FileScan's own file.
+    """
+    con = duckdb.connect(config={"python_enable_replacements": False})
+    if DUCKDB_MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{DUCKDB_MEMORY_LIMIT}'")
+    if DUCKDB_SPILL_DIR:
+        con.execute(f"SET temp_directory = '{DUCKDB_SPILL_DIR}'")
+    if isinstance(source, FileScan):
+        con.execute("SET allowed_paths = ?", [[source.path]])
+    # Must come last: external access cannot be re-enabled, nor paths allowed, once it is off
+    con.execute("SET enable_external_access = false")
+    return con
+
+
+class DuckDBEngine:
+    """
+    DuckDB engine with one persistent connection per dataset.
+    The frame is registered once as an Arrow table; each query runs on its own cursor,
+    which is DuckDB's supported way of sharing a connection between threads.
+    """
+    name = "duckdb"
+    dialect = "DuckDB"
+    # Date handling is where the dialects differ most; the agents are told which functions to use
+    dialect_functions = ("date_trunc('month', col), strftime(col, '%Y-%m'), date_diff('day', a, b); "
+                         "no SQLite-only functions such as julianday or date(col, 'start of month')")
+
+    def __init__(self, max_datasets: int = SQL_ENGINE_MAX_DATASETS):
+        # Connections are created outside the LRU lock, so loading one dataset does not block the others
+        self._connections = LRUCache(max_entries=max_datasets, on_evict=self._close)
+
+    @staticmethod
+    def _close(entry):
+        entry[0].close()
+
+    @staticmethod
+    def _connect(df, table_name: str):
+        """Return (connection, arrow_table); arrow_table is None for a FileScan, which is a shared view."""
+        con = connect_duckdb(df)
+        if isinstance(df, FileScan):
+            # Out-of-core: the file is scanned by DuckDB on every query and never loaded into pandas
+            con.execute(f'CREATE VIEW "{table_name}" AS SELECT * FROM {df.source_sql()}')
+            return con, None
+        arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+        con.register(table_name, arrow_table)
+        return con, arrow_table
+
+    def _run(self, df, table_name: str, dataset_id: str, run, tables: dict = None):
+        tables = tables or {}
+        if dataset_id is None:
+            # Unidentified frames cannot be reused safely, so they get a throwaway connection
+            con, _ = self._connect(df, table_name)
+            try:
+                for name, table in tables.items():
+                    con.register(name, table)
+                return run(con)
+            finally:
+                con.close()
+
+        con, arrow_table = self._connections.get_or_create(
+            (dataset_id, table_name), lambda: self._connect(df, table_name)
+        )
+        cursor = con.cursor()
+        try:
+            if arrow_table is not None:
+                # Registrations are local to a connection, so each cursor registers the (zero-copy) table
+                cursor.register(table_name, arrow_table)
+            for name, table in tables.items():
+                cursor.register(name, table)
+            return run(cursor)
+        finally:
+            cursor.close()
+
+    def execute(self, df, sql_query: str, table_name: str = "df",
+                dataset_id: str = None, params=None, timeout: float = None, tables: dict = None) -> pd.DataFrame:
+        """Run sql_query; tables are extra Arrow tables (e.g. rollups) registered for this query only."""
+        def run(cursor):
+            with _deadline(cursor.interrupt, timeout):
+                return cursor.execute(sql_query, params).df()
+        return self._run(df, table_name, dataset_id, run, tables)
+
+    def explain(self, df, sql_query: str, table_name: str = "df", dataset_id: str = None, params=None,
+                tables: dict = None):
+        """The planner's JSON plan for sql_query, with per-operator cardinality estimates."""
+        def run(cursor):
+            rows = cursor.execute(f"EXPLAIN (FORMAT JSON) {sql_query}", params).fetchall()
+            return json.loads(rows[0][1])
+        return self._run(df, table_name, dataset_id, run, tables)
+
+    def register(self, dataset_id: str, df, table_name: str = "df"):
+        """Open the dataset's connection and register df as table_name ahead of its first query."""
+        if dataset_id is not None:
+            self._connections.get_or_create((dataset_id, table_name), lambda: self._connect(df, table_name))
+
+    def release(self, dataset_id: str):
+        for entry in self._connections.pop_where(lambda key: key[0] == dataset_id):
+            self._close(entry)
+
+
+class SQLiteEngine:
+    """
+    SQLite compatibility engine for SQL written in the SQLite dialect.
+    Each dataset is loaded once into a named shared-cache in-memory database, kept alive
+    by a holder connection; every query opens its own connection to that database.
+    """
+    name = "sqlite"
+    dialect = "SQLite"
+    dialect_functions = ("strftime('%Y-%m', col), date(col, 'start of month'), julianday(b) - julianday(a); "
+                         "no DuckDB-only functions such as date_trunc, date_diff or year(col)")
+
+    def __init__(self, max_datasets: int = SQL_ENGINE_MAX_DATASETS):
+        self._databases = LRUCache(max_entries=max_datasets, on_evict=self._close)
+
+    @staticmethod
+    def _close(database):
+        database[1].close()
+
+    @staticmethod
+    def _load(df: pd.DataFrame, table_name: str):
+        uri = f"file:hynox_{uuid.uuid4().hex}?mode=memory&cache=shared"
+        holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        df.to_sql(table_name, holder, index=False)
+        return uri, holder
+
+    def execute(self, df: pd.DataFrame, sql_query: str, table_name: str = "df",
+                dataset_id: str = None, params=None, timeout: float = None) -> pd.DataFrame:
+        if isinstance(df, FileScan):
+            raise TypeError("The SQLite engine cannot query files in place; use the DuckDB engine.")
+        if dataset_id is None:
+            uri, holder = self._load(df, table_name)
+            try:
+                with _deadline(holder.interrupt, timeout):
+                    return pd.read_sql_query(sql_query, holder, params=params)
+            finally:
+                holder.close()
+
+        uri, _ = self._databases.get_or_create((dataset_id, table_name), lambda: self._load(df, table_name))
+        con = sqlite3.connect(uri, uri=True)
+        try:
+            with _deadline(con.interrupt, timeout):
+                return pd.read_sql_query(sql_query, con, params=params)
+        finally:
+            con.close()
+
+    def explain(self, df, sql_query: str, table_name: str = "df", dataset_id: str = None, params=None):
+        """SQLite's planner gives no cardinality estimates; the cost check is skipped."""
+        return None
+
+    def register(self, dataset_id: str, df: pd.DataFrame, table_name: str = "df"):
+        """Load df into the dataset's in-memory database ahead of its first query."""
+        if isinstance(df, FileScan):
+            raise TypeError("The SQLite engine cannot query files in place; use the DuckDB engine.")
+        if dataset_id is not None:
+            self._databases.get_or_create((dataset_id, table_name), lambda: self._load(df, table_name))
+
+    def release(self, dataset_id: str):
+        for database in self._databases.pop_where(lambda key: key[0] == dataset_id):
+            self._close(database)
+
+
+ENGINES = {
+    DuckDBEngine.name: DuckDBEngine(),
+    SQLiteEngine.name: SQLiteEngine(),
+}
+
+
+def get_engine(name: str = None):
+    """Return the engine registered under name, defaulting to SQL_ENGINE."""
+    name = name or SQL_ENGINE
+    if name not in ENGINES:
+        raise ValueError(f"Unknown SQL engine '{name}'. Available engines: {', '.join(ENGINES)}")
+    return ENGINES[name]
+
+
+def release_dataset(dataset_id: str):
+    """Drop every engine's connection for a dataset, e.g. when its file changes."""
+    for engine in ENGINES.values():
+        engine.release(dataset_id)
@@ -0,0 +1,156 @@
+# sql_guard.py
+import json
+import os
+import re
+import threading
+
+import duckdb
+
+SQL_MAX_ESTIMATED_ROWS = int(os.getenv("SQL_MAX_ESTIMATED_ROWS", 100_000_000))  # Per plan operator
+SQL_ROW_LIMIT = int(os.getenv("SQL_ROW_LIMIT", os.getenv("RESPONSE_MAX_ROWS", 100_000)))
+SQL_TIMEOUT_SECONDS = float(os.getenv("SQL_TIMEOUT_SECONDS", 30))
+
+# Table functions that reach outside the registered dataset (files, URLs, other databases)
+EXTERNAL_FUNCTIONS = re.compile(
+    r"\b(read_\w+|\w+_scan|glob|sqlite_attach|load_extension|getenv)\s*\(", re.IGNORECASE
+)
+# Operators DuckDB may leave without an estimate whose output is every pairing of their inputs
+PAIRWISE_OPERATORS = ("CROSS_PRODUCT", "NESTED_LOOP_JOIN", "BLOCKWISE_NL_JOIN")
+_TRAILING_LIMIT = re.compile(r"\blimit\s+(\d+|\?)(\s+offset\s+(\d+|\?))?\s*$", re.IGNORECASE)
+# String literals and quoted identifiers, then comments; only the comments are removed
+_COMMENTS = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")|(--[^\n]*|/\*.*?\*/)""", re.DOTALL)
+_parser = threading.local()
+
+
+class SQLGuardError(Exception):
+    """
+    SQL rejected before execution. kind is "parse" (not valid SQL, worth a repair attempt),
+    "read_only" (not a single SELECT over the dataset) or "cost" (estimated too large to run).
+    """
+
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+
+def strip_comments(sql_query: str) -> str:
+    return _COMMENTS.sub(lambda m: m.group(1) or " ", sql_query)
+
+
+def _parse_tree(sql_query: str) -> dict:
+    # json_serialize_sql needs a connection; it never touches data, so each thread keeps a bare one
+    con = getattr(_parser, "con", None)
+    if con is None:
+        con = _parser.con = duckdb.connect()
+    return json.loads(con.execute("SELECT json_serialize_sql(?)", [sql_query]).fetchone()[0])
+
+
+def _table_references(node, tables: list, ctes: set):
+    """Collect the BASE_TABLE references and CTE names of a serialized statement; table functions are refused."""
+    if isinstance(node, list):
+        for item in node:
+            _table_references(item, tables, ctes)
+        return
+    if not isinstance(node, dict):
+        return
+    if node.get("type") == "TABLE_FUNCTION":
+        raise SQLGuardError("read_only", "Queries may only read the dataset table.")
+    if node.get("type") == "BASE_TABLE":
+        tables.append(node)
+    cte_map = node.get("cte_map")
+    if isinstance(cte_map, dict):
+        ctes.update(entry["key"].lower() for entry in cte_map.get("map", []))
+    for value in node.values():
+        if isinstance(value, (dict, list)):
+            _table_references(value, tables, ctes)
+
+
+def check_tables(sql_query: str, allowed_tables):
+    """
+    Refuse queries reading anything but allowed_tables (and their own CTEs): DuckDB would
+    otherwise read a quoted file path or a URL in FROM as a table.
+    """
+    tree = _parse_tree(sql_query)
+    if tree.get("error"):
+        raise SQLGuardError("read_only", f"Query cannot be checked: {tree.get('error_message')}")
+    tables, ctes = [], set()
+    _table_references(tree["statements"], tables, ctes)
+    allowed = {name.lower() for name in allowed_tables}
+    for table in tables:
+        name = table["table_name"].lower()
+        qualified = table.get("catalog_name") or table.get("schema_name") not in ("", "main")
+        if qualified or (name not in allowed and name not in ctes):
+            raise SQLGuardError("read_only", f"Queries may only read the dataset table, not {table['table_name']!r}.")
+
+
+def check_statement(sql_query: str, allowed_tables=("df",)) -> str:
+    """
+    Parse sql_query with DuckDB's parser and return it as one read-only SELECT over allowed_tables,
+    without comments or the trailing ';'.
+    """
+    sql_query = strip_comments(sql_query)
+    try:
+        statements = duckdb.extract_statements(sql_query)
+    except duckdb.Error as e:
+        raise SQLGuardError("parse", str(e)) from None
+    if len(statements) != 1:
+        raise SQLGuardError("read_only", f"Expected a single statement, got {len(statements)}.")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise SQLGuardError("read_only", f"Only SELECT queries are allowed, got {statements[0].type.name}.")
+    if EXTERNAL_FUNCTIONS.search(sql_query):
+        raise SQLGuardError("read_only", "Queries may only read the dataset table.")
+    check_tables(sql_query, allowed_tables)
+    return sql_query.strip().rstrip(";").strip()
+
+
+def _estimate(node: dict, table_rows: int):
+    """Return (rows this operator outputs, largest output anywhere in its subtree)."""
+    children = [_estimate(child, table_rows) for child in node.get("children", [])]
+    largest = max((child_largest for _, child_largest in children), default=0)
+    try:
+        rows = int(node.get("extra_info", {}).get("Estimated Cardinality"))
+    except (TypeError, ValueError):
+        if node.get("name") in PAIRWISE_OPERATORS:
+            rows = 1
+            for child_rows, _ in children:
+                rows *= max(child_rows, 1)
+        else:
+            rows = max((child_rows for child_rows, _ in children), default=0)
+    # DuckDB estimates a registered Arrow table with no projected columns at one row,
+    # and the projections above it inherit that estimate
+    if node.get("name", "").endswith("_SCAN"):
+        rows = max(rows, table_rows)
+    elif node.get("name") == "PROJECTION":
+        rows = max([rows] + [child_rows for child_rows, _ in children])
+    return rows, max(largest, rows)
+
+
+def max_estimated_rows(plan, table_rows: int = 0) -> int:
+    """
+    Largest estimated output of any operator in a DuckDB EXPLAIN (FORMAT JSON) plan.
+    table_rows, when known, is the floor for every table scan.
+    """
+    roots = plan if isinstance(plan, list) else [plan]
+    return max((_estimate(root, table_rows)[1] for root in roots), default=0)
+
+
+def check_cost(plan, max_rows: int = SQL_MAX_ESTIMATED_ROWS, table_rows: int = 0) -> int:
+    """Reject plans (e.g. an accidental cross join) whose estimated intermediate size exceeds max_rows."""
+    estimate = max_estimated_rows(plan, table_rows)
+    if estimate > max_rows:
+        raise SQLGuardError(
+            "cost", f"Query would process an estimated {estimate:,} rows (limit {max_rows:,}); add filters or aggregation."
+        )
+    return estimate
+
+
+def with_row_limit(statement: str, limit: int = SQL_ROW_LIMIT):
+    """
+    Bound the rows a query can return. Returns (sql, injected): queries without a final LIMIT get
+    LIMIT limit + 1, so the caller can tell a result that was cut off from one that fits exactly.
+    """
+    # A trailing "-- comment" would swallow the appended LIMIT
+    statement = strip_comments(statement).strip().rstrip(";").strip()
+    if _TRAILING_LIMIT.search(statement):
+        return statement, False
+    return f"{statement} LIMIT {limit + 1}", True
@@ -0,0 +1,165 @@
+# sql_templates.py
+import os
+import re
+import threading
+
+from schema_index import SchemaIndex
+
+SQL_TEMPLATE_THRESHOLD = float(os.getenv("SQL_TEMPLATE_THRESHOLD", 0.9))
+SQL_TEMPLATES_ENABLED = os.getenv("SQL_TEMPLATES_ENABLED", "True") == "True"
+
+AGGREGATES = {
+    "total": "SUM", "sum of": "SUM", "sum": "SUM",
+    "average": "AVG", "avg": "AVG", "mean": "AVG",
+    "maximum": "MAX", "max": "MAX", "highest": "MAX",
+    "minimum": "MIN", "min": "MIN", "lowest": "MIN",
+}
+ALIAS_PREFIXES = {"SUM": "total", "AVG": "average", "MAX": "max", "MIN": "min"}
+TIME_BUCKETS = {"day": "%Y-%m-%d", "week": "%Y-%W", "month": "%Y-%m", "year": "%Y"}
+
+_LEAD = r"^(?:what (?:is|are|were|was) |what's |show(?: me)? |give(?: me)? |list |get )?(?:the )?"
+_AGG = r"(?P<agg>" + "|".join(sorted(map(re.escape, AGGREGATES), key=len, reverse=True)) + r")"
+_ROWS = r"(?:rows|records|entries|transactions|orders|items)"
+
+TOP_N = re.compile(_LEAD + r"top (?P<n>\d{1,4}) (?P<dim>.+?) by (?:total |sum of )?(?P<measure>.+)$")
+AGG_BY = re.compile(_LEAD + _AGG + r" (?:of )?(?P<measure>.+?) (?:by|per|for each|across|in each) (?P<dim>.+)$")
+COUNT_WHERE = re.compile(
+    r"^(?:(?:what is |what's )?(?:the )?(?:count|number) of " + _ROWS + r"?|how many " + _ROWS + r"(?: are there)?)"
+    r" ?(?:where|with|having|for) (?P<dim>.+?) (?:=|is|equals|of) (?P<value>.+)$"
+)
+
+_stats = {"matched": 0, "total": 0}
+_stats_lock = threading.Lock()
+
+
+def _quote(identifier: str) -> str:
+    return '"' + str(identifier).replace('"', '""') + '"'
+
+
+def _alias(prefix: str, column: str) -> str:
+    return _quote(f"{prefix}_" + re.sub(r"[^0-9a-zA-Z]+", "_", str(column)).strip("_").lower())
+
+
+def _normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip(" ?.!")
+
+
+class SQLTemplateCompiler:
+    """
+    Compiles common question shapes straight to parameterized SQL against the dataset schema:
+    "total X by Y", "top N Y by X", "average X per month" and "count of rows where Y = v".
+    Column phrases are resolved through the schema index and must consist of the column's name
+    alone: a phrase carrying anything else ("sales in europe", "region in 2023") is a filter the
+    template cannot express. Anything short of a confident, type-correct match returns None so
+    the agent chain handles the question.
+    """
+
+    def __init__(self, dataset_profile: dict, schema_index: SchemaIndex, table_name: str = "df"):
+        self.profile = dataset_profile
+        self.schema_index = schema_index
+        self.table_name = table_name
+        self.numeric = [c for c, info in dataset_profile.items() if info["type"] == "numeric"]
+        self.dimensions = [c for c, info in dataset_profile.items() if info["type"] in ("categorical", "text")]
+        self.datetimes = [c for c, info in dataset_profile.items() if info["type"] == "datetime"]
+
+    def _resolve(self, phrase: str, candidates: list):
+        for col in candidates:
+            if col.lower() == phrase:
+                return col
+        scores = {col: score for col, score in self.schema_index.column_scores(phrase).items() if col in candidates}
+        if not scores:
+            return None
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        best = ranked[0]
+        if scores[best] < SQL_TEMPLATE_THRESHOLD:
+            return None
+        if len(ranked) > 1 and scores[ranked[1]] == scores[best]:
+            return None  # Two equally good columns: ambiguous
+        if not self.schema_index.names_column(phrase, best):
+            return None  # Words beyond the column name are qualifiers the SQL would drop
+        return best
+
+    def _time_bucket(self, phrase: str):
+        bucket = phrase[:-1] if phrase.endswith("s") else phrase
+        if bucket in TIME_BUCKETS and len(self.datetimes) == 1:
+            return self.datetimes[0], TIME_BUCKETS[bucket]
+        return None
+
+    def _aggregate_by(self, agg: str, measure: str, dim: str, limit: int = None):
+        function = AGGREGATES[agg]
+        measure_col = self._resolve(measure, self.numeric)
+        if measure_col is None:
+            return None
+        alias = _alias(ALIAS_PREFIXES[function], measure_col)
+
+        bucket = self._time_bucket(dim) if limit is None else None
+        if bucket is not None:
+            date_col, date_format = bucket
+            period = _quote(dim.rstrip("s"))
+            sql = (
+                f"SELECT strftime('{date_format}', {_quote(date_col)}) AS {period}, "
+                f"{function}({_quote(measure_col)}) AS {alias} FROM {self.table_name} "
+                f"WHERE {_quote(date_col)} IS NOT NULL GROUP BY {period} ORDER BY {period};"
+            )
+            return sql, [], f"{agg} {measure_col} per {dim.rstrip('s')}"
+
+        dim_col = self._resolve(dim, self.dimensions)
+        if dim_col is None:
+            return None
+        sql = (
+            f"SELECT {_quote(dim_col)}, {function}({_quote(measure_col)}) AS {alias} "
+            f"FROM {self.table_name} GROUP BY {_quote(dim_col)} ORDER BY {alias} DESC"
+        )
+        if limit is not None:
+            return sql + f" LIMIT {limit};", [], f"top {limit} {dim_col} by {measure_col}"
+        return sql + ";", [], f"{agg} {measure_col} by {dim_col}"
+
+    def _count_where(self, dim: str, value: str):
+        categorical = [c for c, info in self.profile.items() if info["type"] == "categorical"]
+        dim_col = self._resolve(dim, categorical)
+        if dim_col is None:
+            return None
+        value = value.strip(" '\"")
+        known = {str(v).lower(): v for v in self.profile[dim_col]["unique_values"]}
+        if value not in known:
+            return None
+        sql = f"SELECT COUNT(*) AS row_count FROM {self.table_name} WHERE {_quote(dim_col)} = ?;"
+        return sql, [known[value]], f"count of rows where {dim_col} = {known[value]}"
+
+    def compile(self, question: str):
+        """Return {"SQL", "params", "refined_query"} for a confidently matched question, else None."""
+        text = _normalize_question(question)
+        match = TOP_N.match(text)
+        if match:
+            compiled = self._aggregate_by("total", match["measure"], match["dim"], limit=int(match["n"]))
+        elif AGG_BY.match(text):
+            match = AGG_BY.match(text)
+            compiled = self._aggregate_by(match["agg"], match["measure"], match["dim"])
+        elif COUNT_WHERE.match(text):
+            match = COUNT_WHERE.match(text)
+            compiled = self._count_where(match["dim"], match["value"])
+        else:
+            compiled = None
+
+        if compiled is None:
+            return None
+        sql, params, refined_query = compiled
+        return {"SQL": sql, "params": params, "refined_query": refined_query}
+
+
+def compile_question(question: str, dataset_profile: dict, schema_index: SchemaIndex, table_name: str = "df"):
+    """Try the template fast path for a question and record whether it matched."""
+    if not SQL_TEMPLATES_ENABLED:
+        return None
+    compiled = SQLTemplateCompiler(dataset_profile, schema_index, table_name).compile(question)
+    with _stats_lock:
+        _stats["total"] += 1
+        if compiled is not None:
+            _stats["matched"] += 1
+    return compiled
+
+
+def template_stats() -> dict:
+    """Share of questions answered by the template fast path instead of the agent chain."""
+    with _stats_lock:
+        return {**_stats, "share": _stats["matched"] / _stats["total"] if _stats["total"] else 0.0}
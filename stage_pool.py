@@ -0,0 +1,72 @@
+# stage_pool.py
+import contextvars
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+from telemetry import STAGE_FALLBACKS, get_logger
+
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", 16))
+STAGE_TIMEOUT_SECONDS = float(os.getenv("STAGE_TIMEOUT_SECONDS", 30))
+STAGE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("STAGE_QUEUE_TIMEOUT_SECONDS", 60))  # Longest wait for a free worker
+
+# Bounded pool shared by every request for independent pipeline stages
+_executor = ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline-stage")
+_worker = threading.local()
+logger = get_logger("stage_pool")
+
+
+def _started(fn, started: threading.Event):
+    def run(*args, **kwargs):
+        started.set()
+        _worker.active = True
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _worker.active = False
+    return run
+
+
+def submit(fn, *args, **kwargs):
+    """
+    Start fn(*args, **kwargs) on the shared stage pool and return its Future.
+    The caller's context (request trace and log level) is carried over to the worker.
+    A stage submitted from a stage already on the pool runs at once in the caller's thread:
+    waiting for a free worker from inside one could leave every worker waiting on the others.
+    """
+    started = threading.Event()
+    if getattr(_worker, "active", False):
+        started.set()
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+    else:
+        future = _executor.submit(contextvars.copy_context().run, _started(fn, started), *args, **kwargs)
+    future.started = started
+    return future
+
+
+def result_or_default(future, default, stage: str, timeout: float = STAGE_TIMEOUT_SECONDS):
+    """
+    Wait at most timeout seconds, counted from when the stage started running, for its result;
+    return default if the stage timed out or failed. Time spent queued for a worker does not
+    count, but a stage still queued after STAGE_QUEUE_TIMEOUT_SECONDS is dropped. A timed-out
+    call keeps its worker until it returns, but no longer holds up the request.
+    """
+    started = getattr(future, "started", None)
+    try:
+        if started is not None and not started.wait(STAGE_QUEUE_TIMEOUT_SECONDS) and future.cancel():
+            STAGE_FALLBACKS.labels(stage=stage, reason="queued").inc()
+            logger.warning("⚠️ Stage '%s' waited %gs for a worker — using fallback.", stage, STAGE_QUEUE_TIMEOUT_SECONDS)
+            return default
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        STAGE_FALLBACKS.labels(stage=stage, reason="timeout").inc()
+        logger.warning("⚠️ Stage '%s' timed out after %gs — using fallback.", stage, timeout)
+    except Exception as e:
+        STAGE_FALLBACKS.labels(stage=stage, reason="error").inc()
+        logger.warning("⚠️ Stage '%s' failed: %s — using fallback.", stage, e)
+    return default
@@ -0,0 +1,287 @@
+# telemetry.py
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+TRACE_LOG_LEVEL = os.getenv("TRACE_LOG_LEVEL", "INFO").upper()  # Level finished request traces are logged at
+LOG_LEVEL_HEADER = "X-Log-Level"
+REQUEST_ID_HEADER = "X-Request-ID"
+
+
+def _parse_level(value):
+    if not value:
+        return None
+    level = logging.getLevelName(str(value).upper())
+    return level if isinstance(level, int) else None
+
+
+_default_level = _parse_level(LOG_LEVEL) or logging.INFO
+_trace_level = _parse_level(TRACE_LOG_LEVEL) or logging.INFO
+_request_level = contextvars.ContextVar("request_log_level", default=None)
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# --- Metrics ---
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram("hynox_stage_seconds", "Latency of each pipeline stage", ["stage"], buckets=LATENCY_BUCKETS)
+REQUEST_SECONDS = Histogram("hynox_request_seconds", "End-to-end request latency", ["endpoint", "status"],
+                            buckets=LATENCY_BUCKETS)
+RESPONSE_BYTES = Histogram("hynox_response_bytes", "Encoded response size", ["format"],
+                           buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+RESULT_ROWS = Histogram("hynox_result_rows", "Rows returned by SQL queries",
+                        buckets=(0, 1, 10, 100, 1000, 10_000, 100_000, 1_000_000))
+SQL_QUERIES = Counter("hynox_sql_queries_total", "SQL executions by engine and outcome", ["engine", "outcome"])
+STAGE_FALLBACKS = Counter("hynox_stage_fallbacks_total", "Stages that timed out or failed and used their fallback",
+                          ["stage", "reason"])
+LLM_REQUESTS = Counter("hynox_llm_requests_total", "Model calls by outcome", ["model", "outcome"])
+LLM_SECONDS = Histogram("hynox_llm_request_seconds", "Model call latency", ["model"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Counter("hynox_llm_tokens_total", "Tokens reported by the model", ["model", "kind"])
+PROMPT_TOKENS = Histogram("hynox_prompt_tokens", "Estimated prompt size by agent stage", ["stage"],
+                          buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000))
+JOBS = Counter("hynox_jobs_total", "Background jobs by outcome", ["outcome"])
+JOB_WAIT_SECONDS = Histogram("hynox_job_wait_seconds", "Time jobs spend queued before a worker picks them up",
+                             buckets=LATENCY_BUCKETS)
+
+
+# --- Logging ---
+class _RequestContextFilter(logging.Filter):
+    """Apply the request's log level (default LOG_LEVEL) and tag records with its request id."""
+
+    def filter(self, record):
+        trace = _current_trace.get()
+        record.request_id = trace.request_id if trace is not None else "-"
+        return record.levelno >= effective_level()
+
+
+def _configure_logging():
+    logger = logging.getLogger("hynox")
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    handler.addFilter(_RequestContextFilter())
+    logger.addHandler(handler)
+    # Records reach the handler at every level; the filter decides per request what is emitted
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+
+_configure_logging()
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"hynox.{name}")
+
+
+def effective_level() -> int:
+    level = _request_level.get()
+    return _default_level if level is None else level
+
+
+def log_enabled(level: int) -> bool:
+    """Cheap check before building an expensive log message."""
+    return level >= effective_level()
+
+
+# --- Tracing ---
+class Trace:
+    """Timings and attributes collected for one request, across every thread that works on it."""
+
+    def __init__(self, endpoint: str, request_id: str = None):
+        self.endpoint = endpoint
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.attributes = {}
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add_span(self, name: str, start: float, duration: float, attributes: dict):
+        with self._lock:
+            self.spans.append({
+                "name": name,
+                "start_ms": round((start - self.start) * 1000, 2),
+                "duration_ms": round(duration * 1000, 2),
+                **({"attributes": attributes} if attributes else {}),
+            })
+
+    def annotate(self, **attributes):
+        with self._lock:
+            self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "request_id": self.request_id,
+                "endpoint": self.endpoint,
+                "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+                "attributes": dict(self.attributes),
+                "spans": sorted(self.spans, key=lambda s: s["start_ms"]),
+            }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def annotate(**attributes):
+    """Attach attributes to the current request's trace; a no-op outside a request."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.annotate(**attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a stage: observed in hynox_stage_seconds and, inside a request, added to its trace.
+    Yields the span's attribute dict so the stage can record results (rows, engine, ...).
+    """
+    start = time.perf_counter()
+    try:
+        yield attributes
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(duration)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(name, start, duration, attributes)
+
+
+def traced(name: str, fn):
+    """Wrap fn so each call runs inside span(name); for stages handed to the stage pool."""
+    def wrapper(*args, **kwargs):
+        with span(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def trace_options(request) -> dict:
+    """Request id and log level for request_trace, from headers or the ?log_level= parameter."""
+    return {
+        "request_id": request.headers.get(REQUEST_ID_HEADER),
+        "log_level": request.headers.get(LOG_LEVEL_HEADER) or request.args.get("log_level"),
+    }
+
+
+@contextmanager
+def request_trace(endpoint: str, request_id: str = None, log_level: str = None):
+    """
+    Scope a request: its log level, a Trace collecting spans from every stage, and the
+    request latency histogram. The finished trace is logged as one JSON line at TRACE_LOG_LEVEL.
+    Set trace.attributes["http_status"] (via annotate) before leaving the block.
+    """
+    trace = Trace(endpoint, request_id)
+    trace_token = _current_trace.set(trace)
+    level_token = _request_level.set(_parse_level(log_level))
+    failed = False
+    try:
+        yield trace
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        status = trace.attributes.get("http_status", 500 if failed else 200)
+        REQUEST_SECONDS.labels(endpoint=endpoint, status=str(status)).observe(time.perf_counter() - trace.start)
+        if log_enabled(_trace_level):
+            get_logger("trace").log(_trace_level, "%s", json.dumps(trace.to_dict(), default=str))
+        _request_level.reset(level_token)
+        _current_trace.reset(trace_token)
+
+
+# --- Cache and decision statistics ---
+class _StatsCollector:
+    """Exports the hit rates and counters the caches and local fast paths already keep."""
+
+    def describe(self):
+        # Registering must not call collect(): the modules it reads may still be importing
+        return []
+
+    def collect(self):
+        from dataset_cache import dataset_cache
+        from llm_cache import get_llm_cache
+        from result_cache import get_result_cache
+        from chart_selector import decision_stats
+        from schema_index import relevance_stats
+        from sql_templates import template_stats
+        import gemini_pool
+        import jobs
+
+        hits = CounterMetricFamily("hynox_cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("hynox_cache_misses", "Cache misses", labels=["cache"])
+        hit_ratio = GaugeMetricFamily("hynox_cache_hit_ratio", "Cache hit ratio since start", labels=["cache"])
+        caches = {"dataset": dataset_cache.stats()}
+        llm_cache = get_llm_cache()
+        if llm_cache is not None:
+            caches["llm"] = llm_cache.stats()
+        result_cache = get_result_cache()
+        if result_cache is not None:
+            caches["result"] = result_cache.stats()
+        for name, stats in caches.items():
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            hit_ratio.add_metric([name], stats["hit_rate"])
+        yield from (hits, misses, hit_ratio)
+
+        dataset = caches["dataset"]
+        yield GaugeMetricFamily("hynox_dataset_cache_bytes", "Bytes held by the dataset cache", value=dataset["bytes"])
+        yield CounterMetricFamily("hynox_dataset_cache_evictions", "Dataset cache evictions", value=dataset["evictions"])
+        if "result" in caches:
+            yield GaugeMetricFamily("hynox_result_cache_bytes", "Bytes held by the result cache",
+                                    value=caches["result"]["bytes"])
+        if "llm" in caches:
+            yield CounterMetricFamily("hynox_llm_cache_latency_saved_seconds", "Model latency avoided by cache hits",
+                                      value=caches["llm"]["latency_saved_seconds"])
+
+        local = GaugeMetricFamily("hynox_local_decision_ratio", "Share of decisions made without the model",
+                                  labels=["decision"])
+        local.add_metric(["chart"], decision_stats()["rule_rate"])
+        local.add_metric(["relevance"], relevance_stats()["local_rate"])
+        local.add_metric(["sql_template"], template_stats()["share"])
+        yield local
+
+        pool = gemini_pool._pool  # Only report a pool that already exists
+        if pool is not None:
+            calls = CounterMetricFamily("hynox_gemini_key_calls", "Successful calls per API key", labels=["key"])
+            limited = CounterMetricFamily("hynox_gemini_key_rate_limited", "429s per API key", labels=["key"])
+            in_flight = GaugeMetricFamily("hynox_gemini_key_in_flight", "Calls in flight per API key", labels=["key"])
+            for slot in pool.utilization():
+                calls.add_metric([slot["key"]], slot["calls"])
+                limited.add_metric([slot["key"]], slot["rate_limited"])
+                in_flight.add_metric([slot["key"]], slot["in_flight"])
+            yield from (calls, limited, in_flight)
+
+        job_queue = jobs._queue
+        if job_queue is not None:
+            job_stats = job_queue.stats()
+            depth = GaugeMetricFamily("hynox_job_queue_jobs", "Background jobs held by the queue", labels=["state"])
+            for state in ("queued", "running", "finished"):
+                depth.add_metric([state], job_stats[state])
+            yield depth
+
+
+_stats_collector = _StatsCollector()
+REGISTRY.register(_stats_collector)
+
+
+def metrics_payload():
+    """Return (body, content_type) for /metrics; aggregates gunicorn workers when PROMETHEUS_MULTIPROC_DIR is set."""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_stats_collector)  # Cache statistics are those of the worker serving the scrape
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,24 @@
+# conftest.py
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# The application modules live flat at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sales_df():
+    rng = np.random.default_rng(0)
+    rows = 400
+    return pd.DataFrame({
+        "Invoice No": np.arange(1, rows + 1),
+        "Order Date": pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D"),
+        "Region": rng.choice(["Europe", "Asia", "America"], rows),
+        "Customer": [f"Customer {i}" for i in rng.integers(0, 60, rows)],
+        "Sales": rng.uniform(10, 1000, rows).round(2),
+        "Amount": rng.integers(1, 20, rows),
+    })
@@ -0,0 +1,68 @@
+# test_batch.py
+import time
+
+import pytest
+
+import query_processing
+from query_processing import process_queries
+
+QUESTIONS = [f"question {i}" for i in range(6)]
+
+
+def _plan(sql):
+    return {"relevant": True, "feasible": True, "refined_query": "planned", "sql": sql, "chart_type": "bar"}
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    retried = []
+
+    def process_query(api_key, dataset_columns, df, user_query, dataset_id=None, **kwargs):
+        retried.append(user_query)
+        time.sleep(0.3)
+        if user_query == "question 3":
+            raise RuntimeError("model unavailable")
+        return {"original_query": user_query, "refined_query": "retried", "status": True,
+                "sql_query": {"SQL": "SELECT 1;"}}
+
+    monkeypatch.setattr(query_processing, "GeminiLLM", lambda api_key=None: None)
+    monkeypatch.setattr(query_processing, "compile_question", lambda *args, **kwargs: None)
+    monkeypatch.setattr(query_processing, "process_query", process_query)
+    return monkeypatch, retried
+
+
+def _run(sales_df):
+    return process_queries(None, sales_df.columns.tolist(), sales_df, QUESTIONS)
+
+
+def test_partial_plan_retries_only_the_missing_questions(sales_df, agents):
+    monkeypatch, retried = agents
+    monkeypatch.setattr(query_processing.BatchPlannerAgent, "plan",
+                        lambda self, queries: [_plan("SELECT 2;") if i % 2 == 0 else None for i in range(len(queries))])
+    results = _run(sales_df)
+    assert sorted(retried) == ["question 1", "question 3", "question 5"]
+    assert [r["refined_query"] for r in results[::2]] == ["planned"] * 3
+    assert results[1]["refined_query"] == results[5]["refined_query"] == "retried"
+
+
+def test_failed_plan_retries_every_question_concurrently(sales_df, agents):
+    monkeypatch, retried = agents
+
+    def failing_plan(self, queries):
+        raise RuntimeError("429 on every key")
+
+    monkeypatch.setattr(query_processing.BatchPlannerAgent, "plan", failing_plan)
+    start = time.perf_counter()
+    results = _run(sales_df)
+    # Six retries of 0.3s each, run side by side rather than one after another
+    assert time.perf_counter() - start < 1.2
+    assert sorted(retried) == QUESTIONS
+    assert [r["original_query"] for r in results] == QUESTIONS
+
+
+def test_one_failing_question_does_not_affect_the_others(sales_df, agents):
+    monkeypatch, _ = agents
+    monkeypatch.setattr(query_processing.BatchPlannerAgent, "plan", lambda self, queries: [None] * len(queries))
+    results = _run(sales_df)
+    assert results[3]["status"] is False and "model unavailable" in results[3]["error"]
+    assert all(r["status"] for i, r in enumerate(results) if i != 3)
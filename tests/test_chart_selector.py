@@ -0,0 +1,68 @@
+# test_chart_selector.py
+import pandas as pd
+import pytest
+
+import chart_selector
+import visualization
+from chart_selector import CHART_CONFIDENCE_THRESHOLD, select_chart
+from visualization import get_visualization_json
+
+
+@pytest.mark.parametrize("frame, query, expected", [
+    (pd.DataFrame({"total": [120.0]}), "total sales", "kpi"),
+    (pd.DataFrame({"month": ["2024-01", "2024-02", "2024-03"], "sales": [1, 2, 3]}), "sales by month", "line"),
+    (pd.DataFrame({"region": ["Europe", "Asia", "America"], "sales": [1, 2, 3]}), "sales by region", "bar"),
+    (pd.DataFrame({"region": ["Europe", "Asia", "America"], "sales": [1, 2, 3]}), "share of sales by region", "pie"),
+    (pd.DataFrame({"sales": [1, 2, 3], "amount": [4, 5, 6]}), "sales against amount", "scatter"),
+    (pd.DataFrame({"customer": ["a", "b"]}), "list customers", "table"),
+])
+def test_confident_rule_choices(frame, query, expected):
+    chart_type, confidence = select_chart(frame, query)
+    assert chart_type == expected
+    assert confidence >= CHART_CONFIDENCE_THRESHOLD
+
+
+def test_pie_needs_non_negative_values():
+    frame = pd.DataFrame({"region": ["Europe", "Asia"], "profit": [5, -2]})
+    assert select_chart(frame, "share of profit")[0] == "bar"
+
+
+class FakePool:
+    def __init__(self, text: str):
+        self.text = text
+        self.calls = 0
+
+    def generate_content(self, **kwargs):
+        self.calls += 1
+        return type("Response", (), {"text": self.text})()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = FakePool('{"visualization": "line"}')
+    monkeypatch.setattr(visualization, "get_client_pool", lambda api_key: pool)
+    monkeypatch.setattr(chart_selector, "_decisions", {"rule": 0, "llm": 0})
+    return pool
+
+
+def test_confident_choice_skips_the_model(pool):
+    result_df = pd.DataFrame({"region": ["Europe", "Asia"], "sales": [1, 2]})
+    chart = get_visualization_json("key", "sales by region", [], result_df=result_df)
+    assert chart["type"] == "bar"
+    assert pool.calls == 0
+    assert chart_selector.decision_stats()["rule"] == 1
+
+
+def test_unsure_choice_falls_back_to_the_model(pool):
+    # One row of several values has no confident shape
+    result_df = pd.DataFrame({"region": ["Europe"], "sales": [1], "amount": [2]})
+    chart = get_visualization_json("key", "europe figures", [{"region": "Europe"}], result_df=result_df)
+    assert chart["type"] == "line"
+    assert pool.calls == 1
+    assert chart_selector.decision_stats()["llm"] == 1
+
+
+def test_unparseable_model_reply_falls_back_to_table(pool):
+    pool.text = "not json"
+    chart = get_visualization_json("key", "anything", [], result_df=pd.DataFrame({"a": [1], "b": [2], "c": ["x"]}))
+    assert chart == {"type": "table", "data": [], "fallback": True}
@@ -0,0 +1,46 @@
+# test_dataset_cache.py
+import threading
+import time
+
+import pandas as pd
+
+import dataset_cache
+from dataset_cache import DatasetCache, load_dataset
+
+
+def test_concurrent_cold_loads_parse_once(tmp_path, monkeypatch):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n")
+    monkeypatch.setattr(dataset_cache, "dataset_cache", DatasetCache())
+    calls = []
+
+    def loader(file_url, fingerprint):
+        calls.append(file_url)
+        time.sleep(0.2)
+        return pd.read_csv(file_url)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(load_dataset(str(path), loader))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(calls) == 1
+    assert len({id(df) for _, df in results}) == 1
+
+
+def test_frames_over_budget_are_not_cached():
+    cache = DatasetCache(max_bytes=4096)
+    cache.get_or_load("small", lambda: pd.DataFrame({"a": [1]}))
+    big = pd.DataFrame({"a": range(10_000)})
+    assert cache.get_or_load("big", lambda: big) is big
+    assert cache.get("big") is None and cache.get("small") is not None
+
+
+def test_local_hashes_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_cache, "_local_hashes", dataset_cache.LRUCache(max_entries=2))
+    for i in range(5):
+        path = tmp_path / f"{i}.csv"
+        path.write_text(f"a\n{i}\n")
+        assert dataset_cache.dataset_fingerprint(str(path)) is not None
+    assert len(dataset_cache._local_hashes) == 2
@@ -0,0 +1,63 @@
+# test_gemini_pool.py
+import pytest
+
+from gemini_pool import GeminiClientPool
+
+
+class RateLimited(Exception):
+    code = 429
+
+
+class FakeModels:
+    def __init__(self, key: str, calls: list, fail: Exception = None):
+        self.key = key
+        self.calls = calls
+        self.fail = fail
+
+    def generate_content(self, **kwargs):
+        self.calls.append(self.key)
+        if self.fail is not None:
+            raise self.fail
+        return f"response from {self.key}"
+
+
+class FakeClient:
+    def __init__(self, models: FakeModels):
+        self.models = models
+
+
+def make_pool(failures: dict, calls: list) -> GeminiClientPool:
+    return GeminiClientPool(
+        ["key-1", "key-2"],
+        client_factory=lambda api_key: FakeClient(FakeModels(api_key, calls, failures.get(api_key))),
+    )
+
+
+def test_rate_limited_key_fails_over_to_the_next():
+    calls = []
+    pool = make_pool({"key-1": RateLimited("quota")}, calls)
+    pool._slots[1].bucket.tokens = 4  # key-1 has the most budget left, so it is tried first
+
+    assert pool.generate_content(model="m", contents="hi") == "response from key-2"
+    assert calls == ["key-1", "key-2"]
+
+    report = {entry["key"]: entry for entry in pool.utilization()}
+    assert report["...ey-1"]["rate_limited"] == 1
+    assert report["...ey-1"]["cooldown_seconds"] > 0
+    assert report["...ey-2"]["calls"] == 1
+
+
+def test_raises_when_every_key_is_rate_limited():
+    calls = []
+    pool = make_pool({"key-1": RateLimited("quota"), "key-2": RateLimited("quota")}, calls)
+    with pytest.raises(RateLimited):
+        pool.generate_content(model="m", contents="hi")
+    assert sorted(calls) == ["key-1", "key-2"]
+
+
+def test_other_errors_do_not_fail_over():
+    calls = []
+    pool = make_pool({"key-1": ValueError("bad request"), "key-2": ValueError("bad request")}, calls)
+    with pytest.raises(ValueError):
+        pool.generate_content(model="m", contents="hi")
+    assert len(calls) == 1
@@ -0,0 +1,79 @@
+# test_ingest.py
+import os
+
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import ingest_file, infer_types, prune_cache, read_manifest
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    path = tmp_path / "ingest"
+    monkeypatch.setattr(ingest, "INGEST_CACHE_DIR", str(path))
+    return path
+
+
+@pytest.mark.parametrize("values", [
+    ["Jan", "Feb", "Mar", "Apr"],
+    ["1-2", "3-4", "10-12", "2-1"],
+    ["10/12", "1/3", "4/5", "12/12"],
+    ["A-1", "B-2", "C-3", "D-4"],
+    ["north", "south", "east", "west"],
+])
+def test_non_dates_stay_text(values):
+    df = infer_types(pd.DataFrame({"code": values * 5}))
+    assert df["code"].tolist() == values * 5
+
+
+def test_iso_dates_are_parsed():
+    df = infer_types(pd.DataFrame({"d": ["2024-01-05", "2024-02-10", "2023-12-31", None]}))
+    assert pd.api.types.is_datetime64_any_dtype(df["d"])
+    assert df["d"].iloc[0] == pd.Timestamp("2024-01-05")
+    assert df["d"].isna().iloc[3]
+
+
+def test_day_first_dates_use_one_format():
+    df = infer_types(pd.DataFrame({"d": ["05/01/2024", "13/01/2024", "28/02/2024", "01/03/2024"]}))
+    assert df["d"].tolist() == [pd.Timestamp(2024, 1, 5), pd.Timestamp(2024, 1, 13),
+                                pd.Timestamp(2024, 2, 28), pd.Timestamp(2024, 3, 1)]
+
+
+def test_values_outside_the_format_or_year_range_become_nat():
+    values = ["2024-01-%02d" % day for day in range(1, 20)] + ["0001-01-01", "soon"]
+    df = infer_types(pd.DataFrame({"d": values}))
+    assert pd.api.types.is_datetime64_any_dtype(df["d"])
+    assert df["d"].isna().sum() == 2
+
+
+def test_stale_ingested_copies_are_reparsed(cache_dir, tmp_path):
+    source = tmp_path / "data.csv"
+    source.write_text("month,amount\nJan,1\nFeb,2\n")
+    ingest_file(str(source), "fp1")
+    assert read_manifest("fp1")["version"] == ingest.INGEST_FORMAT_VERSION
+
+    # A copy written by an older version is ignored and replaced
+    manifest = cache_dir / "fp1.json"
+    manifest.write_text(manifest.read_text().replace(f'"version": {ingest.INGEST_FORMAT_VERSION}', '"version": 1'))
+    df = ingest_file(str(source), "fp1")
+    assert df["month"].tolist() == ["Jan", "Feb"]
+    assert read_manifest("fp1")["version"] == ingest.INGEST_FORMAT_VERSION
+
+
+def test_cache_is_pruned_least_recently_used_first(cache_dir, tmp_path):
+    source = tmp_path / "data.csv"
+    source.write_text("a\n" + "\n".join(str(i) for i in range(1000)) + "\n")
+    for i, fingerprint in enumerate(["old", "mid", "new"]):
+        ingest_file(str(source), fingerprint)
+        for name in os.listdir(cache_dir):
+            if name.startswith(fingerprint):
+                os.utime(cache_dir / name, (1000 + i, 1000 + i))
+    size = sum(os.path.getsize(cache_dir / name) for name in os.listdir(cache_dir) if name.startswith("new"))
+
+    prune_cache(max_bytes=2 * size)
+    remaining = {name.split(".")[0] for name in os.listdir(cache_dir)}
+    assert remaining == {"mid", "new"}
+
+    prune_cache(max_bytes=0, keep="mid")
+    assert {name.split(".")[0] for name in os.listdir(cache_dir)} == {"mid"}
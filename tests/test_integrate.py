@@ -0,0 +1,30 @@
+import integrate
+from result_cache import ResultCache
+
+SQL = 'SELECT Region, SUM(Sales) AS total FROM df GROUP BY Region ORDER BY Region'
+
+
+def _answer(sales_df, cache, monkeypatch, visualization):
+    monkeypatch.setattr(integrate, "get_result_cache", lambda: cache)
+    monkeypatch.setattr(integrate, "get_visualization_json", visualization)
+    response = {"status": True, "sql_query": {"SQL": SQL}, "refined_query": "Sales by region"}
+    events = dict(integrate._answer_stages("sales by region", response, "sales", sales_df, sales_df, "records"))
+    return events["response"][0]
+
+
+def test_chart_fallback_is_not_cached(sales_df, monkeypatch):
+    cache = ResultCache()
+
+    def failing(*args, **kwargs):
+        raise RuntimeError("model unavailable")
+
+    response = _answer(sales_df, cache, monkeypatch, failing)
+    assert response["status"] == "success" and response["data"]["type"] == "table"
+    assert cache.get("sales", SQL) is None
+
+
+def test_chosen_chart_is_cached(sales_df, monkeypatch):
+    cache = ResultCache()
+    response = _answer(sales_df, cache, monkeypatch, lambda *args, **kwargs: {"type": "bar"})
+    assert response["data"]["type"] == "bar"
+    assert cache.get("sales", SQL).chart["type"] == "bar"
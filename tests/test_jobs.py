@@ -0,0 +1,78 @@
+# test_jobs.py
+import time
+
+import pandas as pd
+import pytest
+
+import jobs
+from backend import app
+from jobs import LocalJobQueue
+from response_encoding import stage_payload
+
+RESPONSE = {"status": "success", "summary": "Sales by region.", "data": {"type": "bar", "mapping": {"name": "Region", "value1": "Sales"}}, "table": None}
+
+
+def fake_stages(chat_context, file_url, fmt, session=None):
+    if chat_context == "fail":
+        raise ValueError("pipeline failed")
+    yield "refined_query", "sales by region"
+    yield "response", (RESPONSE, pd.DataFrame({"Region": ["Asia", "Europe"], "Sales": [1.5, 2.5]}))
+
+
+def fake_run_in_process(chat_context, file_url, fmt, events):
+    # Runs in the spawned child, where the parent's monkeypatches do not apply
+    for stage, payload in fake_stages(chat_context, file_url, fmt):
+        events.put((stage, stage_payload(stage, payload, fmt)))
+
+
+@pytest.fixture(params=["thread", "process"])
+def client(request, monkeypatch):
+    monkeypatch.setattr(jobs, "pipeline_stages", fake_stages)
+    monkeypatch.setattr(jobs, "_run_in_process", fake_run_in_process)
+    job_queue = LocalJobQueue(workers=1, executor=request.param)
+    monkeypatch.setattr(jobs, "_queue", job_queue)
+    yield app.test_client()
+    job_queue._threads.shutdown(wait=True)
+    if job_queue._processes is not None:
+        job_queue._processes.shutdown(wait=True)
+        job_queue._manager.shutdown()
+
+
+def poll(client, job_id: str, timeout: float = 60) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        body = client.get(f"/jobs/{job_id}").get_json()
+        if body["state"] in jobs.FINISHED_STATES:
+            return body
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish in {timeout}s")
+
+
+def test_submit_poll_and_result(client):
+    submitted = client.post("/jobs", json={"chat_context": "sales per region", "file_url": "sales.csv"})
+    assert submitted.status_code == 202
+    job_id = submitted.get_json()["job_id"]
+    assert submitted.headers["Location"] == f"/jobs/{job_id}"
+
+    body = poll(client, job_id)
+    assert body["state"] == jobs.DONE
+    assert [event["event"] for event in body["events"]] == ["refined_query", "response"]
+    assert body["response"]["table"]["rows"] == [{"Region": "Asia", "Sales": 1.5}, {"Region": "Europe", "Sales": 2.5}]
+    assert body["response"]["data"]["type"] == "bar"
+    # The process executor really handed the pipeline to a child process
+    assert (jobs._queue._processes is not None) == (jobs._queue.executor == "process")
+
+    later = client.get(f"/jobs/{job_id}?since={body['next_event']}").get_json()
+    assert later["events"] == []
+
+
+def test_failed_job_reports_its_error(client):
+    job_id = client.post("/jobs", json={"chat_context": "fail", "file_url": "sales.csv"}).get_json()["job_id"]
+    body = poll(client, job_id)
+    assert body["state"] == jobs.FAILED
+    assert "pipeline failed" in body["error"]
+    assert body["events"][-1]["event"] == "error"
+
+
+def test_unknown_job_is_not_found(client):
+    assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,111 @@
+# test_large_files.py
+import io
+import os
+import threading
+import time
+
+import pytest
+
+import large_files
+from integrate import load_source
+from process_sql import execute_sql_query
+from sql_engines import FileScan
+
+
+class _Response(io.BytesIO):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _serve(monkeypatch, payloads):
+    calls = []
+
+    def urlopen(url):
+        calls.append(url)
+        return _Response(payloads[url])
+
+    monkeypatch.setattr(large_files.urllib.request, "urlopen", urlopen)
+    return calls
+
+
+def test_unvalidated_download_is_keyed_by_url_and_reused(tmp_path, monkeypatch):
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR", str(tmp_path))
+    calls = _serve(monkeypatch, {"https://example.com/a.csv": b"x\n1\n"})
+
+    first = large_files._local_path("https://example.com/a.csv", None)
+    second = large_files._local_path("https://example.com/a.csv", None)
+    assert first == second
+    assert calls == ["https://example.com/a.csv"]
+    assert os.listdir(tmp_path) == [os.path.basename(first)]
+
+
+def test_unvalidated_download_expires(tmp_path, monkeypatch):
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR", str(tmp_path))
+    calls = _serve(monkeypatch, {"https://example.com/a.csv": b"x\n1\n"})
+
+    path = large_files._local_path("https://example.com/a.csv", None)
+    old = os.path.getmtime(path) - large_files.UNVALIDATED_DOWNLOAD_TTL_SECONDS - 1
+    os.utime(path, (old, old))
+    large_files._local_path("https://example.com/a.csv", None)
+    assert len(calls) == 2
+
+
+def test_old_downloads_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR", str(tmp_path))
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR_MAX_BYTES", 150)
+    _serve(monkeypatch, {f"https://example.com/{i}.csv": b"x" * 100 for i in range(3)})
+
+    paths = []
+    for i in range(3):
+        paths.append(large_files._local_path(f"https://example.com/{i}.csv", f"fp{i}"))
+        os.utime(paths[-1], (1000 + i, 1000 + i))
+    assert sorted(os.listdir(tmp_path)) == ["fp2.csv"]
+    assert not large_files._download_locks
+
+
+def test_concurrent_requests_download_a_path_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR", str(tmp_path))
+    calls = []
+
+    def urlopen(url):
+        calls.append(url)
+        time.sleep(0.2)
+        return _Response(b"x\n1\n")
+
+    monkeypatch.setattr(large_files.urllib.request, "urlopen", urlopen)
+    paths = []
+    threads = [threading.Thread(target=lambda: paths.append(large_files._local_path("https://example.com/a.csv", "fp")))
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["https://example.com/a.csv"]
+    assert os.listdir(tmp_path) == ["fp.csv"] and len(set(paths)) == 1
+    assert not large_files._download_locks
+
+
+def test_failed_download_leaves_no_partial_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(large_files, "LARGE_FILE_DIR", str(tmp_path))
+
+    def urlopen(url):
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(large_files.urllib.request, "urlopen", urlopen)
+    with pytest.raises(OSError):
+        large_files._local_path("https://example.com/a.csv", "fp")
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize("threshold", [0, 1 << 40])
+def test_parquet_files_are_answered_in_memory_and_out_of_core(tmp_path, monkeypatch, sales_df, threshold):
+    path = str(tmp_path / "sales.parquet")
+    sales_df.to_parquet(path, index=False)
+    monkeypatch.setattr(large_files, "LARGE_FILE_THRESHOLD_BYTES", threshold)
+    dataset_id, source, df = load_source(path)
+    assert isinstance(source, FileScan) == (threshold == 0)
+    result = execute_sql_query(source, 'SELECT SUM("Sales") AS s FROM df', dataset_id=dataset_id)
+    assert result["s"].tolist() == [round(sales_df["Sales"].sum(), 2)]
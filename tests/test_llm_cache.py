@@ -0,0 +1,53 @@
+# test_llm_cache.py
+import time
+
+import llm_cache
+from llm_cache import LLMResponseCache, cached_generate
+
+
+def test_hit_and_miss(tmp_path):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.sqlite3"))
+    assert cache.get("model", "prompt") is None
+    cache.put("model", "prompt", "answer", latency=1.5)
+    # Whitespace in the prompt is normalized away; the model is part of the key
+    assert cache.get("model", "  prompt\n") == "answer"
+    assert cache.get("other-model", "prompt") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+    assert stats["latency_saved_seconds"] == 1.5
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = LLMResponseCache(path=str(tmp_path / "llm.sqlite3"), ttl_seconds=60)
+    cache.put("model", "prompt", "answer", latency=0.1)
+    assert cache.get("model", "prompt") == "answer"
+
+    now = time.time()
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + 61)
+    assert cache.get("model", "prompt") is None
+    cache.evict()
+    monkeypatch.undo()
+    assert cache.get("model", "prompt") is None
+
+
+def test_cached_generate_skips_the_model_on_a_hit(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", True)
+    monkeypatch.setattr(llm_cache, "_cache", LLMResponseCache(path=str(tmp_path / "llm.sqlite3")))
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return "answer"
+
+    assert cached_generate("model", "prompt", generate) == "answer"
+    assert cached_generate("model", "prompt", generate) == "answer"
+    assert len(calls) == 1
+
+
+def test_cached_generate_without_cache_always_calls_the_model(monkeypatch):
+    monkeypatch.setattr(llm_cache, "LLM_CACHE_ENABLED", False)
+    calls = []
+    for _ in range(2):
+        cached_generate("model", "prompt", lambda: calls.append(1) or "answer")
+    assert len(calls) == 2
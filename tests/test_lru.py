@@ -0,0 +1,84 @@
+# test_lru.py
+import threading
+import time
+
+from lru import LRUCache
+
+
+def test_creating_one_entry_does_not_block_others():
+    lru = LRUCache(max_entries=4)
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_create():
+        calls.append("slow")
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    threads = [threading.Thread(target=lru.get_or_create, args=("a", slow_create)) for _ in range(2)]
+    threads[0].start()
+    started.wait(5)
+    threads[1].start()
+
+    start = time.perf_counter()
+    assert lru.get_or_create("b", lambda: "fast") == "fast"
+    assert time.perf_counter() - start < 1
+
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert calls == ["slow"]  # The waiting caller reused the value instead of creating it again
+    assert lru.get_or_create("a", lambda: "again") == "slow"
+
+
+def test_count_bound_evicts_least_recently_used():
+    evicted = []
+    lru = LRUCache(max_entries=2, on_evict=evicted.append)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1
+    lru.put("c", 3)
+    assert evicted == [2]
+    assert "a" in lru and "b" not in lru
+
+
+def test_byte_bound_keeps_the_newest_entry():
+    lru = LRUCache(max_bytes=100)
+    lru.put("a", "a", 60)
+    lru.put("b", "b", 60)
+    assert "a" not in lru and lru.stats()["bytes"] == 60
+    lru.put("huge", "huge", 500)
+    assert len(lru) == 1 and lru.get("huge") == "huge"
+
+
+def test_resize_only_applies_to_the_same_value():
+    lru = LRUCache(max_bytes=100)
+    value = ["payload"]
+    lru.put("a", value, 10)
+    assert lru.resize("a", value, 40)
+    assert not lru.resize("a", ["other"], 90)
+    assert lru.stats()["bytes"] == 40
+
+
+def test_pop_where_removes_matching_keys():
+    lru = LRUCache()
+    for key in [("x", "df"), ("x", "t"), ("y", "df")]:
+        lru.put(key, key[1], 5)
+    assert sorted(lru.pop_where(lambda key: key[0] == "x")) == ["df", "t"]
+    assert len(lru) == 1 and lru.stats()["bytes"] == 5
+
+
+def test_failed_create_is_retried_and_leaves_no_lock_behind():
+    lru = LRUCache()
+
+    def failing():
+        raise OSError("unreadable")
+
+    for _ in range(2):
+        try:
+            lru.get_or_create("a", failing)
+        except OSError:
+            pass
+    assert lru.get_or_create("a", lambda: "ok") == "ok"
+    assert not lru._creating
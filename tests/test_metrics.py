@@ -0,0 +1,42 @@
+# test_metrics.py
+from prometheus_client.parser import text_string_to_metric_families
+
+from backend import app
+from telemetry import request_trace, span
+
+
+def scrape() -> dict:
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    return {family.name: family for family in text_string_to_metric_families(response.get_data(as_text=True))}
+
+
+def sample_value(family, suffix: str, **labels) -> float:
+    for sample in family.samples:
+        if sample.name == family.name + suffix and all(sample.labels.get(k) == v for k, v in labels.items()):
+            return sample.value
+    return 0.0
+
+
+def test_scrape_contains_stage_and_request_histograms():
+    before = scrape()
+    with request_trace("/test/metrics"):
+        with span("metrics_test_stage"):
+            pass
+
+    families = scrape()
+    stage = families["hynox_stage_seconds"]
+    assert stage.type == "histogram"
+    assert sample_value(stage, "_count", stage="metrics_test_stage") == \
+        sample_value(before["hynox_stage_seconds"], "_count", stage="metrics_test_stage") + 1
+    assert sample_value(stage, "_bucket", stage="metrics_test_stage", le="+Inf") >= 1
+
+    request = families["hynox_request_seconds"]
+    assert sample_value(request, "_count", endpoint="/test/metrics", status="200") >= 1
+
+
+def test_scrape_contains_cache_statistics():
+    families = scrape()
+    assert any(sample.labels.get("cache") == "dataset" for sample in families["hynox_cache_hits"].samples)
+    assert "hynox_dataset_cache_bytes" in families
+    assert "hynox_local_decision_ratio" in families
@@ -0,0 +1,21 @@
+# test_process_sql.py
+from process_sql import execute_sql_query
+
+BROKEN = 'SELECT "Regoin", SUM("Sales") FROM df GROUP BY 1'
+
+
+def test_repair_fixes_a_binder_error(sales_df):
+    result = execute_sql_query(sales_df, BROKEN, repair=lambda sql, error: sql.replace("Regoin", "Region"))
+    assert len(result) == sales_df["Region"].nunique()
+    assert "Region" in result.attrs["sql"]
+
+
+def test_failing_repair_reports_no_result_instead_of_raising(sales_df):
+    errors = []
+
+    def repair(sql, error):
+        errors.append(error)
+        raise RuntimeError("429 RESOURCE_EXHAUSTED on every key")
+
+    assert execute_sql_query(sales_df, BROKEN, repair=repair) is None
+    assert "Regoin" in errors[0]
@@ -0,0 +1,39 @@
+# test_profiler.py
+import pandas as pd
+
+import profiler
+from lru import LRUCache
+from profiler import profile_dataset, summarize_frame
+
+
+def test_summary_types_and_ranges(sales_df):
+    summary = summarize_frame(sales_df)
+    assert summary["Sales"] == {"type": "numeric", "min": sales_df["Sales"].min(), "max": sales_df["Sales"].max()}
+    assert summary["Order Date"]["type"] == "datetime"
+    assert summary["Order Date"]["min"] == str(sales_df["Order Date"].min().date())
+    assert summary["Region"]["type"] == "categorical"
+    assert sorted(summary["Region"]["unique_values"]) == ["America", "Asia", "Europe"]
+    assert summary["Customer"]["type"] == "text"
+    assert len(summary["Customer"]["sample_values"]) == profiler.TEXT_SAMPLE_VALUES
+
+
+def test_large_frames_keep_exact_ranges(monkeypatch):
+    monkeypatch.setattr(profiler, "PROFILE_SAMPLE_ROWS", 100)
+    df = pd.DataFrame({"n": range(10_000)})
+    assert summarize_frame(df)["n"] == {"type": "numeric", "min": 0.0, "max": 9999.0}
+
+
+def test_profiles_are_cached_per_dataset(sales_df, monkeypatch):
+    monkeypatch.setattr(profiler, "_profiles", LRUCache(max_entries=2))
+    calls = []
+    real = profiler.summarize_frame
+    monkeypatch.setattr(profiler, "summarize_frame", lambda df: calls.append(1) or real(df))
+
+    first = profile_dataset(sales_df, "ds1")
+    assert profile_dataset(sales_df, "ds1") is first
+    profile_dataset(sales_df)  # Frames without a dataset_id are profiled every time
+    profile_dataset(sales_df)
+    profile_dataset(sales_df, "ds2")
+    profile_dataset(sales_df, "ds3")  # Evicts ds1
+    profile_dataset(sales_df, "ds1")
+    assert len(calls) == 6
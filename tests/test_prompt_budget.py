@@ -0,0 +1,41 @@
+# test_prompt_budget.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from profiler import summarize_frame
+from prompt_budget import PROMPT_TOKEN_BUDGET, SchemaPrompt, estimate_tokens
+from schema_index import SchemaIndex
+
+QUESTION = "total shipping cost by customer segment"
+
+
+@pytest.fixture(scope="module")
+def wide_frame():
+    rng = np.random.default_rng(0)
+    columns = {f"attribute_measure_{i:03d}": rng.random(50) for i in range(298)}
+    columns["attribute_label"] = [f"a fairly long descriptive label number {i}" for i in range(50)]
+    # The columns the question asks about come last, where a cut in column order would drop them
+    columns["Customer Segment"] = rng.choice(["Consumer", "Corporate", "Home Office"], 50)
+    columns["Shipping Cost"] = rng.random(50) * 100
+    return pd.DataFrame(columns)
+
+
+def test_wide_schema_stays_within_budget_and_keeps_the_question_columns(wide_frame):
+    summary = summarize_frame(wide_frame)
+    prompt = SchemaPrompt(list(wide_frame.columns), summary, SchemaIndex(list(wide_frame.columns), summary))
+    columns_text, summary_text = prompt.build(QUESTION)
+
+    assert estimate_tokens(columns_text) + estimate_tokens(summary_text) <= PROMPT_TOKEN_BUDGET
+    assert "more columns" in columns_text
+    for col in ("Customer Segment", "Shipping Cost"):
+        assert col in columns_text
+        assert f"- {col}: {{'type'" in summary_text
+    # The most relevant columns keep their full summary
+    assert "Home Office" in summary_text
+
+
+def test_small_schema_is_sent_whole(sales_df):
+    summary = summarize_frame(sales_df)
+    prompt = SchemaPrompt(list(sales_df.columns), summary, SchemaIndex(list(sales_df.columns), summary))
+    assert prompt.build(QUESTION) == (prompt.columns_text, prompt.summary_text)
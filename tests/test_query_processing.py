@@ -0,0 +1,45 @@
+# test_query_processing.py
+import json
+
+import pytest
+
+import sql_engines
+from query_processing import BatchPlannerAgent, FusedPlannerAgent, SQLGeneratorAgent, SQLRepairAgent
+
+
+class _RecordingLLM:
+    def __init__(self, answer: str = "SELECT 1;"):
+        self.answer = answer
+        self.prompts = []
+
+    def generate(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.answer
+
+    def generate_json(self, prompt: str, response_schema: dict) -> str:
+        self.prompts.append(prompt)
+        return json.dumps({"relevant": False, "refined_query": "", "feasible": False, "sql": "", "chart_type": "table"})
+
+
+def _prompts(sales_df):
+    llm = _RecordingLLM()
+    columns = sales_df.columns.tolist()
+    summary = {"Order Date": {"type": "datetime"}, "Sales": {"type": "numeric"}}
+    SQLGeneratorAgent(llm, columns, sales_df, "df", summary).generate_sql("monthly sales")
+    SQLRepairAgent(llm, columns, "df", summary).repair("SELECT x FROM df;", "Binder Error")
+    FusedPlannerAgent(llm, columns, "df", summary).plan("monthly sales")
+    BatchPlannerAgent(llm, columns, "df", summary).plan(["monthly sales", "sales by region"])
+    return llm.prompts
+
+
+@pytest.mark.parametrize("engine, expected, other", [
+    ("duckdb", sql_engines.DuckDBEngine.dialect_functions, "SQLite dialect"),
+    ("sqlite", sql_engines.SQLiteEngine.dialect_functions, "DuckDB dialect"),
+])
+def test_prompts_ask_for_the_configured_engines_dialect(sales_df, monkeypatch, engine, expected, other):
+    monkeypatch.setattr(sql_engines, "SQL_ENGINE", engine)
+    prompts = _prompts(sales_df)
+    assert len(prompts) == 4
+    for prompt in prompts:
+        assert expected in prompt
+        assert other not in prompt
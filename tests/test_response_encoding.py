@@ -0,0 +1,59 @@
+# test_response_encoding.py
+import gzip
+
+import pyarrow as pa
+import pytest
+from flask import Flask, request
+
+import response_encoding
+from response_encoding import ARROW_MIMETYPE, COLUMNAR_MIMETYPE, encode_response, loads_json
+
+app = Flask(__name__)
+MAPPING = {"name": "Region", "value1": "Sales"}
+
+
+@pytest.fixture
+def result_df(sales_df):
+    return sales_df.groupby("Region", as_index=False)["Sales"].sum()
+
+
+def encode(result_df, query: str = "", headers: dict = None):
+    response = {"status": "success", "summary": "ok", "data": {"type": "bar", "mapping": MAPPING}, "table": None}
+    with app.test_request_context("/query" + query, headers=headers or {}):
+        return encode_response(request, response, result_df)
+
+
+def test_records_round_trip(result_df):
+    body = loads_json(encode(result_df).get_data())
+    assert body["table"]["columns"] == ["Region", "Sales"]
+    assert body["table"]["rows"] == result_df.to_dict(orient="records")
+    assert body["data"]["data"] == [{"name": r, "value1": s} for r, s in zip(result_df["Region"], result_df["Sales"])]
+
+
+def test_columnar_round_trip(result_df):
+    flask_response = encode(result_df, "?format=columnar")
+    assert flask_response.mimetype == COLUMNAR_MIMETYPE
+    body = loads_json(flask_response.get_data())
+    assert body["table"]["data"] == result_df.to_dict(orient="list")
+    assert body["data"] == {"type": "bar", "source": "table", "mapping": MAPPING}
+
+
+def test_arrow_round_trip(result_df):
+    flask_response = encode(result_df, headers={"Accept": ARROW_MIMETYPE})
+    assert flask_response.mimetype == ARROW_MIMETYPE
+    table = pa.ipc.open_stream(flask_response.get_data()).read_all()
+    assert table.to_pandas().equals(result_df)
+    metadata = loads_json(table.schema.metadata[b"response"])
+    assert metadata["total_rows"] == len(result_df)
+    assert metadata["data"]["mapping"] == MAPPING
+
+
+def test_gzip_only_above_threshold(result_df, monkeypatch):
+    small = encode(result_df, headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers
+
+    monkeypatch.setattr(response_encoding, "COMPRESSION_MIN_BYTES", 10)
+    monkeypatch.setattr(response_encoding, "brotli", None)
+    compressed = encode(result_df, headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert loads_json(gzip.decompress(compressed.get_data())) == loads_json(small.get_data())
@@ -0,0 +1,83 @@
+import duckdb
+import pandas as pd
+import pytest
+
+import rollups
+from lru import LRUCache
+from process_sql import execute_sql_query
+from rollups import RollupSet, build_rollups
+
+PROFILE = {
+    "Order Date": {"type": "datetime"},
+    "Region": {"type": "categorical"},
+    "Sales": {"type": "numeric"},
+    "Amount": {"type": "numeric"},
+}
+
+ROLLABLE = [
+    'SELECT "Region", SUM("Sales") AS total FROM df GROUP BY "Region" ORDER BY "Region"',
+    'SELECT "Region", AVG("Amount") AS a, COUNT(*) AS n, MIN("Sales") AS lo, MAX("Sales") AS hi '
+    'FROM df GROUP BY "Region" ORDER BY 1',
+    "SELECT \"Region\", SUM(\"Sales\") AS s FROM df WHERE \"Region\" IN ('Asia', 'Europe') GROUP BY 1 ORDER BY 1",
+    "SELECT strftime(\"Order Date\", '%Y-%m') AS month, SUM(\"Sales\") AS s FROM df GROUP BY month ORDER BY month",
+    "SELECT date_trunc('quarter', \"Order Date\") AS q, COUNT(\"Amount\") AS n FROM df GROUP BY 1 ORDER BY 1",
+    'SELECT year("Order Date") AS y, SUM(df."Sales") AS s FROM df WHERE year("Order Date") = 2023 GROUP BY y',
+    'SELECT SUM("Sales") AS s, COUNT(*) AS n FROM df',
+    'SELECT "Region", SUM("Sales") AS s FROM df GROUP BY "Region" HAVING SUM("Sales") > 0 ORDER BY 2 DESC LIMIT 2',
+]
+
+NOT_ROLLABLE = [
+    'SELECT "Region", SUM("Sales") FROM df WHERE "Sales" > 100 GROUP BY "Region"',
+    'SELECT * FROM df LIMIT 5',
+    'SELECT "Region", "Customer", SUM("Sales") FROM df GROUP BY 1, 2',
+    'SELECT "Order Date", SUM("Sales") FROM df GROUP BY 1',
+    'SELECT "Customer", SUM("Sales") FROM df GROUP BY 1',
+    'SELECT "Region", SUM("Sales" * 2) FROM df GROUP BY 1',
+    'SELECT "Region", COUNT(DISTINCT "Customer") FROM df GROUP BY 1',
+    "SELECT date_trunc('day', \"Order Date\") AS d, SUM(\"Sales\") FROM df GROUP BY 1",
+    'WITH t AS (SELECT * FROM df) SELECT "Region", SUM("Sales") FROM t GROUP BY 1',
+]
+
+
+@pytest.fixture
+def rollup_set(sales_df):
+    return RollupSet(build_rollups(sales_df, sales_df, PROFILE))
+
+
+def _full_scan(df, sql_query):
+    con = duckdb.connect()
+    con.register("df", df)
+    return con.execute(sql_query).df()
+
+
+def _assert_same(expected, got):
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), got.reset_index(drop=True),
+                                  check_dtype=False, rtol=1e-9)
+
+
+def test_rollups_are_off_by_default():
+    assert rollups.ROLLUPS_ENABLED is False
+
+
+@pytest.mark.parametrize("sql_query", ROLLABLE)
+def test_rewrite_matches_full_scan(sales_df, rollup_set, sql_query):
+    rewritten = rollup_set.rewrite(sql_query)
+    assert rewritten is not None
+    con = duckdb.connect()
+    for name, table in rollup_set.tables.items():
+        con.register(name, table)
+    _assert_same(_full_scan(sales_df, sql_query), con.execute(rewritten[0]).df())
+
+
+@pytest.mark.parametrize("sql_query", NOT_ROLLABLE)
+def test_other_queries_are_not_rewritten(rollup_set, sql_query):
+    assert rollup_set.rewrite(sql_query) is None
+
+
+@pytest.mark.parametrize("sql_query", ROLLABLE + NOT_ROLLABLE[:3])
+def test_routed_queries_match_full_scan(sales_df, rollup_set, monkeypatch, sql_query):
+    monkeypatch.setattr(rollups, "_rollups", LRUCache())
+    rollups._rollups.put("rollup-test", rollup_set)
+    got = execute_sql_query(sales_df, sql_query, dataset_id="rollup-test")
+    # execute_sql_query rounds its results to two decimals
+    _assert_same(_full_scan(sales_df, sql_query).round(2), got)
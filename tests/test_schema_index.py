@@ -0,0 +1,67 @@
+# test_schema_index.py
+import pandas as pd
+import pytest
+
+from profiler import summarize_frame
+from query_processing import UserQueryCheckAgent
+from schema_index import SCHEMA_MATCH_THRESHOLD, SchemaIndex
+
+OFF_TOPIC = [
+    "no thanks",
+    "what time is it?",
+    "when is your birthday",
+    "thank you, that is the total I needed",
+    "write me a poem about the north wind",
+]
+
+
+@pytest.fixture
+def invoices():
+    df = pd.DataFrame({
+        "Invoice No": [f"INV-{i}" for i in range(40)],
+        "Order Date": pd.date_range("2024-01-01", periods=40, freq="D"),
+        "Amount": [float(i) for i in range(40)],
+        "Region": ["North", "South", "East", "West"] * 10,
+    })
+    profile = summarize_frame(df)
+    return df, profile, SchemaIndex(df.columns.tolist(), profile)
+
+
+class _RecordingLLM:
+    def __init__(self, answer: str):
+        self.answer = answer
+        self.prompts = []
+
+    def generate(self, prompt: str) -> str:
+        self.prompts.append(prompt)
+        return self.answer
+
+
+@pytest.mark.parametrize("message", OFF_TOPIC)
+def test_off_topic_messages_are_not_accepted_locally(invoices, message):
+    _, _, index = invoices
+    confidence, _ = index.match(message)
+    assert confidence < SCHEMA_MATCH_THRESHOLD
+
+
+@pytest.mark.parametrize("message", OFF_TOPIC)
+def test_off_topic_messages_go_to_the_model(invoices, message):
+    df, profile, index = invoices
+    llm = _RecordingLLM("False")
+    agent = UserQueryCheckAgent(df, df.columns.tolist(), llm=llm, dataset_profile=profile, schema_index=index)
+    # Either rejected outright (nothing but stopwords) or left to the model, never accepted locally
+    assert agent.is_valid_query(message) is False
+
+
+@pytest.mark.parametrize("question", [
+    "total amount by region",
+    "how many invoices in the north region?",
+    "average amount per month of order date",
+    "show amount for invoice no INV-3",
+])
+def test_data_questions_are_accepted_locally(invoices, question):
+    df, profile, index = invoices
+    llm = _RecordingLLM("False")
+    agent = UserQueryCheckAgent(df, df.columns.tolist(), llm=llm, dataset_profile=profile, schema_index=index)
+    assert agent.is_valid_query(question) is True
+    assert llm.prompts == []
@@ -0,0 +1,32 @@
+import pandas as pd
+
+import sessions
+from dataset_cache import frame_nbytes
+from sessions import SessionStore
+
+
+def _frames(monkeypatch, frames):
+    monkeypatch.setattr(sessions, "load_source", lambda file_url: (file_url, frames[file_url], frames[file_url]))
+
+
+def test_sessions_are_bounded_by_bytes(monkeypatch):
+    frames = {f"data{i}.csv": pd.DataFrame({"Region": ["Asia"] * 1000, "Sales": range(1000)}) for i in range(3)}
+    _frames(monkeypatch, frames)
+    store = SessionStore(max_bytes=frame_nbytes(frames["data0.csv"]) * 2)
+
+    created = [store.create(file_url) for file_url in frames]
+    assert store.get(created[0].session_id) is None
+    assert store.get(created[2].session_id) is not None
+    stats = store.stats()
+    assert stats["active"] == 2 and stats["evictions"] == 1
+    assert stats["bytes"] == created[1].nbytes + created[2].nbytes
+
+    store.close(created[1].session_id)
+    assert store.stats()["bytes"] == created[2].nbytes
+
+
+def test_newest_session_is_kept_over_budget(monkeypatch):
+    _frames(monkeypatch, {"big.csv": pd.DataFrame({"Sales": range(1000)})})
+    store = SessionStore(max_bytes=1)
+    session = store.create("big.csv")
+    assert store.get(session.session_id) is session
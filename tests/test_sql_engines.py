@@ -0,0 +1,34 @@
+# test_sql_engines.py
+import duckdb
+import pytest
+
+from sql_engines import DuckDBEngine
+
+
+def test_queries_use_the_given_table_name(sales_df):
+    engine = DuckDBEngine()
+    result = engine.execute(sales_df, 'SELECT COUNT(*) AS n FROM t', table_name="t", dataset_id="named")
+    assert result["n"].tolist() == [len(sales_df)]
+    # Reused connection: the registration is visible to every new cursor
+    result = engine.execute(sales_df, 'SELECT MAX("Sales") AS m FROM t', table_name="t", dataset_id="named")
+    assert result["m"].tolist() == [sales_df["Sales"].max()]
+
+
+def test_register_opens_the_connection_ahead_of_queries(sales_df):
+    engine = DuckDBEngine()
+    engine.register("registered", sales_df)
+    result = engine.execute(sales_df.head(0), 'SELECT COUNT(*) AS n FROM df', dataset_id="registered")
+    # The registered frame is queried, not the one passed with the query
+    assert result["n"].tolist() == [len(sales_df)]
+
+
+def test_released_and_evicted_connections_are_closed(sales_df):
+    engine = DuckDBEngine(max_datasets=1)
+    engine.register("first", sales_df)
+    first = engine._connections.get(("first", "df"))[0]
+    engine.register("second", sales_df)
+    second = engine._connections.get(("second", "df"))[0]
+    engine.release("second")
+    for con in (first, second):
+        with pytest.raises(duckdb.ConnectionException):
+            con.execute("SELECT 1")
@@ -0,0 +1,75 @@
+# test_sql_guard.py
+import duckdb
+import pandas as pd
+import pytest
+
+from process_sql import execute_sql_query
+from sql_engines import DuckDBEngine, FileScan
+from sql_guard import SQLGuardError, check_statement, with_row_limit
+
+
+@pytest.fixture
+def secret_file(tmp_path):
+    path = tmp_path / "secret.csv"
+    path.write_text("password\nhunter2\n")
+    return str(path)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM '{path}'",
+    "SELECT * FROM read_csv('{path}')",
+    "SELECT * FROM df JOIN '{path}' ON true",
+    "SELECT (SELECT max(password) FROM '{path}') FROM df",
+    "SELECT * FROM other_table",
+    "SELECT * FROM other_db.main.df",
+])
+def test_only_the_dataset_table_can_be_read(sql, secret_file):
+    with pytest.raises(SQLGuardError) as error:
+        check_statement(sql.format(path=secret_file))
+    assert error.value.kind == "read_only"
+
+
+def test_dataset_table_and_ctes_are_allowed():
+    sql = "WITH totals AS (SELECT region, SUM(sales) AS s FROM df GROUP BY region) SELECT * FROM totals;"
+    assert check_statement(sql) == sql.rstrip(";")
+    assert check_statement("SELECT * FROM t", allowed_tables=("t",)) == "SELECT * FROM t"
+
+
+def test_file_path_in_from_returns_no_rows(secret_file, sales_df):
+    assert execute_sql_query(sales_df, f"SELECT * FROM '{secret_file}';") is None
+
+
+def test_connections_do_not_scan_python_variables_or_files(secret_file, sales_df):
+    engine = DuckDBEngine()
+    other_frame = pd.DataFrame({"password": ["hunter2"]})  # noqa: F841 -- would be found by a replacement scan
+    with pytest.raises(duckdb.CatalogException):
+        engine.execute(sales_df, "SELECT * FROM other_frame", table_name="t", dataset_id="guard")
+    with pytest.raises(duckdb.PermissionException):
+        engine.execute(sales_df, f"SELECT * FROM read_csv('{secret_file}')", table_name="t", dataset_id="guard")
+    assert len(engine.execute(sales_df, "SELECT * FROM t", table_name="t", dataset_id="guard")) == len(sales_df)
+
+
+def test_file_scans_still_read_their_own_file(tmp_path, secret_file):
+    path = tmp_path / "data.csv"
+    path.write_text("a,b\n1,2\n3,4\n")
+    engine = DuckDBEngine()
+    scan = FileScan(str(path))
+    assert engine.execute(scan, "SELECT SUM(a) AS a FROM df", dataset_id="scan")["a"].tolist() == [4]
+    with pytest.raises(duckdb.PermissionException):
+        engine.execute(scan, f"SELECT * FROM read_csv('{secret_file}')", dataset_id="scan")
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM df -- all rows",
+    "SELECT * FROM df; -- all rows",
+    "SELECT * FROM df /* all rows */",
+])
+def test_row_limit_survives_trailing_comments(sql):
+    statement, injected = with_row_limit(check_statement(sql), limit=10)
+    assert injected
+    assert statement.endswith("LIMIT 11")
+
+
+def test_comment_markers_inside_strings_are_kept():
+    statement = check_statement("SELECT '--not a comment' AS a FROM df")
+    assert statement == "SELECT '--not a comment' AS a FROM df"
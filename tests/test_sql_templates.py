@@ -0,0 +1,43 @@
+# test_sql_templates.py
+import pytest
+
+from profiler import summarize_frame
+from schema_index import SchemaIndex
+from sql_templates import SQLTemplateCompiler
+
+
+@pytest.fixture
+def compiler(sales_df):
+    profile = summarize_frame(sales_df)
+    return SQLTemplateCompiler(profile, SchemaIndex(sales_df.columns.tolist(), profile))
+
+
+@pytest.mark.parametrize("question", [
+    "total sales by region",
+    "What is the average sales per region?",
+    "top 5 customers by sales",
+    "total sales by month",
+    "how many rows where region is europe",
+])
+def test_plain_questions_compile(compiler, question):
+    assert compiler.compile(question) is not None
+
+
+@pytest.mark.parametrize("question", [
+    "total sales in europe by month",
+    "what is the total sales by region in 2023",
+    "average sales per region excluding asia",
+    "top 5 customers by sales last year",
+    "total sales by region for europe",
+    "total sales of europe by region",
+])
+def test_qualified_questions_fall_back_to_agents(compiler, question):
+    assert compiler.compile(question) is None
+
+
+def test_compiled_sql_groups_by_resolved_columns(compiler):
+    compiled = compiler.compile("total sales by region")
+    assert compiled["SQL"] == (
+        'SELECT "Region", SUM("Sales") AS "total_sales" FROM df GROUP BY "Region" ORDER BY "total_sales" DESC;'
+    )
+    assert compiled["params"] == []
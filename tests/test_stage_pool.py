@@ -0,0 +1,49 @@
+# test_stage_pool.py
+import threading
+import time
+
+import stage_pool
+from stage_pool import PIPELINE_WORKERS, result_or_default, submit
+
+
+def _fill_pool(seconds: float):
+    release = threading.Event()
+    blockers = [submit(release.wait, seconds) for _ in range(PIPELINE_WORKERS)]
+    return release, blockers
+
+
+def test_time_queued_for_a_worker_does_not_count_against_the_stage():
+    release, blockers = _fill_pool(0.5)
+    threading.Timer(0.3, release.set).start()
+    assert result_or_default(submit(lambda: "answer"), "fallback", stage="test", timeout=0.1) == "answer"
+    for blocker in blockers:
+        blocker.result(5)
+
+
+def test_stage_still_queued_after_the_queue_timeout_is_dropped(monkeypatch):
+    monkeypatch.setattr(stage_pool, "STAGE_QUEUE_TIMEOUT_SECONDS", 0.1)
+    release, blockers = _fill_pool(5)
+    ran = []
+    future = submit(ran.append, "ran")
+    try:
+        assert result_or_default(future, "fallback", stage="test") == "fallback"
+        assert future.cancelled()
+    finally:
+        release.set()
+    for blocker in blockers:
+        blocker.result(5)
+    assert not ran
+
+
+def test_slow_and_failing_stages_fall_back():
+    assert result_or_default(submit(time.sleep, 0.5), "fallback", stage="test", timeout=0.05) == "fallback"
+    assert result_or_default(submit(lambda: 1 / 0), "fallback", stage="test") == "fallback"
+
+
+def test_stages_submitted_from_a_stage_run_in_its_thread():
+    def outer():
+        inner = submit(lambda: threading.current_thread().name)
+        return threading.current_thread().name, result_or_default(inner, None, stage="inner")
+
+    outer_thread, inner_thread = submit(outer).result(5)
+    assert outer_thread == inner_thread
@@ -0,0 +1,46 @@
+# test_streaming.py
+import json
+import time
+
+import pytest
+
+import integrate
+import query_processing
+from backend import app
+
+SQL = 'SELECT "Region", SUM("Sales") AS total FROM df GROUP BY "Region" ORDER BY "Region";'
+
+
+@pytest.fixture
+def slow_agents(monkeypatch, tmp_path, sales_df):
+    path = tmp_path / "sales.csv"
+    sales_df.to_csv(path, index=False)
+
+    def generate_sql(self, refined_query, history=None):
+        time.sleep(0.5)
+        return {"SQL": SQL}
+
+    monkeypatch.setattr(query_processing, "GeminiLLM", lambda api_key=None: None)
+    monkeypatch.setattr(query_processing, "compile_question", lambda *args, **kwargs: None)
+    monkeypatch.setattr(query_processing.UserQueryCheckAgent, "is_valid_query", lambda self, query, history=None: True)
+    monkeypatch.setattr(query_processing.RefineQueryAgent, "refine_query", lambda self, query, **kwargs: "sales by region")
+    monkeypatch.setattr(query_processing.SQLCheckAgent, "check_query_status", lambda self, query: {"status": True})
+    monkeypatch.setattr(query_processing.SQLGeneratorAgent, "generate_sql", generate_sql)
+    monkeypatch.setattr(integrate, "get_visualization_json", lambda *args, **kwargs: {"type": "bar"})
+    return str(path)
+
+
+def test_refined_query_is_streamed_before_the_sql_is_generated(slow_agents):
+    response = app.test_client().post("/backend/stream", buffered=False,
+                                      json={"chat_context": "what are sales per region", "file_url": slow_agents})
+    start = time.perf_counter()
+    events = []
+    for chunk in response.response:
+        for line in chunk.splitlines():
+            events.append((json.loads(line)["event"], time.perf_counter() - start))
+
+    names = [name for name, _ in events]
+    assert names == ["refined_query", "sql", "rows", "chart", "response"]
+    arrived = dict(events)
+    # The refined question does not wait for the slow SQL agent
+    assert arrived["refined_query"] < 0.4 <= arrived["sql"]
@@ -1,46 +1,73 @@
 # visualization.py
 
-from google import genai
-import pandas as pd
 import json
+from llm_cache import cached_generate
+from gemini_pool import get_client_pool
+from chart_selector import CHART_CONFIDENCE_THRESHOLD, record_decision, select_chart
+from telemetry import get_logger
 
-def get_visualization_json(api_key, query, data):
+VISUALIZATION_MODEL = "gemini-2.0-flash"
+CHART_TYPES = ["bar", "line", "pie", "scatter", "kpi", "table"]
+
+logger = get_logger("visualization")
+
+def get_visualization_json(api_key, query, data, chart_type=None, result_df=None):
     """
     Ask Gemini which visualization type fits best and return JSON for frontend.
+    A valid chart_type already suggested upstream (e.g. by the fused planner) skips the call,
+    and so does a confident rule-based choice from the shape of result_df.
     
     Returns:
         dict: {"type": "<chart_type>", "data": [...]}
     """
-    df = pd.DataFrame(data)
-    sample_data = df.head(3).to_dict(orient='records')
+    if chart_type in CHART_TYPES:
+        return {
+            "type": chart_type,
+            "data": data
+        }
+
+    if result_df is not None:
+        rule_chart_type, confidence = select_chart(result_df, query)
+        if confidence >= CHART_CONFIDENCE_THRESHOLD:
+            record_decision("rule")
+            return {
+                "type": rule_chart_type,
+                "data": data
+            }
+
+    record_decision("llm")
+    sample_data = data[:3]
+    columns = list(sample_data[0].keys()) if sample_data else []
 
     prompt = f"""
 You are a data visualization assistant.
 
 Given:
 User Query: {query}
-Data Columns: {list(df.columns)}
-Sample Data: {json.dumps(sample_data)}
+Data Columns: {columns}
+Sample Data: {json.dumps(sample_data, default=str)}
 
-Choose the best visualization type from: ["bar", "line", "pie", "scatter", "kpi", "table"].
+Choose the best visualization type from: {json.dumps(CHART_TYPES)}.
 
 Return ONLY a JSON object in this format:
 {{"visualization": "TYPE"}}
     """
 
-    client = genai.Client(api_key=api_key)
-    response = client.models.generate_content(
-        model="gemini-2.0-flash",
-        contents=prompt
-    )
+    def generate():
+        return get_client_pool(api_key).generate_content(
+            model=VISUALIZATION_MODEL,
+            contents=prompt
+        ).text
+
+    response_text = cached_generate(VISUALIZATION_MODEL, prompt, generate)
 
     try:
-        vis = json.loads(response.text)
+        vis = json.loads(response_text)
         chart_type = vis.get("visualization", "table")
     except Exception as e:
-        print("Gemini parsing error:", e)
-        print("Response text:", response.text)
-        chart_type = "table"
+        logger.warning("Gemini parsing error: %s; response text: %r", e, response_text)
+        # Marked so the caller does not cache a result under a chart type nobody chose
+        return {"type": "table", "data": data, "fallback": True}
 
     # Return JSON-ready object for frontend
     return {